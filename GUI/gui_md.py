@@ -54,6 +54,7 @@ from Geometry.pose import to_pose, Pose
 from Geometry.rotation import from_degrees
 from Trajectory.trajectory import Trajectory, mirror_trajectory
 from Trajectory.trajectory_iterator import TrajectoryIterator
+from Spline.spline_optimizer import CancellationToken, LBFGS
 
 from Util.util import limit2, epsilon_equals
 from Util.jsonIO import JsonIO
@@ -719,6 +720,12 @@ class MainApp(MDApp):
     current_time = 0
     dt = .04
 
+    # Seconds of optimization per frame, so the GUI stays responsive (L-BFGS steps are cheaper than gradient descent steps)
+    optimization_budget = .02
+    optimization_event = None
+    optimization_token = CancellationToken()
+    optimization_trajectory = None
+
     s = 4.7
     origin = ListProperty([500,500])
     angle = NumericProperty(0)
@@ -845,12 +852,31 @@ class MainApp(MDApp):
         self.screen.ids.content_drawer.ids.md_list.children[length - self.get_current_index()].text = instance.text
 
     def optimize_trajectory(self):
-        """Callback for optimizing current trajectory"""
-        self.current_trajectory.optimize_splines()
+        """Callback for optimizing current trajectory: optimizes a little each frame"""
+        if self.optimization_event is not None:
+            return
 
-        self.update_stats()
-        # Update points to match optimization
-        self.update_points()
+        self.optimization_token = CancellationToken()
+        self.optimization_trajectory = self.current_trajectory
+        self.optimization_event = Clock.schedule_interval(self.update_optimization, 0)
+
+    def update_optimization(self, dt):
+        """Periodically called to continue optimizing and show the best splines so far"""
+        if self.optimization_token.is_cancelled() or self.optimization_trajectory is not self.current_trajectory:
+            self.optimization_event = None
+            return False
+
+        points = self.current_trajectory.points
+        done = self.current_trajectory.optimize_splines(LBFGS, budget=self.optimization_budget, token=self.optimization_token)
+
+        # Update points to match optimization (only re-parameterized every few frames)
+        if self.current_trajectory.points is not points:
+            self.update_stats()
+            self.update_points()
+
+        if done:
+            self.optimization_event = None
+            return False
     
     def mirror_trajectory(self):
         """Mirrors current Trajectory and adds it as a new trajectory"""
@@ -989,6 +1015,9 @@ class MainApp(MDApp):
         """Updates Current Trajectory"""
         self.screen.ids.content_drawer.ids.md_list.set_color_item(selected_instance)
 
+        # Stop optimizing the previous trajectory (it resumes if optimized again)
+        self.optimization_token.cancel()
+
         # Set all to False
         for t in self.trajectories:
             t.current = False
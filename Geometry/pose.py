@@ -67,6 +67,10 @@ class Pose:
         """Returns self transformed by other"""
         return Pose(self.translation.translate(other.translation.rotate(self.rotation)), self.rotation.rotate(other.rotation), self.curvature, self.dCurvature)
 
+    def copy(self):
+        """Returns a copy of self that shares no Translation or Rotation with it"""
+        return Pose(Translation(self.translation.x, self.translation.y), Rotation(self.rotation.cos_angle, self.rotation.sin_angle), self.curvature, self.dCurvature)
+
     def inverse(self):
         """Returns the inverse of self"""
         tmp_rot = self.rotation.inverse()
@@ -0,0 +1,184 @@
+"""CS 108 Trajectory Visualization Project
+
+Columnar container of trajectory states: one contiguous array per field instead of a TrajectoryPoint, Pose,
+Translation and Rotation object per sample
+
+Inspired by:
+https://docs.python.org/3/library/array.html
+
+@author: Matthew Walstra (mjw64)
+@date: Fall, 2020
+"""
+
+from array import array
+
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+#https://chrisyeh96.github.io/2017/08/08/definitive-guide-python-imports.html
+# Number of os.path.dirname dependent on number of subfolders: goes up 1 directory each time
+# Uncomment top line if you want to use the run button in the top right
+# F5 works because of adding Trajectory_Visualization directory to PYTHONPATH in .env file
+
+from Geometry.pose import Pose
+from Geometry.rotation import Rotation
+from Geometry.translation import Translation
+from Geometry.trajectory_point import TrajectoryPoint
+
+COLUMNS = ("x", "y", "cos", "sin", "curvature", "dCurvature", "distance", "t", "velocity", "acceleration")
+
+def to_trajectory_points(points):
+    """Returns TrajectoryPoints with the same states as a list of TrajectoryPoints"""
+    rv = TrajectoryPoints()
+    rv.extend(points)
+    return rv
+
+class TrajectoryPoints:
+    """Columnar list of trajectory states (indexing returns a TrajectoryPointView of the columns)"""
+
+    def __init__(self):
+        """Constructs an empty TrajectoryPoints object"""
+        for name in COLUMNS:
+            setattr(self, name, array('d'))
+
+    def append_pose(self, pose, time=0.0, velocity=0.0, acceleration=0.0, distance=0.0):
+        """Adds a state from a Pose (the Pose isn't kept)"""
+        self.x.append(pose.translation.x)
+        self.y.append(pose.translation.y)
+        self.cos.append(pose.rotation.cos_angle)
+        self.sin.append(pose.rotation.sin_angle)
+        self.curvature.append(pose.curvature)
+        self.dCurvature.append(pose.dCurvature)
+        self.distance.append(distance)
+        self.t.append(time)
+        self.velocity.append(velocity)
+        self.acceleration.append(acceleration)
+
+    def append(self, point):
+        """Adds a state from a TrajectoryPoint"""
+        self.append_pose(point.pose, point.t, point.velocity, point.acceleration, point.distance)
+
+    def extend(self, points):
+        """Adds states from a list of TrajectoryPoints or another TrajectoryPoints"""
+        if isinstance(points, TrajectoryPoints):
+            for name in COLUMNS:
+                getattr(self, name).extend(getattr(points, name))
+            return
+        for p in points:
+            self.append(p)
+
+    def get_pose(self, index):
+        """Returns a new Pose for the state at index"""
+        return Pose(Translation(self.x[index], self.y[index]), Rotation(self.cos[index], self.sin[index]), self.curvature[index], self.dCurvature[index])
+
+    def to_list(self):
+        """Returns a list of new TrajectoryPoints with the same states"""
+        return [TrajectoryPoint(self.get_pose(i), self.t[i], self.velocity[i], self.acceleration[i], i, i, self.distance[i]) for i in range(len(self))]
+
+    def get_size(self):
+        """Returns the bytes used by the columns"""
+        return sum([sys.getsizeof(getattr(self, name)) for name in COLUMNS])
+
+    def __len__(self):
+        """Returns the number of states"""
+        return len(self.x)
+
+    def __getitem__(self, index):
+        """Returns a TrajectoryPointView of the state at index (or a list of them for a slice)"""
+        if isinstance(index, slice):
+            return [TrajectoryPointView(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("TrajectoryPoints index out of range")
+        return TrajectoryPointView(self, index)
+
+    def __iter__(self):
+        """Returns an iterator of TrajectoryPointViews"""
+        for i in range(len(self)):
+            yield TrajectoryPointView(self, i)
+
+class TrajectoryPointView(TrajectoryPoint):
+    """TrajectoryPoint that reads and writes a state of TrajectoryPoints
+
+    Setting pose writes the columns, but changing the returned Pose in place doesn't
+    """
+
+    def __init__(self, points, index):
+        """Constructs a TrajectoryPointView of points at index"""
+        self.points = points
+        self.index = index
+
+    @property
+    def pose(self):
+        """Returns a new Pose of the state"""
+        return self.points.get_pose(self.index)
+
+    @pose.setter
+    def pose(self, pose):
+        """Writes a Pose to the state"""
+        self.points.x[self.index] = pose.translation.x
+        self.points.y[self.index] = pose.translation.y
+        self.points.cos[self.index] = pose.rotation.cos_angle
+        self.points.sin[self.index] = pose.rotation.sin_angle
+        self.points.curvature[self.index] = pose.curvature
+        self.points.dCurvature[self.index] = pose.dCurvature
+
+    @property
+    def t(self):
+        """Returns the time of the state"""
+        return self.points.t[self.index]
+
+    @t.setter
+    def t(self, value):
+        """Sets the time of the state"""
+        self.points.t[self.index] = value
+
+    @property
+    def velocity(self):
+        """Returns the velocity of the state"""
+        return self.points.velocity[self.index]
+
+    @velocity.setter
+    def velocity(self, value):
+        """Sets the velocity of the state"""
+        self.points.velocity[self.index] = value
+
+    @property
+    def acceleration(self):
+        """Returns the acceleration of the state"""
+        return self.points.acceleration[self.index]
+
+    @acceleration.setter
+    def acceleration(self, value):
+        """Sets the acceleration of the state"""
+        self.points.acceleration[self.index] = value
+
+    @property
+    def distance(self):
+        """Returns the distance of the state"""
+        return self.points.distance[self.index]
+
+    @distance.setter
+    def distance(self, value):
+        """Sets the distance of the state"""
+        self.points.distance[self.index] = value
+
+    @property
+    def index_floor(self):
+        """Returns the index of the state"""
+        return self.index
+
+    @index_floor.setter
+    def index_floor(self, value):
+        """Ignored: always the index of the state"""
+        pass
+
+    @property
+    def index_ceil(self):
+        """Returns the index of the state"""
+        return self.index
+
+    @index_ceil.setter
+    def index_ceil(self, value):
+        """Ignored: always the index of the state"""
+        pass
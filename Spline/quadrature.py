@@ -0,0 +1,100 @@
+"""CS 108 Trajectory Visualization Project
+
+Quadrature rules (sample points and weights) for integrating over a spline's t in [0, 1]
+
+Inspired by:
+https://en.wikipedia.org/wiki/Gaussian_quadrature#Gauss%E2%80%93Legendre_quadrature
+Numerical Recipes (3rd ed.), 4.6.1 (gauleg)
+
+@author: Matthew Walstra (mjw64)
+@date: Fall, 2020
+"""
+
+import math
+
+# Cached quadrature rules, keyed by (kind, order, panels)
+QUADRATURES = {}
+
+RIEMANN = "riemann"
+GAUSS_LEGENDRE = "gauss_legendre"
+
+def riemann_quadrature(samples):
+    """Returns a cached left Riemann sum Quadrature with the given number of samples"""
+    key = (RIEMANN, 1, samples)
+    if key not in QUADRATURES:
+        dt = 1.0 / samples
+        QUADRATURES[key] = Quadrature(RIEMANN, 1, samples, [i * dt for i in range(samples)], [dt] * samples)
+    return QUADRATURES[key]
+
+def gauss_legendre_quadrature(order, panels=1):
+    """Returns a cached composite Gauss-Legendre Quadrature: panels equal intervals with order nodes each"""
+    key = (GAUSS_LEGENDRE, order, panels)
+    if key not in QUADRATURES:
+        nodes, weights = get_gauss_legendre_nodes(order)
+        width = 1.0 / panels
+        ts = []
+        ws = []
+        for p in range(panels):
+            for x, w in zip(nodes, weights):
+                ts.append((p + .5 * (x + 1.0)) * width)
+                ws.append(.5 * w * width)
+        QUADRATURES[key] = Quadrature(GAUSS_LEGENDRE, order, panels, ts, ws)
+    return QUADRATURES[key]
+
+def get_gauss_legendre_nodes(order):
+    """Returns (nodes, weights) of the Gauss-Legendre rule on [-1, 1]"""
+    if order < 1:
+        raise ValueError("Gauss-Legendre order must be at least 1.")
+
+    nodes = [0.0] * order
+    weights = [0.0] * order
+    for i in range((order + 1) // 2):
+        # Initial guess for the i-th root, refined with Newton's method
+        x = math.cos(math.pi * (i + .75) / (order + .5))
+        for iteration in range(100):
+            p0, p1 = 1.0, x
+            for k in range(2, order + 1):
+                p0, p1 = p1, ((2 * k - 1) * x * p1 - (k - 1) * p0) / k
+            dp = order * (x * p1 - p0) / (x * x - 1.0)
+            dx = p1 / dp
+            x -= dx
+            if abs(dx) < 1E-15:
+                break
+
+        # Recompute the derivative at the converged root for the weight
+        p0, p1 = 1.0, x
+        for k in range(2, order + 1):
+            p0, p1 = p1, ((2 * k - 1) * x * p1 - (k - 1) * p0) / k
+        dp = order * (x * p1 - p0) / (x * x - 1.0)
+
+        nodes[i] = -x
+        nodes[order - 1 - i] = x
+        weights[i] = weights[order - 1 - i] = 2.0 / ((1.0 - x * x) * dp * dp)
+    return nodes, weights
+
+class Quadrature:
+    """Sample points and weights over t in [0, 1], with the powers of t each spline evaluation needs"""
+
+    def __init__(self, kind, order, panels, ts, weights):
+        """Constructs a Quadrature object"""
+        self.kind = kind
+        self.order = order
+        self.panels = panels
+        self.samples = len(ts)
+        self.ts = ts
+        self.weights = weights
+
+        # Powers of t shared by every spline evaluated with this rule
+        self.t2 = [t * t for t in ts]
+        self.t3 = [a * b for a, b in zip(ts, self.t2)]
+        self.t4 = [t * t for t in self.t2]
+
+    def refine(self):
+        """Returns the same rule with twice as many panels (used for error estimates)"""
+        if self.kind == RIEMANN:
+            return riemann_quadrature(2 * self.samples)
+        return gauss_legendre_quadrature(self.order, 2 * self.panels)
+
+    def __str__(self):
+        """Returns Quadrature as a string"""
+        return "{}, order {}, {} panels, {} samples".format(self.kind, self.order, self.panels, self.samples)
@@ -11,24 +11,50 @@ https://github.com/SCsailors/2020RobotCode/blob/master/src/main/cpp/lib/Splines/
 """
 
 import math
+from array import array
+from bisect import bisect_right
 
 from Geometry.pose import Pose, to_pose
 from Geometry.rotation import Rotation, from_degrees
 from Geometry.translation import Translation
 
-from Util.util import epsilon_equals
+from Spline.quadrature import riemann_quadrature, gauss_legendre_quadrature, get_gauss_legendre_nodes
+
+from Util.util import epsilon_equals, EPSILON as ZERO_EPSILON
 
 MAXITERATIONS = 100
 EPSILON = 1E-5
 STEPSIZE = 1.0
 MINDELTA = .001
+GAUSSORDER = 8 # nodes per interval for adaptive integration
+
+# Modes for choosing the interior second derivatives (knots) in create_quintic_splines
+ZERO_KNOTS = "zero"
+SMOOTH_KNOTS = "smooth"
+SMOOTHDAMPING = .05 # fraction of each knot's curvature added to the diagonal of the smooth solve (best on the saved library: Test/benchmark.py smooth_knots)
+
+ARCLENGTHPANELS = 16 # panels of the cumulative arc length table
+ARCLENGTHORDER = 8 # Gauss-Legendre nodes per panel
+ARCLENGTHTOLERANCE = 1E-9 # inches
+ARCLENGTHITERATIONS = 20
 
-def create_quintic_splines(poses):
-    """Helper function that returns a list of QuinticHermiteSplines"""
+# Hermite basis derivative columns for the analytic gradient, keyed by quadrature
+GRADIENT_BASES = {}
+
+def create_quintic_splines(poses, mode=ZERO_KNOTS):
+    """Helper function that returns a list of QuinticHermiteSplines
+
+    mode ZERO_KNOTS leaves every second derivative at 0, SMOOTH_KNOTS picks the interior ones with solve_smooth_knots
+    """
     splines = []
     for i in range(len(poses) - 1):
         splines.append(create_quintic_spline(poses[i], poses[i + 1]))
 
+    if mode == SMOOTH_KNOTS:
+        solve_smooth_knots(splines)
+    elif mode != ZERO_KNOTS:
+        raise ValueError("Unknown spline mode: {}".format(mode))
+
     return splines
 
 def create_quintic_spline(p0=Pose(), p1=Pose()):
@@ -37,22 +63,149 @@ def create_quintic_spline(p0=Pose(), p1=Pose()):
     return QuinticHermiteSpline(p0.translation.x, p1.translation.x, p0.rotation.cos_angle * scale, p1.rotation.cos_angle * scale, 0, 0, 
         p0.translation.y, p1.translation.y, p0.rotation.sin_angle * scale, p1.rotation.sin_angle * scale, 0, 0)
 
-def sum_dCurvature2(splines):
+def get_arc_lengths(splines):
+    """Returns the cumulative arc length at the start of each spline and the end of the last one (len(splines) + 1 values)"""
+    lengths = [0.0]
+    for s in splines:
+        lengths.append(lengths[-1] + s.get_arc_length())
+    return lengths
+
+def get_spline_at_distance(splines, distance, lengths=None):
+    """Returns (index, t) of the point distance along a list of splines (clamped to the ends)
+
+    lengths is from get_arc_lengths, so repeated queries are O(log n)
+    """
+    if lengths is None:
+        lengths = get_arc_lengths(splines)
+    index = min(max(bisect_right(lengths, distance) - 1, 0), len(splines) - 1)
+    return index, splines[index].get_t(distance - lengths[index])
+
+def get_pose_at_distance(splines, distance, lengths=None):
+    """Returns the Pose distance along a list of splines without parameterizing them"""
+    index, t = get_spline_at_distance(splines, distance, lengths)
+    return splines[index].get_pose(t)
+
+def sum_dCurvature2(splines, cost_cache=None, quadrature=None):
     """Returns the sum of the dCurvature2 for a list of splines"""
-    total = 0.0
+    if cost_cache is not None:
+        return cost_cache.sum_dCurvature2(splines)
+
+    return sum(sum_dCurvature2_batch(splines, quadrature=quadrature))
+
+def get_quadrature(samples=None, quadrature=None):
+    """Returns quadrature, or the default left Riemann sum with samples (QuinticHermiteSpline.SAMPLES if None)"""
+    if quadrature is not None:
+        return quadrature
+    if samples is None:
+        samples = QuinticHermiteSpline.SAMPLES
+    return riemann_quadrature(samples)
+
+def sum_dCurvature2_batch(splines, samples=None, quadrature=None):
+    """Returns a list of sum_dCurvature2 for each spline, evaluating every sample over a shared basis"""
+    quadrature = get_quadrature(samples, quadrature)
+
+    costs = []
     for s in splines:
-        total += s.sum_dCurvature2()
+        costs.append(integrate_dCurvature2(s.Ax, s.Bx, s.Cx, s.Dx, s.Ex, s.Ay, s.By, s.Cy, s.Dy, s.Ey, quadrature))
+    return costs
+
+def estimate_dCurvature2(splines, quadrature=None):
+    """Returns (sum_dCurvature2, error estimate, samples per spline) of a list of splines
+
+    The error is estimated against the same rule with twice as many panels
+    """
+    quadrature = get_quadrature(quadrature=quadrature)
+    value = sum(sum_dCurvature2_batch(splines, quadrature=quadrature))
+    refined = sum(sum_dCurvature2_batch(splines, quadrature=quadrature.refine()))
+    return value, abs(refined - value), quadrature.samples
+
+def integrate_dCurvature2(Ax, Bx, Cx, Dx, Ex, Ay, By, Cy, Dy, Ey, quadrature):
+    """Returns the integral of dCurvature2 for a single set of spline coefficients using a Quadrature"""
+    total = 0.0
+    for w, d2 in zip(quadrature.weights, get_dCurvature2_samples(Ax, Bx, Cx, Dx, Ex, Ay, By, Cy, Dy, Ey, quadrature.ts, quadrature.t2, quadrature.t3, quadrature.t4)):
+        total += w * d2
     return total
 
-def optimize_spline(splines):
-    """Returns optimized dCurvature2 and optimizes """
+def integrate_dCurvature2_adaptive(spline, tolerance=MINDELTA, order=GAUSSORDER, max_depth=12):
+    """Returns (sum_dCurvature2, error estimate, samples) of a spline using adaptive Gauss-Legendre quadrature
+
+    Intervals are bisected until the halves agree with the whole to within their share of tolerance
+    """
+    nodes, weights = get_gauss_legendre_nodes(order)
+
+    def integrate(a, b):
+        ts = [a + .5 * (x + 1.0) * (b - a) for x in nodes]
+        t2 = [t * t for t in ts]
+        t3 = [t * u for t, u in zip(ts, t2)]
+        t4 = [t * t for t in t2]
+        values = get_dCurvature2_samples(spline.Ax, spline.Bx, spline.Cx, spline.Dx, spline.Ex,
+            spline.Ay, spline.By, spline.Cy, spline.Dy, spline.Ey, ts, t2, t3, t4)
+        total = 0.0
+        for w, v in zip(weights, values):
+            total += w * v
+        return .5 * (b - a) * total
+
+    value = error = 0.0
+    samples = order
+    intervals = [(0.0, 1.0, integrate(0.0, 1.0), 0)]
+    while len(intervals) > 0:
+        a, b, whole, depth = intervals.pop()
+        m = .5 * (a + b)
+        left = integrate(a, m)
+        right = integrate(m, b)
+        samples += 2 * order
+        difference = abs(left + right - whole)
+        if difference <= tolerance * (b - a) or depth >= max_depth:
+            value += left + right
+            error += difference
+        else:
+            intervals.append((a, m, left, depth + 1))
+            intervals.append((m, b, right, depth + 1))
+    return value, error, samples
+
+def get_derivative_columns(Ax, Bx, Cx, Dx, Ex, Ay, By, Cy, Dy, Ey, t1, t2, t3, t4):
+    """Returns the lists (dx, dy, ddx, ddy, dddx, dddy) at each t, given the columns of t, t^2, t^3 and t^4"""
+
+    # Derivatives of every sample at once from the polynomial coefficients
+    dx = [5 * Ax * d + 4 * Bx * c + 3 * Cx * b + 2 * Dx * a + Ex for a, b, c, d in zip(t1, t2, t3, t4)]
+    dy = [5 * Ay * d + 4 * By * c + 3 * Cy * b + 2 * Dy * a + Ey for a, b, c, d in zip(t1, t2, t3, t4)]
+    ddx = [20 * Ax * c + 12 * Bx * b + 6 * Cx * a + 2 * Dx for a, b, c in zip(t1, t2, t3)]
+    ddy = [20 * Ay * c + 12 * By * b + 6 * Cy * a + 2 * Dy for a, b, c in zip(t1, t2, t3)]
+    dddx = [60 * Ax * b + 24 * Bx * a + 6 * Cx for a, b in zip(t1, t2)]
+    dddy = [60 * Ay * b + 24 * By * a + 6 * Cy for a, b in zip(t1, t2)]
+    return dx, dy, ddx, ddy, dddx, dddy
+
+def get_dCurvature2_samples(Ax, Bx, Cx, Dx, Ex, Ay, By, Cy, Dy, Ey, t1, t2, t3, t4):
+    """Returns a list of dCurvature2 at each t, given the columns of t, t^2, t^3 and t^4"""
+    rv = []
+    for x1, y1, x2, y2, x3, y3 in zip(*get_derivative_columns(Ax, Bx, Cx, Dx, Ex, Ay, By, Cy, Dy, Ey, t1, t2, t3, t4)):
+        # dCurvature is defined as 0 where dx and dy are both 0
+        if abs(x1) <= ZERO_EPSILON and abs(y1) <= ZERO_EPSILON:
+            rv.append(0.0)
+            continue
+        w = x1 * x1 + y1 * y1
+        num = (x1 * y3 - x3 * y1) * w - 3 * (x1 * y2 - x2 * y1) * (x1 * x2 + y1 * y2)
+        rv.append(num * num / (w * w * w * w * w))
+    return rv
+
+def optimize_spline(splines, analytic_gradient=True, cost_cache=None):
+    """Returns optimized dCurvature2 and optimizes 
+
+    Pass a SplineCostCache to inspect how many spline integrations were skipped
+    """
+    if cost_cache is None:
+        cost_cache = SplineCostCache()
+
+    # Poses don't move during optimization, so collinearity only needs checking once
+    collinear = get_collinear_knots(splines)
+
     count = 0
-    prev = sum_dCurvature2(splines)
+    prev = sum_dCurvature2(splines, cost_cache)
     while (count < MAXITERATIONS):
 
         # Run optimization iteration and recalculate dCurvature2
-        run_optimization_iteration(splines)
-        current = sum_dCurvature2(splines)
+        run_optimization_iteration(splines, analytic_gradient, cost_cache, collinear)
+        current = sum_dCurvature2(splines, cost_cache)
 
         # Exit if delta is less than MINDELTA
         if ( (prev - current) < MINDELTA ):
@@ -62,110 +215,206 @@ def optimize_spline(splines):
         count += 1
     return prev
 
-def run_optimization_iteration(splines):
-    """Runs one optimization iteration on list of splines"""
-    if (len(splines) <= 1):
-        return
-    
+def get_collinear_knots(splines):
+    """Returns a list with True for each interior knot whose consecutive splines are collinear (skipped by the optimizer)"""
+    collinear = []
+    for i in range(len(splines) - 1):
+        collinear.append(splines[i].get_start_pose().is_collinear(splines[i+1].get_start_pose()) or splines[i].get_end_pose().is_collinear(splines[i+1].get_end_pose()))
+    return collinear
+
+def get_gradient(splines, analytic_gradient=True, cost_cache=None, collinear=None):
+    """Returns a list of ControlPoints containing the partial derivatives of sum_dCurvature2 at each interior knot"""
+    if collinear is None:
+        collinear = get_collinear_knots(splines)
+
     control_points = []
-    magnitude = 0.0
+    if analytic_gradient:
+        # Each spline contributes to the knot on either end of it, so only integrate once per spline
+        quadrature = None if cost_cache is None else cost_cache.quadrature
+        partials = [None] * len(splines)
+        for i in range(len(splines)):
+            if (i > 0 and not collinear[i - 1]) or (i < len(splines) - 1 and not collinear[i]):
+                partials[i] = splines[i].sum_dCurvature2_gradient(quadrature)
+    elif cost_cache is None:
+        cost_cache = SplineCostCache()
 
     for i in range(len(splines) - 1):
+        control_points.append(ControlPoint())
 
-        if (splines[i].get_start_pose().is_collinear(splines[i+1].get_start_pose())) or (splines[i].get_end_pose().is_collinear(splines[i+1].get_end_pose())):
+        if collinear[i]:
             # Skip optimization if consecutive splines are collinear
             continue
 
-        original = sum_dCurvature2(splines)
-        tmp1 = splines[i]
-        tmp2 = splines[i+1]
+        if analytic_gradient:
+            # Knot i is the end of splines[i] and the start of splines[i + 1]
+            control_points[i].ddx = partials[i][1] + partials[i + 1][0]
+            control_points[i].ddy = partials[i][3] + partials[i + 1][2]
+            continue
 
-        control_points.append(ControlPoint())
+        # Perturbing knot i only changes splines[i] and splines[i + 1], so the rest of the path cancels out
+        original = cost_cache.get_cost(i, splines[i]) + cost_cache.get_cost(i + 1, splines[i + 1])
 
-        # Calculate partial derivatives of sum_dCurvature2
+        # Calculate partial derivatives of sum_dCurvature2 by finite differences, perturbing the splines in place
         # Partial x
-        splines[i] = QuinticHermiteSpline(tmp1.x0, tmp1.x1, tmp1.dx0, tmp1.dx1, tmp1.ddx0, tmp1.ddx1 + EPSILON, tmp1.y0, tmp1.y1, tmp1.dy0, tmp1.dy1, tmp1.ddy0, tmp1.ddy1)
-        splines[i + 1] = QuinticHermiteSpline(tmp2.x0, tmp2.x1, tmp2.dx0, tmp2.dx1, tmp2.ddx0 + EPSILON, tmp2.ddx1, tmp2.y0, tmp2.y1, tmp2.dy0, tmp2.dy1, tmp2.ddy0, tmp2.ddy1)
-        control_points[i].ddx = (sum_dCurvature2(splines) - original) / EPSILON
+        ddx = splines[i].ddx1
+        set_knot(splines, i, ddx + EPSILON, splines[i].ddy1)
+        control_points[i].ddx = (cost_cache.get_local_cost(splines, i) - original) / EPSILON
+        set_knot(splines, i, ddx, splines[i].ddy1)
 
         # Partial y
-        splines[i] = QuinticHermiteSpline(tmp1.x0, tmp1.x1, tmp1.dx0, tmp1.dx1, tmp1.ddx0, tmp1.ddx1, tmp1.y0, tmp1.y1, tmp1.dy0, tmp1.dy1, tmp1.ddy0, tmp1.ddy1 + EPSILON)
-        splines[i + 1] = QuinticHermiteSpline(tmp2.x0, tmp2.x1, tmp2.dx0, tmp2.dx1, tmp2.ddx0, tmp2.ddx1, tmp2.y0, tmp2.y1, tmp2.dy0, tmp2.dy1, tmp2.ddy0 + EPSILON, tmp2.ddy1)
-        control_points[i].ddy = (sum_dCurvature2(splines) - original) / EPSILON
-
-        # Reset splines
-        splines[i] = tmp1
-        splines[i+1] = tmp2
-        magnitude += control_points[i].ddx * control_points[i].ddx + control_points[i].ddy * control_points[i].ddy
-    
-    magnitude = math.sqrt(magnitude)
-
-    # Minimize along the direction of the gradient by calculating 3 points along it.
-    p2 = Translation(0, sum_dCurvature2(splines)) # Middle point is the current location
-
+        ddy = splines[i].ddy1
+        set_knot(splines, i, splines[i].ddx1, ddy + EPSILON)
+        control_points[i].ddy = (cost_cache.get_local_cost(splines, i) - original) / EPSILON
+        set_knot(splines, i, splines[i].ddx1, ddy)
+
+    return control_points
+
+def set_knot(splines, index, ddx, ddy):
+    """Mutator for the second derivatives at interior knot index (the end of splines[index] and start of splines[index + 1])"""
+    splines[index].ddx1 = splines[index + 1].ddx0 = ddx
+    splines[index].ddy1 = splines[index + 1].ddy0 = ddy
+    splines[index].compute_coefficients()
+    splines[index + 1].compute_coefficients()
+
+def move_knots(splines, collinear, control_points, scale):
+    """Moves each interior knot that isn't collinear by scale times its ControlPoint, in place"""
     for i in range(len(splines) - 1):
-        if (splines[i].get_start_pose().is_collinear(splines[i+1].get_start_pose())) or (splines[i].get_end_pose().is_collinear(splines[i+1].get_end_pose())):
-            # Skip optimization if consecutive splines are collinear
+        if collinear[i]:
             continue
 
-        # Normalize to step size
-        control_points[i].ddx *= STEPSIZE / magnitude
-        control_points[i].ddy *= STEPSIZE / magnitude
+        splines[i].ddx1 += scale * control_points[i].ddx
+        splines[i].ddy1 += scale * control_points[i].ddy
 
-        # Move opposite the gradient by STEPSIZE
-        splines[i].ddx1 -= control_points[i].ddx
-        splines[i].ddy1 -= control_points[i].ddy
+        splines[i + 1].ddx0 += scale * control_points[i].ddx
+        splines[i + 1].ddy0 += scale * control_points[i].ddy
 
-        splines[i + 1].ddx0 -= control_points[i].ddx
-        splines[i + 1].ddy0 -= control_points[i].ddy
+    # Recompute spline coefficients to account for new 2nd derivatives (once per spline, even if both knots moved)
+    for i in range(len(splines)):
+        if (i > 0 and not collinear[i - 1]) or (i < len(splines) - 1 and not collinear[i]):
+            splines[i].compute_coefficients()
 
-        # Recompute spline coefficients to account for new 2nd derivatives
-        splines[i].compute_coefficients()
-        splines[i + 1].compute_coefficients()
+def run_optimization_iteration(splines, analytic_gradient=True, cost_cache=None, collinear=None):
+    """Runs one optimization iteration on list of splines (collinear is from get_collinear_knots)"""
+    if (len(splines) <= 1):
+        return
     
-    p1 = Translation(-STEPSIZE, sum_dCurvature2(splines))
+    if cost_cache is None:
+        cost_cache = SplineCostCache()
+    if collinear is None:
+        collinear = get_collinear_knots(splines)
 
-    for i in range(len(splines) - 1):
-        if (splines[i].get_start_pose().is_collinear(splines[i+1].get_start_pose())) or (splines[i].get_end_pose().is_collinear(splines[i+1].get_end_pose())):
-            # Skip optimization if consecutive splines are collinear
-            continue
+    control_points = get_gradient(splines, analytic_gradient, cost_cache, collinear)
+    magnitude = 0.0
 
-        # Move in direction of the gradient by 2 * STEPSIZE (return to original position and 1 more)
-        splines[i].ddx1 += 2 * control_points[i].ddx
-        splines[i].ddy1 += 2 * control_points[i].ddy
+    for p in control_points:
+        magnitude += p.ddx * p.ddx + p.ddy * p.ddy
+    
+    magnitude = math.sqrt(magnitude)
 
-        splines[i + 1].ddx0 += 2 * control_points[i].ddx
-        splines[i + 1].ddy0 += 2 * control_points[i].ddy
+    # Already at a minimum (or every knot is collinear), so there is no direction to move in
+    if epsilon_equals(magnitude, 0):
+        return
 
-        # Recompute spline coefficients to account for new 2nd derivatives
-        splines[i].compute_coefficients()
-        splines[i + 1].compute_coefficients()
+    # Normalize to step size
+    for p in control_points:
+        p.ddx *= STEPSIZE / magnitude
+        p.ddy *= STEPSIZE / magnitude
 
-    p3 = Translation(STEPSIZE, sum_dCurvature2(splines))
+    # Minimize along the direction of the gradient by calculating 3 points along it.
+    p2 = Translation(0, sum_dCurvature2(splines, cost_cache)) # Middle point is the current location
+
+    # Move opposite the gradient by STEPSIZE
+    move_knots(splines, collinear, control_points, -1)
+    p1 = Translation(-STEPSIZE, sum_dCurvature2(splines, cost_cache))
+
+    # Move in direction of the gradient by 2 * STEPSIZE (return to original position and 1 more)
+    move_knots(splines, collinear, control_points, 2)
+    p3 = Translation(STEPSIZE, sum_dCurvature2(splines, cost_cache))
 
     step_size = fit_parabola(p1, p2, p3) # Approximate step size to minimize sum_dCurvature2 along the grandient
 
-    for i in range(len(splines) - 1):
-        if (splines[i].get_start_pose().is_collinear(splines[i+1].get_start_pose())) or (splines[i].get_end_pose().is_collinear(splines[i+1].get_end_pose())):
-            # Skip optimization if consecutive splines are collinear
-            continue
+    # Normalize to step size (+1 to offset for the final transformation to find p3)
+    move_knots(splines, collinear, control_points, 1 + step_size / STEPSIZE)
 
-        # Normalize to step size (+1 to offset for the final transformation to find p3)
-        control_points[i].ddx *= 1 + step_size / STEPSIZE
-        control_points[i].ddy *= 1 + step_size / STEPSIZE
+def solve_smooth_knots(splines, quadrature=None, damping=SMOOTHDAMPING):
+    """Moves the interior knots of a list of splines by one damped Gauss-Newton step on sum_dCurvature2
 
-        splines[i].ddx1 += control_points[i].ddx
-        splines[i].ddy1 += control_points[i].ddy
+    dCurvature is linearized in the knots, so minimizing the quadratic model is one block tridiagonal (2x2 blocks) solve in O(n).
+    Collinear knots stay where they are, like optimize_spline.
+    """
+    if len(splines) <= 1:
+        return
+    if quadrature is None:
+        quadrature = gauss_legendre_quadrature(GAUSSORDER, 4)
 
-        splines[i + 1].ddx0 += control_points[i].ddx
-        splines[i + 1].ddy0 += control_points[i].ddy
+    collinear = get_collinear_knots(splines)
+    normals = [integrate_dCurvature_normal(s.Ax, s.Bx, s.Cx, s.Dx, s.Ex, s.Ay, s.By, s.Cy, s.Dy, s.Ey, quadrature) for s in splines]
 
-        # Recompute spline coefficients to account for new 2nd derivatives
-        splines[i].compute_coefficients()
-        splines[i + 1].compute_coefficients()
+    # Knot i is the end (ddx1, ddy1: 1, 3) of spline i and the start (ddx0, ddy0: 0, 2) of spline i + 1
+    lower, diagonal, upper, rhs = [], [], [], []
+    for i in range(len(splines) - 1):
+        (A0, b0), (A1, b1) = normals[i], normals[i + 1]
+        d = (A0[1][1] + A1[0][0], A0[1][3] + A1[0][2], A0[3][1] + A1[2][0], A0[3][3] + A1[2][2])
+        ridge = damping * (d[0] + d[3])
+
+        # The entries scale with the path size, so a knot without any curvature change to balance is fixed instead
+        if collinear[i] or ridge <= 0:
+            lower.append((0.0, 0.0, 0.0, 0.0))
+            diagonal.append((1.0, 0.0, 0.0, 1.0))
+            upper.append((0.0, 0.0, 0.0, 0.0))
+            rhs.append((0.0, 0.0))
+            continue
 
+        diagonal.append((d[0] + ridge, d[1], d[2], d[3] + ridge))
+        # Fixed neighbors solve to 0, so coupling to them has no effect
+        lower.append((A0[1][0], A0[1][2], A0[3][0], A0[3][2]))
+        upper.append((A1[0][1], A1[0][3], A1[2][1], A1[2][3]))
+        rhs.append((-(b0[1] + b1[0]), -(b0[3] + b1[2])))
 
+    for i, (ddx, ddy) in enumerate(solve_block_tridiagonal(lower, diagonal, upper, rhs)):
+        splines[i].ddx1 += ddx
+        splines[i].ddy1 += ddy
+        splines[i + 1].ddx0 += ddx
+        splines[i + 1].ddy0 += ddy
 
+    for s in splines:
+        s.compute_coefficients()
+
+def solve_block_tridiagonal(lower, diagonal, upper, rhs):
+    """Returns the solution of a block tridiagonal system with 2x2 blocks (a, b, c, d) and 2 vector right hand sides (block Thomas algorithm)"""
+    n = len(diagonal)
+    c_prime = [None] * n
+    d_prime = [None] * n
+    for i in range(n):
+        a, b, c, d = diagonal[i]
+        r0, r1 = rhs[i]
+        if i > 0:
+            # Eliminate the lower block: M = D - L * C', r = r - L * d'
+            l0, l1, l2, l3 = lower[i]
+            p0, p1, p2, p3 = c_prime[i - 1]
+            a, b, c, d = a - l0 * p0 - l1 * p2, b - l0 * p1 - l1 * p3, c - l2 * p0 - l3 * p2, d - l2 * p1 - l3 * p3
+            q0, q1 = d_prime[i - 1]
+            r0, r1 = r0 - l0 * q0 - l1 * q1, r1 - l2 * q0 - l3 * q1
+
+        determinant = a * d - b * c
+        # Not epsilon_equals: the entries of the smooth solve are tiny for long splines
+        if determinant == 0:
+            raise ValueError("Singular block tridiagonal system")
+        a, b, c, d = d / determinant, -b / determinant, -c / determinant, a / determinant
+
+        u0, u1, u2, u3 = upper[i]
+        c_prime[i] = (a * u0 + b * u2, a * u1 + b * u3, c * u0 + d * u2, c * u1 + d * u3)
+        d_prime[i] = (a * r0 + b * r1, c * r0 + d * r1)
+
+    x = [None] * n
+    for i in range(n - 1, -1, -1):
+        x0, x1 = d_prime[i]
+        if i < n - 1:
+            p0, p1, p2, p3 = c_prime[i]
+            y0, y1 = x[i + 1]
+            x0, x1 = x0 - p0 * y0 - p1 * y1, x1 - p2 * y0 - p3 * y1
+        x[i] = (x0, x1)
+    return x
 
 def fit_parabola(p1, p2, p3):
     """Returns the x-coordinate of the vertex of the parabola"""
@@ -176,6 +425,98 @@ def fit_parabola(p1, p2, p3):
         return 0.0
     return -b/(2 * a)
 
+def get_curvature(dx, dy, ddx, ddy):
+    """Returns the curvature from the first and second derivatives of a spline"""
+    num = (dx * ddy - ddx * dy)
+
+    # Checks if dx(t) and dy(t) are zero to avoid ZeroDivisionError
+    if epsilon_equals(dx, 0) and epsilon_equals(dy, 0):
+        return math.inf * (-1.0 if num < 0 else 1.0)
+    
+    dx2dy2 = dx * dx + dy * dy
+    return num / (dx2dy2 * math.sqrt(dx2dy2))
+
+def get_dCurvature(dx, dy, ddx, ddy, dddx, dddy):
+    """Returns dCurvature from the first, second and third derivatives of a spline"""
+
+    # Checks if dx(t) and dy(t) are zero to avoid ZeroDivisionError
+    if epsilon_equals(dx, 0) and epsilon_equals(dy, 0):
+        return 0
+
+    dx2dy2 = dx * dx + dy * dy
+    num = (dx * dddy - dddx * dy) * dx2dy2 - 3 * (dx * ddy - ddx * dy) * (dx * ddx + dy * ddy)
+    return num / (dx2dy2 * dx2dy2 * math.sqrt(dx2dy2))
+
+def get_gradient_basis(quadrature):
+    """Returns cached columns of the hermite basis derivatives for ddx0/ddy0 (h) and ddx1/ddy1 (g) at each quadrature t"""
+    key = (quadrature.kind, quadrature.order, quadrature.panels)
+    if key not in GRADIENT_BASES:
+        ts = quadrature.ts
+        GRADIENT_BASES[key] = ([((-2.5 * t + 6) * t - 4.5) * t * t + t for t in ts], [((-10 * t + 18) * t - 9) * t + 1 for t in ts],
+            [(-30 * t + 36) * t - 9 for t in ts], [((2.5 * t - 4) * t + 1.5) * t * t for t in ts],
+            [((10 * t - 12) * t + 3) * t for t in ts], [(30 * t - 24) * t + 3 for t in ts])
+    return GRADIENT_BASES[key]
+
+def expand_dCurvature(x1, y1, x2, y2, x3, y3):
+    """Returns (num, w^2.5, P1, P2, P3, Q1, Q2, Q3) at a sample where dCurvature = num / w^2.5
+
+    Perturbing x by a basis function with derivatives (b1, b2, b3) changes num / w^2.5 by (b1 * P1 + b2 * P2 + b3 * P3) / w^2.5
+    to first order, and y by the same with Q
+    """
+    # dCurvature = (a * w - 3 * c * m) / w^2.5
+    w = x1 * x1 + y1 * y1
+    a = x1 * y3 - x3 * y1
+    c = x1 * y2 - x2 * y1
+    m = x1 * x2 + y1 * y2
+    num = a * w - 3 * c * m
+    return (num, w * w * math.sqrt(w),
+        y3 * w + 2 * a * x1 - 3 * (y2 * m + c * x2) - 5 * num * x1 / w, 3 * (y1 * m - c * x1), -y1 * w,
+        -x3 * w + 2 * a * y1 - 3 * (c * y2 - x2 * m) - 5 * num * y1 / w, -3 * (x1 * m + c * y1), x1 * w)
+
+def integrate_dCurvature2_gradient(Ax, Bx, Cx, Dx, Ex, Ay, By, Cy, Dy, Ey, quadrature):
+    """Returns the partial derivatives of the dCurvature2 integral with respect to (ddx0, ddx1, ddy0, ddy1)"""
+    columns = get_derivative_columns(Ax, Bx, Cx, Dx, Ex, Ay, By, Cy, Dy, Ey, quadrature.ts, quadrature.t2, quadrature.t3, quadrature.t4)
+
+    d_ddx0 = d_ddx1 = d_ddy0 = d_ddy1 = 0.0
+    for x1, y1, x2, y2, x3, y3, dt, h1, h2, h3, g1, g2, g3 in zip(*columns, quadrature.weights, *get_gradient_basis(quadrature)):
+        # dCurvature is defined as 0 here, so it doesn't contribute to the gradient
+        if abs(x1) <= ZERO_EPSILON and abs(y1) <= ZERO_EPSILON:
+            continue
+        num, w_2_5, P1, P2, P3, Q1, Q2, Q3 = expand_dCurvature(x1, y1, x2, y2, x3, y3)
+
+        # d(dCurvature2) = 2 * dCurvature * d(dCurvature)
+        scale = 2 * dt * num / (w_2_5 * w_2_5)
+        d_ddx0 += scale * (h1 * P1 + h2 * P2 + h3 * P3)
+        d_ddx1 += scale * (g1 * P1 + g2 * P2 + g3 * P3)
+        d_ddy0 += scale * (h1 * Q1 + h2 * Q2 + h3 * Q3)
+        d_ddy1 += scale * (g1 * Q1 + g2 * Q2 + g3 * Q3)
+
+    return d_ddx0, d_ddx1, d_ddy0, d_ddy1
+
+def integrate_dCurvature_normal(Ax, Bx, Cx, Dx, Ex, Ay, By, Cy, Dy, Ey, quadrature):
+    """Returns the Gauss-Newton normal matrix J^T J (4x4) and vector J^T dCurvature (4) of a spline over (ddx0, ddx1, ddy0, ddy1)
+
+    J holds the partials of dCurvature at each quadrature t, weighted by the quadrature
+    """
+    columns = get_derivative_columns(Ax, Bx, Cx, Dx, Ex, Ay, By, Cy, Dy, Ey, quadrature.ts, quadrature.t2, quadrature.t3, quadrature.t4)
+
+    A = [[0.0] * 4 for _ in range(4)]
+    b = [0.0] * 4
+    for x1, y1, x2, y2, x3, y3, dt, h1, h2, h3, g1, g2, g3 in zip(*columns, quadrature.weights, *get_gradient_basis(quadrature)):
+        if abs(x1) <= ZERO_EPSILON and abs(y1) <= ZERO_EPSILON:
+            continue
+        num, w_2_5, P1, P2, P3, Q1, Q2, Q3 = expand_dCurvature(x1, y1, x2, y2, x3, y3)
+
+        J = ((h1 * P1 + h2 * P2 + h3 * P3) / w_2_5, (g1 * P1 + g2 * P2 + g3 * P3) / w_2_5,
+            (h1 * Q1 + h2 * Q2 + h3 * Q3) / w_2_5, (g1 * Q1 + g2 * Q2 + g3 * Q3) / w_2_5)
+        residual = dt * num / w_2_5
+        for i in range(4):
+            b[i] += J[i] * residual
+            row = A[i]
+            for j in range(4):
+                row[j] += dt * J[i] * J[j]
+    return A, b
+
 class QuinticHermiteSpline:
     """Contains QuinticHermiteSpline"""
 
@@ -217,6 +558,17 @@ class QuinticHermiteSpline:
         self.Ey = self.dy0
         self.Fy = self.y0
 
+        # Derivative coefficients for Horner evaluation (highest power first)
+        self.dx_coefficients = (5 * self.Ax, 4 * self.Bx, 3 * self.Cx, 2 * self.Dx, self.Ex)
+        self.dy_coefficients = (5 * self.Ay, 4 * self.By, 3 * self.Cy, 2 * self.Dy, self.Ey)
+        self.ddx_coefficients = (20 * self.Ax, 12 * self.Bx, 6 * self.Cx, 2 * self.Dx)
+        self.ddy_coefficients = (20 * self.Ay, 12 * self.By, 6 * self.Cy, 2 * self.Dy)
+        self.dddx_coefficients = (60 * self.Ax, 24 * self.Bx, 6 * self.Cx)
+        self.dddy_coefficients = (60 * self.Ay, 24 * self.By, 6 * self.Cy)
+
+        # Built on the first arc length query for the new coefficients
+        self.arc_length_table = None
+
     def get_start_pose(self):
         """Returns start pose of the spline"""
         return Pose(Translation(self.x0, self.y0), Rotation(self.dx0, self.dy0, True))
@@ -225,35 +577,118 @@ class QuinticHermiteSpline:
         """Returns end pose of the spline"""
         return Pose(Translation(self.x1, self.y1), Rotation(self.dx1, self.dy1, True))
 
+    def copy(self):
+        """Returns a copy of the spline"""
+        return QuinticHermiteSpline(self.x0, self.x1, self.dx0, self.dx1, self.ddx0, self.ddx1,
+            self.y0, self.y1, self.dy0, self.dy1, self.ddy0, self.ddy1)
+
     def get_point(self, t):
         """Returns Translation at t (from 0 to 1)"""
-        x = (self.Ax * t * t * t * t * t) + (self.Bx * t * t * t * t) + (self.Cx * t * t * t) + (self.Dx * t * t) + (self.Ex * t) + (self.Fx)
-        y = (self.Ay * t * t * t * t * t) + (self.By * t * t * t * t) + (self.Cy * t * t * t) + (self.Dy * t * t) + (self.Ey * t) + (self.Fy)
+        x = ((((self.Ax * t + self.Bx) * t + self.Cx) * t + self.Dx) * t + self.Ex) * t + self.Fx
+        y = ((((self.Ay * t + self.By) * t + self.Cy) * t + self.Dy) * t + self.Ey) * t + self.Fy
         return Translation(x, y)
 
     def dx(self, t):
         """Returns derivative of x component at t"""
-        return 5 * (self.Ax * t * t * t * t) + 4 * (self.Bx * t * t * t) + 3 * (self.Cx * t * t) + 2 * (self.Dx * t) + (self.Ex)
+        a, b, c, d, e = self.dx_coefficients
+        return (((a * t + b) * t + c) * t + d) * t + e
     
     def dy(self, t):
         """Returns derivative of y component at t"""
-        return 5 * (self.Ay * t * t * t * t) + 4 * (self.By * t * t * t) + 3 * (self.Cy * t * t) + 2 * (self.Dy * t) + (self.Ey)
+        a, b, c, d, e = self.dy_coefficients
+        return (((a * t + b) * t + c) * t + d) * t + e
 
     def ddx(self, t):
         """Returns second derivative of x component at t"""
-        return 20 * (self.Ax * t * t * t) + 12 * (self.Bx * t * t) + 6 * (self.Cx * t) + 2 * (self.Dx)
+        a, b, c, d = self.ddx_coefficients
+        return ((a * t + b) * t + c) * t + d
 
     def ddy(self, t):
         """Returns second derivative of y component at t"""
-        return 20 * (self.Ay * t * t * t) + 12 * (self.By * t * t) + 6 * (self.Cy * t) + 2 * (self.Dy)
+        a, b, c, d = self.ddy_coefficients
+        return ((a * t + b) * t + c) * t + d
     
     def dddx(self, t):
         """Returns third derivate of x component at t"""
-        return 60 * (self.Ax * t * t) + 24 * (self.Bx * t) + 6 * (self.Cx)
+        a, b, c = self.dddx_coefficients
+        return (a * t + b) * t + c
 
     def dddy(self, t):
         """Returns third derivate of y component at t"""
-        return 60 * (self.Ay * t * t) + 24 * (self.By * t) + 6 * (self.Cy)
+        a, b, c = self.dddy_coefficients
+        return (a * t + b) * t + c
+
+    def get_derivatives(self, t):
+        """Returns (dx, dy, ddx, ddy, dddx, dddy) at t in a single pass"""
+        dAx, dBx, dCx, dDx, dEx = self.dx_coefficients
+        dAy, dBy, dCy, dDy, dEy = self.dy_coefficients
+        ddAx, ddBx, ddCx, ddDx = self.ddx_coefficients
+        ddAy, ddBy, ddCy, ddDy = self.ddy_coefficients
+        dddAx, dddBx, dddCx = self.dddx_coefficients
+        dddAy, dddBy, dddCy = self.dddy_coefficients
+        return ((((dAx * t + dBx) * t + dCx) * t + dDx) * t + dEx, 
+            (((dAy * t + dBy) * t + dCy) * t + dDy) * t + dEy, 
+            ((ddAx * t + ddBx) * t + ddCx) * t + ddDx, 
+            ((ddAy * t + ddBy) * t + ddCy) * t + ddDy, 
+            (dddAx * t + dddBx) * t + dddCx, 
+            (dddAy * t + dddBy) * t + dddCy)
+
+    def integrate_velocity(self, t0, t1):
+        """Returns the arc length from t0 to t1 using Gauss-Legendre quadrature"""
+        nodes, weights = get_gauss_legendre_nodes(ARCLENGTHORDER)
+        half = .5 * (t1 - t0)
+        middle = .5 * (t0 + t1)
+        total = 0.0
+        for x, w in zip(nodes, weights):
+            total += w * self.get_velocity(middle + half * x)
+        return half * total
+
+    def get_arc_length_table(self):
+        """Returns cached (ts, lengths) arrays of the cumulative arc length at ARCLENGTHPANELS + 1 evenly spaced t"""
+        if self.arc_length_table is None:
+            ts = array('d', [i / ARCLENGTHPANELS for i in range(ARCLENGTHPANELS + 1)])
+            lengths = array('d', [0.0])
+            for i in range(ARCLENGTHPANELS):
+                lengths.append(lengths[i] + self.integrate_velocity(ts[i], ts[i + 1]))
+            self.arc_length_table = (ts, lengths)
+        return self.arc_length_table
+
+    def get_arc_length(self, t=1.0):
+        """Returns the arc length from 0 to t"""
+        ts, lengths = self.get_arc_length_table()
+        i = min(int(t * ARCLENGTHPANELS), ARCLENGTHPANELS - 1)
+        if t == ts[i]:
+            return lengths[i]
+        return lengths[i] + self.integrate_velocity(ts[i], t)
+
+    def get_t(self, distance):
+        """Returns the t where the arc length from 0 is distance (clamped to the spline)
+
+        The table brackets t in a panel, then Newton's method (falling back on bisection) solves within it
+        """
+        ts, lengths = self.get_arc_length_table()
+        if distance <= 0.0:
+            return 0.0
+        if distance >= lengths[-1]:
+            return 1.0
+
+        i = bisect_right(lengths, distance) - 1
+        low, high = ts[i], ts[i + 1]
+        t = low + (high - low) * (distance - lengths[i]) / (lengths[i + 1] - lengths[i])
+        for _ in range(ARCLENGTHITERATIONS):
+            error = lengths[i] + self.integrate_velocity(ts[i], t) - distance
+            if abs(error) <= ARCLENGTHTOLERANCE:
+                break
+            if error > 0:
+                high = t
+            else:
+                low = t
+
+            velocity = self.get_velocity(t)
+            t = t - error / velocity if velocity > 0 else low
+            if t <= low or t >= high:
+                t = .5 * (low + high)
+        return t
 
     def get_velocity(self, t):
         """Returns velocity of the spline at t"""
@@ -261,28 +696,17 @@ class QuinticHermiteSpline:
     
     def get_curvature(self, t):
         """Returns the curvature of the spline at t"""
-
-        num = (self.dx(t) * self.ddy(t) - self.ddx(t) * self.dy(t))
-        # Checks if dx(t) and dy(t) are zero to avoid ZeroDivisionError
-        if epsilon_equals(self.dx(t), 0) and epsilon_equals(self.dy(t), 0):
-            return math.inf * (-1.0 if num < 0 else 1.0)
-        
-        return num / ((self.dx(t) * self.dx(t) + self.dy(t) * self.dy(t)) * math.sqrt(self.dx(t) * self.dx(t) + self.dy(t) * self.dy(t)))
+        dx, dy, ddx, ddy, dddx, dddy = self.get_derivatives(t)
+        return get_curvature(dx, dy, ddx, ddy)
 
     def get_dCurvature(self, t):
         """Returns dCurvature of the spline at t"""
-        
-        # Checks if dx(t) and dy(t) are zero to avoid ZeroDivisionError
-        if epsilon_equals(self.dx(t), 0) and epsilon_equals(self.dy(t), 0):
-            return 0
-
-        dx2dy2 = self.dx(t) * self.dx(t) + self.dy(t) * self.dy(t)
-        num = (self.dx(t) * self.dddy(t) - self.dddx(t) * self.dy(t)) * dx2dy2 - 3 * (self.dx(t) * self.ddy(t) - self.ddx(t) * self.dy(t)) * (self.dx(t) * self.ddx(t) + self.dy(t) * self.ddy(t))
-        return num/(dx2dy2 * dx2dy2 * math.sqrt(dx2dy2))
+        return get_dCurvature(*self.get_derivatives(t))
 
     def get_dCurvature2(self, t):
         """Returns dCurvature_ds squared at t"""
-        return self.get_dCurvature(t) * self.get_dCurvature(t)
+        dCurvature = self.get_dCurvature(t)
+        return dCurvature * dCurvature
 
     def get_heading(self, t):
         """Returns heading of the spline at t"""
@@ -290,11 +714,60 @@ class QuinticHermiteSpline:
 
     def get_pose(self, t):
         """Returns pose of the spline at t"""
-        
+        dx, dy, ddx, ddy, dddx, dddy = self.get_derivatives(t)
+        velocity = math.hypot(dx, dy)
+
         # Avoid ZeroDivisionError
-        dCurvature_ds = 0 if epsilon_equals(self.get_velocity(t), 0) else self.get_dCurvature(t) / self.get_velocity(t)
+        dCurvature_ds = 0 if epsilon_equals(velocity, 0) else get_dCurvature(dx, dy, ddx, ddy, dddx, dddy) / velocity
         
-        return Pose(self.get_point(t), self.get_heading(t), self.get_curvature(t), dCurvature_ds)
+        return Pose(self.get_point(t), Rotation(dx, dy, True), get_curvature(dx, dy, ddx, ddy), dCurvature_ds)
+
+    def evaluate(self, ts):
+        """Returns (x, y, heading, curvature, dCurvature_ds) arrays for each t in ts
+
+        Heading is in radians. Matches get_pose without allocating a Pose for every sample
+        """
+        xs = array('d')
+        ys = array('d')
+        headings = array('d')
+        curvatures = array('d')
+        dCurvatures = array('d')
+
+        Ax, Bx, Cx, Dx, Ex, Fx = self.Ax, self.Bx, self.Cx, self.Dx, self.Ex, self.Fx
+        Ay, By, Cy, Dy, Ey, Fy = self.Ay, self.By, self.Cy, self.Dy, self.Ey, self.Fy
+        dAx, dBx, dCx, dDx, dEx = self.dx_coefficients
+        dAy, dBy, dCy, dDy, dEy = self.dy_coefficients
+        ddAx, ddBx, ddCx, ddDx = self.ddx_coefficients
+        ddAy, ddBy, ddCy, ddDy = self.ddy_coefficients
+        dddAx, dddBx, dddCx = self.dddx_coefficients
+        dddAy, dddBy, dddCy = self.dddy_coefficients
+
+        for t in ts:
+            xs.append(((((Ax * t + Bx) * t + Cx) * t + Dx) * t + Ex) * t + Fx)
+            ys.append(((((Ay * t + By) * t + Cy) * t + Dy) * t + Ey) * t + Fy)
+
+            dx = (((dAx * t + dBx) * t + dCx) * t + dDx) * t + dEx
+            dy = (((dAy * t + dBy) * t + dCy) * t + dDy) * t + dEy
+            ddx = ((ddAx * t + ddBx) * t + ddCx) * t + ddDx
+            ddy = ((ddAy * t + ddBy) * t + ddCy) * t + ddDy
+            headings.append(math.atan2(dy, dx))
+
+            # Same ZeroDivisionError handling as get_curvature and get_pose
+            num = dx * ddy - ddx * dy
+            if abs(dx) <= ZERO_EPSILON and abs(dy) <= ZERO_EPSILON:
+                curvatures.append(math.inf * (-1.0 if num < 0 else 1.0))
+                dCurvatures.append(0.0)
+                continue
+
+            dddx = (dddAx * t + dddBx) * t + dddCx
+            dddy = (dddAy * t + dddBy) * t + dddCy
+            dx2dy2 = dx * dx + dy * dy
+            velocity = math.sqrt(dx2dy2)
+            curvatures.append(num / (dx2dy2 * velocity))
+            dCurvature = ((dx * dddy - dddx * dy) * dx2dy2 - 3 * num * (dx * ddx + dy * ddy)) / (dx2dy2 * dx2dy2 * velocity)
+            dCurvatures.append(dCurvature / velocity)
+
+        return xs, ys, headings, curvatures, dCurvatures
 
     def sum_dCurvature2(self):
         """Returns the sum of the dCurvature2 of a spline for optimization"""
@@ -304,6 +777,85 @@ class QuinticHermiteSpline:
             total += dt * self.get_dCurvature2(i * dt)
         return total
 
+    def sum_dCurvature2_gradient(self, quadrature=None):
+        """Returns the partial derivatives of sum_dCurvature2 with respect to (ddx0, ddx1, ddy0, ddy1)"""
+        return integrate_dCurvature2_gradient(self.Ax, self.Bx, self.Cx, self.Dx, self.Ex, self.Ay, self.By, self.Cy, self.Dy, self.Ey,
+            get_quadrature(quadrature=quadrature))
+
+class SplineCostCache:
+    """Caches the dCurvature2 of each spline in a path so only splines with new coefficients are re-integrated"""
+
+    def __init__(self, quadrature=None):
+        """Constructs a SplineCostCache object (quadrature defaults to the left Riemann sum)"""
+        self.quadrature = get_quadrature(quadrature=quadrature)
+        self.keys = []
+        self.costs = []
+
+        # hits: spline integrations skipped, misses: spline integrations run, evaluations: path costs requested
+        self.hits = 0
+        self.misses = 0
+        self.evaluations = 0
+
+    def get_cost(self, index, spline):
+        """Returns sum_dCurvature2 of the spline at index, re-integrating only if its coefficients changed"""
+        while len(self.keys) <= index:
+            self.keys.append(None)
+            self.costs.append(0.0)
+
+        key = (spline.Ax, spline.Bx, spline.Cx, spline.Dx, spline.Ex, spline.Fx, spline.Ay, spline.By, spline.Cy, spline.Dy, spline.Ey, spline.Fy)
+        if key == self.keys[index]:
+            self.hits += 1
+            return self.costs[index]
+
+        self.misses += 1
+        self.keys[index] = key
+        self.costs[index] = sum_dCurvature2_batch([spline], quadrature=self.quadrature)[0]
+        return self.costs[index]
+
+    def get_local_cost(self, splines, index):
+        """Returns sum_dCurvature2 of the two splines around knot index (every other spline is unchanged)
+
+        Splines with new coefficients are integrated but not stored: finite difference probes are only used once
+        """
+        cost = 0.0
+        stale = []
+        for i in (index, index + 1):
+            s = splines[i]
+            key = (s.Ax, s.Bx, s.Cx, s.Dx, s.Ex, s.Fx, s.Ay, s.By, s.Cy, s.Dy, s.Ey, s.Fy)
+            if i < len(self.keys) and key == self.keys[i]:
+                self.hits += 1
+                cost += self.costs[i]
+            else:
+                stale.append(s)
+
+        self.misses += len(stale)
+        return cost + sum(sum_dCurvature2_batch(stale, quadrature=self.quadrature))
+
+    def sum_dCurvature2(self, splines):
+        """Returns the sum of the dCurvature2 for a list of splines"""
+        self.evaluations += 1
+        while len(self.keys) < len(splines):
+            self.keys.append(None)
+            self.costs.append(0.0)
+
+        # Find every spline with new coefficients and integrate them in one batch
+        stale = []
+        for i in range(len(splines)):
+            s = splines[i]
+            key = (s.Ax, s.Bx, s.Cx, s.Dx, s.Ex, s.Fx, s.Ay, s.By, s.Cy, s.Dy, s.Ey, s.Fy)
+            if key == self.keys[i]:
+                self.hits += 1
+            else:
+                self.keys[i] = key
+                stale.append(i)
+
+        self.misses += len(stale)
+        costs = sum_dCurvature2_batch([splines[i] for i in stale], quadrature=self.quadrature)
+        for i, cost in zip(stale, costs):
+            self.costs[i] = cost
+
+        return sum(self.costs[:len(splines)])
+
 class ControlPoint:
     """ControlPoint for optimization"""
     ddx = 0
@@ -0,0 +1,191 @@
+"""CS 108 Trajectory Visualization Project
+
+Class that stores every segment of a path's quintic hermite splines in contiguous arrays
+
+@author: Matthew Walstra (mjw64)
+@date: Fall, 2020
+"""
+
+import math
+from array import array
+
+from Geometry.rotation import Rotation
+from Spline.quintic_hermite_spline import QuinticHermiteSpline, integrate_dCurvature2, get_curvature, get_dCurvature, get_quadrature
+from Util.util import EPSILON as ZERO_EPSILON
+
+# Row layout of the boundary array (same order as the QuinticHermiteSpline constructor)
+X0, X1, DX0, DX1, DDX0, DDX1, Y0, Y1, DY0, DY1, DDY0, DDY1 = range(12)
+
+# Row layout of the coefficient array
+AX, BX, CX, DX, EX, FX, AY, BY, CY, DY, EY, FY = range(12)
+
+def to_spline_array(splines):
+    """Helper function to return a SplineArray from a list of QuinticHermiteSplines"""
+    spline_array = SplineArray(len(splines))
+    for i in range(len(splines)):
+        s = splines[i]
+        spline_array.set_boundary(i, (s.x0, s.x1, s.dx0, s.dx1, s.ddx0, s.ddx1, s.y0, s.y1, s.dy0, s.dy1, s.ddy0, s.ddy1))
+    spline_array.compute_coefficients()
+    return spline_array
+
+class SplineArray:
+    """Struct of arrays for a list of QuinticHermiteSplines: each segment is a row of 12 boundary values and 12 coefficients"""
+
+    def __init__(self, length=0):
+        """Constructs a SplineArray with length zeroed segments"""
+        self.length = length
+        self.boundaries = array('d', bytes(8 * 12 * length))
+        self.coefficients = array('d', bytes(8 * 12 * length))
+
+    def __len__(self):
+        """Returns the number of segments"""
+        return self.length
+
+    def get_boundary(self, index):
+        """Returns the 12 boundary values of segment index"""
+        return tuple(self.boundaries[12 * index:12 * index + 12])
+
+    def set_boundary(self, index, values):
+        """Mutator for the 12 boundary values of segment index (call compute_coefficients afterwards)"""
+        self.boundaries[12 * index:12 * index + 12] = array('d', values)
+
+    def get_coefficients(self, index):
+        """Returns the 12 coefficients (Ax ... Fy) of segment index"""
+        return tuple(self.coefficients[12 * index:12 * index + 12])
+
+    def check_knot(self, index):
+        """Raises ValueError unless index is an interior knot (0 to len - 2, like set_knot(splines, index, ddx, ddy))"""
+        if not 0 <= index <= self.length - 2:
+            raise ValueError("Expected a knot index from 0 to {}, got {}.".format(self.length - 2, index))
+
+    def get_knot(self, index):
+        """Returns (ddx, ddy) at interior knot index (the end of segment index and start of segment index + 1)"""
+        self.check_knot(index)
+        row = 12 * index
+        return self.boundaries[row + DDX1], self.boundaries[row + DDY1]
+
+    def set_knot(self, index, ddx, ddy):
+        """Mutator for (ddx, ddy) at interior knot index: updates both segments that share it"""
+        self.check_knot(index)
+        row = 12 * index
+        next_row = row + 12
+        self.boundaries[row + DDX1] = ddx
+        self.boundaries[row + DDY1] = ddy
+        self.boundaries[next_row + DDX0] = ddx
+        self.boundaries[next_row + DDY0] = ddy
+        self.compute_coefficients(index, index + 2)
+
+    def compute_coefficients(self, start=0, end=None):
+        """Computes the coefficients of segments [start, end)"""
+        if end is None:
+            end = self.length
+
+        b = self.boundaries
+        c = self.coefficients
+        for row in range(12 * start, 12 * end, 12):
+            for offset in (0, 6):
+                p0 = b[row + offset + X0]
+                p1 = b[row + offset + X1]
+                d0 = b[row + offset + DX0]
+                d1 = b[row + offset + DX1]
+                dd0 = b[row + offset + DDX0]
+                dd1 = b[row + offset + DDX1]
+
+                c[row + offset + AX] = -6 * p0 - 3 * d0 - .5 * dd0 + .5 * dd1 - 3 * d1 + 6 * p1
+                c[row + offset + BX] = 15 * p0 + 8 * d0 + 1.5 * dd0 - dd1 + 7 * d1 - 15 * p1
+                c[row + offset + CX] = -10 * p0 - 6 * d0 - 1.5 * dd0 + .5 * dd1 - 4 * d1 + 10 * p1
+                c[row + offset + DX] = .5 * dd0
+                c[row + offset + EX] = d0
+                c[row + offset + FX] = p0
+
+    def get_point(self, index, t):
+        """Returns (x, y) of segment index at t (from 0 to 1)"""
+        Ax, Bx, Cx, Dx, Ex, Fx, Ay, By, Cy, Dy, Ey, Fy = self.coefficients[12 * index:12 * index + 12]
+        x = ((((Ax * t + Bx) * t + Cx) * t + Dx) * t + Ex) * t + Fx
+        y = ((((Ay * t + By) * t + Cy) * t + Dy) * t + Ey) * t + Fy
+        return x, y
+
+    def get_derivatives(self, index, t):
+        """Returns (dx, dy, ddx, ddy, dddx, dddy) of segment index at t"""
+        Ax, Bx, Cx, Dx, Ex, Fx, Ay, By, Cy, Dy, Ey, Fy = self.coefficients[12 * index:12 * index + 12]
+        dx = (((5 * Ax * t + 4 * Bx) * t + 3 * Cx) * t + 2 * Dx) * t + Ex
+        dy = (((5 * Ay * t + 4 * By) * t + 3 * Cy) * t + 2 * Dy) * t + Ey
+        ddx = ((20 * Ax * t + 12 * Bx) * t + 6 * Cx) * t + 2 * Dx
+        ddy = ((20 * Ay * t + 12 * By) * t + 6 * Cy) * t + 2 * Dy
+        dddx = (60 * Ax * t + 24 * Bx) * t + 6 * Cx
+        dddy = (60 * Ay * t + 24 * By) * t + 6 * Cy
+        return dx, dy, ddx, ddy, dddx, dddy
+
+    def get_heading(self, index, t):
+        """Returns heading of segment index at t"""
+        dx, dy, ddx, ddy, dddx, dddy = self.get_derivatives(index, t)
+        return Rotation(dx, dy, True)
+
+    def get_curvature(self, index, t):
+        """Returns the curvature of segment index at t"""
+        dx, dy, ddx, ddy, dddx, dddy = self.get_derivatives(index, t)
+        return get_curvature(dx, dy, ddx, ddy)
+
+    def get_dCurvature(self, index, t):
+        """Returns dCurvature of segment index at t"""
+        return get_dCurvature(*self.get_derivatives(index, t))
+
+    def evaluate(self, indices, ts):
+        """Returns (x, y, heading, curvature, dCurvature_ds) arrays for each segment indices[i] at ts[i]
+
+        Heading is in radians. Matches QuinticHermiteSpline.evaluate, so a whole path is sampled without a Pose per sample
+        """
+        if len(indices) != len(ts):
+            raise ValueError("Expected one t per index, got {} indices and {} ts.".format(len(indices), len(ts)))
+
+        xs = array('d')
+        ys = array('d')
+        headings = array('d')
+        curvatures = array('d')
+        dCurvatures = array('d')
+
+        c = self.coefficients
+        for index, t in zip(indices, ts):
+            Ax, Bx, Cx, Dx, Ex, Fx, Ay, By, Cy, Dy, Ey, Fy = c[12 * index:12 * index + 12]
+            xs.append(((((Ax * t + Bx) * t + Cx) * t + Dx) * t + Ex) * t + Fx)
+            ys.append(((((Ay * t + By) * t + Cy) * t + Dy) * t + Ey) * t + Fy)
+
+            dx = (((5 * Ax * t + 4 * Bx) * t + 3 * Cx) * t + 2 * Dx) * t + Ex
+            dy = (((5 * Ay * t + 4 * By) * t + 3 * Cy) * t + 2 * Dy) * t + Ey
+            ddx = ((20 * Ax * t + 12 * Bx) * t + 6 * Cx) * t + 2 * Dx
+            ddy = ((20 * Ay * t + 12 * By) * t + 6 * Cy) * t + 2 * Dy
+            headings.append(math.atan2(dy, dx))
+
+            # Same ZeroDivisionError handling as get_curvature and QuinticHermiteSpline.get_pose
+            num = dx * ddy - ddx * dy
+            if abs(dx) <= ZERO_EPSILON and abs(dy) <= ZERO_EPSILON:
+                curvatures.append(math.inf * (-1.0 if num < 0 else 1.0))
+                dCurvatures.append(0.0)
+                continue
+
+            dddx = (60 * Ax * t + 24 * Bx) * t + 6 * Cx
+            dddy = (60 * Ay * t + 24 * By) * t + 6 * Cy
+            dx2dy2 = dx * dx + dy * dy
+            velocity = math.sqrt(dx2dy2)
+            curvatures.append(num / (dx2dy2 * velocity))
+            dCurvature = ((dx * dddy - dddx * dy) * dx2dy2 - 3 * num * (dx * ddx + dy * ddy)) / (dx2dy2 * dx2dy2 * velocity)
+            dCurvatures.append(dCurvature / velocity)
+
+        return xs, ys, headings, curvatures, dCurvatures
+
+    def sum_dCurvature2(self, samples=None, quadrature=None):
+        """Returns a list of sum_dCurvature2 for each segment"""
+        quadrature = get_quadrature(samples, quadrature)
+        costs = []
+        c = self.coefficients
+        for row in range(0, 12 * self.length, 12):
+            costs.append(integrate_dCurvature2(c[row + AX], c[row + BX], c[row + CX], c[row + DX], c[row + EX],
+                c[row + AY], c[row + BY], c[row + CY], c[row + DY], c[row + EY], quadrature))
+        return costs
+
+    def to_splines(self):
+        """Returns the segments as a list of QuinticHermiteSplines"""
+        splines = []
+        for i in range(self.length):
+            splines.append(QuinticHermiteSpline(*self.get_boundary(i)))
+        return splines
@@ -0,0 +1,375 @@
+"""CS 108 Trajectory Visualization Project
+
+Module for minimizing the dCurvature2 of a list of splines, with convergence reporting
+
+Inspired by:
+Nocedal & Wright, Numerical Optimization (2nd ed.), Algorithm 7.4 (L-BFGS two-loop recursion)
+
+@author: Matthew Walstra (mjw64)
+@date: Fall, 2020
+"""
+
+import math
+import time
+
+from Spline.quintic_hermite_spline import (MAXITERATIONS, MINDELTA, STEPSIZE, SplineCostCache,
+    get_collinear_knots, get_gradient, run_optimization_iteration)
+
+from Util.util import EPSILON
+
+# Optimization methods
+GRADIENT_DESCENT = "gradient_descent"
+LBFGS = "lbfgs"
+
+# Stop reasons
+CONVERGED = "converged"
+MAX_ITERATIONS = "max_iterations"
+ZERO_GRADIENT = "zero_gradient"
+LINE_SEARCH_FAILED = "line_search_failed"
+
+INCREMENTAL_RADIUS = 2 # knots on either side of a moved pose to re-optimize first
+INCREMENTAL_TOLERANCE = MINDELTA # minimum decrease in dCurvature2 to keep widening the window
+
+LBFGS_MEMORY = 5
+LBFGS_TOLERANCE = 1E-6 # minimum decrease in dCurvature2 per iteration
+ARMIJO = 1E-4 # sufficient decrease constant for the line search
+MINSTEP = 1E-8 # smallest line search step before giving up
+
+class OptimizationResult:
+    """Summary of a spline optimization run"""
+
+    def __init__(self, method=LBFGS):
+        """Constructs an OptimizationResult object"""
+        self.method = method
+        self.cost = 0.0
+        self.iterations = 0
+        self.function_evaluations = 0
+        self.gradient_evaluations = 0
+        self.history = []
+        self.stop_reason = ""
+
+    def __str__(self):
+        """Returns OptimizationResult as a string"""
+        return "{}: {:.6f}, {} iterations, {} function evaluations, {} gradient evaluations, {}".format(self.method,
+            self.cost, self.iterations, self.function_evaluations, self.gradient_evaluations, self.stop_reason)
+
+def get_active_knots(splines):
+    """Returns the indices of the interior knots that can be optimized (consecutive splines aren't collinear)"""
+    collinear = get_collinear_knots(splines)
+    return [i for i in range(len(collinear)) if not collinear[i]]
+
+def get_knot_vector(splines, knots):
+    """Returns [ddx, ddy, ddx, ddy, ...] for each knot"""
+    values = []
+    for i in knots:
+        values.append(splines[i].ddx1)
+        values.append(splines[i].ddy1)
+    return values
+
+def set_knot_vector(splines, knots, values):
+    """Mutator for the second derivatives of each knot: values is [ddx, ddy, ddx, ddy, ...]"""
+    for j in range(len(knots)):
+        i = knots[j]
+        splines[i].ddx1 = splines[i + 1].ddx0 = values[2 * j]
+        splines[i].ddy1 = splines[i + 1].ddy0 = values[2 * j + 1]
+
+    # Each spline is only recomputed once even if both of its knots changed
+    updated = set()
+    for i in knots:
+        updated.add(i)
+        updated.add(i + 1)
+    for i in updated:
+        splines[i].compute_coefficients()
+
+def get_knot_gradient(splines, knots, analytic_gradient=True, cost_cache=None):
+    """Returns the gradient of sum_dCurvature2 as [ddx, ddy, ddx, ddy, ...] for each knot"""
+    if cost_cache is None:
+        cost_cache = SplineCostCache()
+
+    gradient = []
+    if analytic_gradient:
+        partials = {}
+        for i in knots:
+            for j in (i, i + 1):
+                if j not in partials:
+                    partials[j] = splines[j].sum_dCurvature2_gradient(cost_cache.quadrature)
+            gradient.append(partials[i][1] + partials[i + 1][0])
+            gradient.append(partials[i][3] + partials[i + 1][2])
+        return gradient
+
+    control_points = get_gradient(splines, False, cost_cache)
+    for i in knots:
+        gradient.append(control_points[i].ddx)
+        gradient.append(control_points[i].ddy)
+    return gradient
+
+def dot(a, b):
+    """Returns the dot product of two vectors"""
+    total = 0.0
+    for x, y in zip(a, b):
+        total += x * y
+    return total
+
+def minimize_spline(splines, method=LBFGS, analytic_gradient=True, max_iterations=MAXITERATIONS, cost_cache=None, quadrature=None):
+    """Optimizes the interior second derivatives of splines: returns an OptimizationResult
+
+    quadrature sets how dCurvature2 is integrated (ignored if cost_cache is given)
+    """
+    if cost_cache is None:
+        cost_cache = SplineCostCache(quadrature)
+
+    return AnytimeOptimizer(splines, method, analytic_gradient, max_iterations, cost_cache).run()
+
+def reoptimize_spline(splines, pose_index, method=LBFGS, radius=INCREMENTAL_RADIUS, tolerance=INCREMENTAL_TOLERANCE, cost_cache=None, quadrature=None):
+    """Re-optimizes the knots around a moved pose, warm started from the current knots: returns an OptimizationResult
+
+    Starts with the knots within radius of pose_index and doubles the window while the knots just outside it
+    could still decrease the total cost by tolerance (estimated from their gradient and STEPSIZE)
+    """
+    if cost_cache is None:
+        cost_cache = SplineCostCache(quadrature)
+
+    # Interior knot i is at pose i + 1
+    center = pose_index - 1
+    last = len(splines) - 2
+    collinear = get_collinear_knots(splines)
+    result = OptimizationResult(method)
+    while True:
+        start = max(center - radius, 0)
+        end = min(center + radius, last)
+        window = AnytimeOptimizer(splines, method, cost_cache=cost_cache, knots=range(start, end + 1)).run()
+
+        if len(result.history) == 0:
+            result.history.append(window.history[0])
+        result.history += window.history[1:]
+        result.iterations += window.iterations
+        result.function_evaluations += window.function_evaluations
+        result.gradient_evaluations += window.gradient_evaluations
+        result.stop_reason = window.stop_reason
+        result.cost = window.cost
+
+        if start == 0 and end >= last:
+            break
+
+        # Only widen if the knots the next window would add aren't already at a minimum
+        radius *= 2
+        ring = [i for i in range(max(center - radius, 0), min(center + radius, last) + 1) if (i < start or i > end) and not collinear[i]]
+        gradient = get_knot_gradient(splines, ring, True, cost_cache)
+        if STEPSIZE * math.sqrt(dot(gradient, gradient)) < tolerance:
+            break
+    return result
+
+class CancellationToken:
+    """Flag shared with a running AnytimeOptimizer to stop it at the next iteration"""
+
+    def __init__(self):
+        """Constructs a CancellationToken object"""
+        self.cancelled = False
+
+    def cancel(self):
+        """Requests that the optimization stops"""
+        self.cancelled = True
+
+    def is_cancelled(self):
+        """Returns True if cancel was called"""
+        return self.cancelled
+
+class AnytimeOptimizer:
+    """Resumable spline optimization that can be stopped after any iteration with the best splines so far
+
+    splines are optimized in place; get_best_splines returns copies at the best cost found
+    """
+
+    def __init__(self, splines, method=LBFGS, analytic_gradient=True, max_iterations=MAXITERATIONS, cost_cache=None, quadrature=None, knots=None):
+        """Constructs an AnytimeOptimizer object (knots limits optimization to those interior knot indices)"""
+        if method != GRADIENT_DESCENT and method != LBFGS:
+            raise ValueError("Unknown optimization method: " + str(method))
+        if cost_cache is None:
+            cost_cache = SplineCostCache(quadrature)
+
+        self.splines = splines
+        self.method = method
+        self.analytic_gradient = analytic_gradient
+        self.max_iterations = max_iterations
+        self.cost_cache = cost_cache
+        self.start_evaluations = cost_cache.evaluations
+
+        self.result = OptimizationResult(method)
+        self.result.stop_reason = MAX_ITERATIONS
+        self.done = False
+
+        # Running estimate of the seconds per step, so run doesn't start a step the budget can't fit
+        self.step_time = None
+
+        # Knots outside the window are skipped like collinear knots
+        self.collinear = get_collinear_knots(splines)
+        if knots is not None:
+            window = set(knots)
+            self.collinear = [self.collinear[i] or i not in window for i in range(len(self.collinear))]
+        self.knots = [i for i in range(len(self.collinear)) if not self.collinear[i]]
+        self.x = get_knot_vector(splines, self.knots)
+        self.cost = cost_cache.sum_dCurvature2(splines)
+        self.result.history.append(self.cost)
+        self.result.cost = self.cost
+        self.best_x = list(self.x)
+
+        # L-BFGS state: gradient and correction pairs (s = change in x, y = change in gradient)
+        self.g = None
+        self.s_list = []
+        self.y_list = []
+        self.rho_list = []
+
+        if method == LBFGS and len(self.knots) == 0:
+            self.finish(ZERO_GRADIENT)
+
+    def run(self, budget=None, token=None):
+        """Runs iterations until finished, the next one wouldn't fit in budget seconds or token is cancelled: returns the OptimizationResult
+
+        At least one iteration runs per call (unless cancelled), so a budget shorter than one step still makes progress
+        """
+        start_time = time.perf_counter()
+        steps = 0
+        while not self.done:
+            if token is not None and token.is_cancelled():
+                break
+            if budget is not None and steps > 0 and time.perf_counter() - start_time + self.step_time > budget:
+                break
+
+            step_start = time.perf_counter()
+            self.step()
+            step_time = time.perf_counter() - step_start
+            self.step_time = step_time if self.step_time is None else .5 * (self.step_time + step_time)
+            steps += 1
+        return self.result
+
+    def step(self):
+        """Runs a single iteration: returns True once optimization is finished"""
+        if self.done:
+            return True
+
+        if self.result.iterations >= self.max_iterations:
+            self.finish(MAX_ITERATIONS)
+        elif self.method == GRADIENT_DESCENT:
+            self.step_gradient_descent()
+        else:
+            self.step_lbfgs()
+
+        # Keep the best knots found so the result only ever improves
+        if self.cost < self.result.cost:
+            self.result.cost = self.cost
+            self.best_x = get_knot_vector(self.splines, self.knots)
+        self.result.function_evaluations = self.cost_cache.evaluations - self.start_evaluations
+        return self.done
+
+    def step_gradient_descent(self):
+        """Runs one iteration of optimize_spline's steepest descent"""
+        run_optimization_iteration(self.splines, self.analytic_gradient, self.cost_cache, self.collinear)
+        current = self.cost_cache.sum_dCurvature2(self.splines)
+
+        self.result.iterations += 1
+        self.result.gradient_evaluations += 1
+        self.result.history.append(current)
+
+        decrease = self.cost - current
+        self.cost = current
+        if decrease < MINDELTA:
+            self.finish(CONVERGED)
+
+    def step_lbfgs(self):
+        """Runs one iteration of limited memory BFGS"""
+        if self.g is None:
+            self.g = get_knot_gradient(self.splines, self.knots, self.analytic_gradient, self.cost_cache)
+            self.result.gradient_evaluations += 1
+
+        x, f, g = self.x, self.cost, self.g
+        g_norm = math.sqrt(dot(g, g))
+        if g_norm <= EPSILON:
+            self.finish(ZERO_GRADIENT)
+            return
+
+        # Two loop recursion: direction = -H * g
+        q = list(g)
+        alphas = []
+        for s, y, rho in zip(reversed(self.s_list), reversed(self.y_list), reversed(self.rho_list)):
+            alpha = rho * dot(s, q)
+            q = [qi - alpha * yi for qi, yi in zip(q, y)]
+            alphas.append(alpha)
+
+        # Initial hessian approximation: first step moves STEPSIZE like optimize_spline
+        if len(self.s_list) > 0:
+            gamma = dot(self.s_list[-1], self.y_list[-1]) / dot(self.y_list[-1], self.y_list[-1])
+        else:
+            gamma = STEPSIZE / g_norm
+
+        r = [gamma * qi for qi in q]
+        for s, y, rho, alpha in zip(self.s_list, self.y_list, self.rho_list, reversed(alphas)):
+            beta = rho * dot(y, r)
+            r = [ri + (alpha - beta) * si for ri, si in zip(r, s)]
+
+        direction = [-ri for ri in r]
+        slope = dot(g, direction)
+        if slope >= 0:
+            # Not a descent direction, so restart from steepest descent
+            self.s_list, self.y_list, self.rho_list = [], [], []
+            direction = [-gi * STEPSIZE / g_norm for gi in g]
+            slope = dot(g, direction)
+
+        # Backtracking line search for sufficient decrease
+        step = 1.0
+        while True:
+            x_new = [xi + step * di for xi, di in zip(x, direction)]
+            set_knot_vector(self.splines, self.knots, x_new)
+            f_new = self.cost_cache.sum_dCurvature2(self.splines)
+            if f_new <= f + ARMIJO * step * slope:
+                break
+            step *= .5
+            if step < MINSTEP:
+                break
+
+        if step < MINSTEP:
+            # Restore the best point found
+            set_knot_vector(self.splines, self.knots, x)
+            self.finish(LINE_SEARCH_FAILED)
+            return
+
+        g_new = get_knot_gradient(self.splines, self.knots, self.analytic_gradient, self.cost_cache)
+        self.result.gradient_evaluations += 1
+        self.result.iterations += 1
+        self.result.history.append(f_new)
+
+        s = [a - b for a, b in zip(x_new, x)]
+        y = [a - b for a, b in zip(g_new, g)]
+        sy = dot(s, y)
+
+        # Only keep pairs that keep the hessian approximation positive definite
+        if sy > EPSILON * dot(y, y):
+            self.s_list.append(s)
+            self.y_list.append(y)
+            self.rho_list.append(1.0 / sy)
+            if len(self.s_list) > LBFGS_MEMORY:
+                self.s_list.pop(0)
+                self.y_list.pop(0)
+                self.rho_list.pop(0)
+
+        self.x, self.cost, self.g = x_new, f_new, g_new
+        if f - f_new < LBFGS_TOLERANCE:
+            self.finish(CONVERGED)
+
+    def finish(self, stop_reason):
+        """Stops the optimization and leaves splines at the best knots found"""
+        self.done = True
+        self.result.stop_reason = stop_reason
+        if self.cost > self.result.cost:
+            set_knot_vector(self.splines, self.knots, self.best_x)
+            self.cost = self.result.cost
+
+    def is_done(self):
+        """Returns True once optimization is finished (converged, failed or out of iterations)"""
+        return self.done
+
+    def get_best_splines(self):
+        """Returns copies of the splines at the best cost found so far"""
+        splines = [s.copy() for s in self.splines]
+        if self.cost > self.result.cost:
+            set_knot_vector(splines, self.knots, self.best_x)
+        return splines
@@ -0,0 +1,253 @@
+"""CS 108 Trajectory Visualization Project
+
+Timing and memory checks for spline evaluation, smooth knots, trajectory point storage, time parameterization and trajectory sampling (not unittests: timings depend on the machine)
+
+Usage: python Test/benchmark.py [--points 100000] [--samples 2000] [pose] [smooth_knots] [memory] [time_parameterize] [iterator]
+
+@author: Matthew Walstra (mjw64)
+@date: Fall, 2020
+"""
+
+import argparse
+import math
+import random
+import time
+import tracemalloc
+
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+#https://chrisyeh96.github.io/2017/08/08/definitive-guide-python-imports.html
+# Number of os.path.dirname dependent on number of subfolders: goes up 1 directory each time
+# Uncomment top line if you want to use the run button in the top right
+# F5 works because of adding Trajectory_Visualization directory to PYTHONPATH in .env file
+
+from Geometry.pose import Pose, to_pose
+from Geometry.rotation import Rotation
+from Geometry.trajectory_point import TrajectoryPoint
+from Geometry.trajectory_points import to_trajectory_points
+
+from Spline.quintic_hermite_spline import SMOOTHDAMPING, create_quintic_splines, optimize_spline, solve_smooth_knots, sum_dCurvature2
+
+from Trajectory.trajectory_iterator import TrajectoryIterator
+from Trajectory.trajectory_util import parameterize_splines, time_parameterize_trajectory, time_parameterize_states
+
+from Util.jsonIO import JsonIO
+from Util.util import epsilon_equals
+
+def get_curvature_separate(s, t):
+    """Reference: QuinticHermiteSpline.get_curvature before get_derivatives, evaluating each derivative polynomial per use"""
+    num = (s.dx(t) * s.ddy(t) - s.ddx(t) * s.dy(t))
+    if epsilon_equals(s.dx(t), 0) and epsilon_equals(s.dy(t), 0):
+        return math.inf * (-1.0 if num < 0 else 1.0)
+    return num / ((s.dx(t) * s.dx(t) + s.dy(t) * s.dy(t)) * math.sqrt(s.dx(t) * s.dx(t) + s.dy(t) * s.dy(t)))
+
+def get_dCurvature_separate(s, t):
+    """Reference: QuinticHermiteSpline.get_dCurvature before get_derivatives"""
+    if epsilon_equals(s.dx(t), 0) and epsilon_equals(s.dy(t), 0):
+        return 0
+    dx2dy2 = s.dx(t) * s.dx(t) + s.dy(t) * s.dy(t)
+    num = (s.dx(t) * s.dddy(t) - s.dddx(t) * s.dy(t)) * dx2dy2 - 3 * (s.dx(t) * s.ddy(t) - s.ddx(t) * s.dy(t)) * (s.dx(t) * s.ddx(t) + s.dy(t) * s.ddy(t))
+    return num/(dx2dy2 * dx2dy2 * math.sqrt(dx2dy2))
+
+def get_pose_separate(s, t):
+    """Reference: QuinticHermiteSpline.get_pose before get_derivatives"""
+    dCurvature_ds = 0 if epsilon_equals(s.get_velocity(t), 0) else get_dCurvature_separate(s, t) / s.get_velocity(t)
+    return Pose(s.get_point(t), Rotation(s.dx(t), s.dy(t), True), get_curvature_separate(s, t), dCurvature_ds)
+
+def get_values(results):
+    """Returns the numbers in a list of Poses or floats, flattened for comparison"""
+    values = []
+    for result in results:
+        if isinstance(result, Pose):
+            values.extend([result.translation.x, result.translation.y, result.rotation.get_radians(), result.curvature, result.dCurvature])
+        else:
+            values.append(result)
+    return values
+
+def benchmark_pose(samples):
+    """Times get_pose, get_curvature and get_dCurvature against references that evaluate each derivative per use"""
+    random.seed(6)
+    poses = [to_pose(80.0 * i + random.uniform(-20, 20), random.uniform(-100, 100), random.uniform(-60, 60)) for i in range(20)]
+    splines = create_quintic_splines(poses)
+    ts = [i / samples for i in range(samples + 1)]
+    calls = len(splines) * len(ts)
+    print("spline evaluation: {} calls".format(calls))
+
+    for name, separate, fused in [("get_pose", get_pose_separate, lambda s, t: s.get_pose(t)),
+            ("get_curvature", get_curvature_separate, lambda s, t: s.get_curvature(t)),
+            ("get_dCurvature", get_dCurvature_separate, lambda s, t: s.get_dCurvature(t))]:
+        start_time = time.perf_counter()
+        expected = [separate(s, t) for s in splines for t in ts]
+        separate_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        actual = [fused(s, t) for s in splines for t in ts]
+        fused_time = time.perf_counter() - start_time
+
+        close = all(math.isclose(e, a, rel_tol=1E-9, abs_tol=1E-12) for e, a in zip(get_values(expected), get_values(actual)))
+        print("  {}: per derivative {:.2f}us, get_derivatives {:.2f}us per call, equal: {}".format(
+            name, separate_time / calls * 1E6, fused_time / calls * 1E6, close))
+
+def benchmark_smooth_knots(dampings):
+    """Compares SMOOTH_KNOTS against optimize_spline on the saved library: sum_dCurvature2 relative to optimized, and time
+
+    The damping sweep is what SMOOTHDAMPING is chosen from
+    """
+    trajectories = JsonIO(os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + "/Trajectory/").load_trajectories()
+    # Without interior knots both modes leave the splines as they are
+    trajectories = [trajectory for trajectory in trajectories if len(trajectory.poses) > 2]
+    print("smooth knots: {} saved trajectories with interior knots (cost is sum_dCurvature2 / optimized)".format(len(trajectories)))
+
+    ratios = {damping: [] for damping in dampings}
+    for trajectory in trajectories:
+        splines = create_quintic_splines(trajectory.poses)
+        zero_cost = sum_dCurvature2(splines)
+        start_time = time.perf_counter()
+        optimize_spline(splines)
+        optimize_time = time.perf_counter() - start_time
+        optimized_cost = sum_dCurvature2(splines)
+
+        smooth = []
+        for damping in dampings:
+            splines = create_quintic_splines(trajectory.poses)
+            start_time = time.perf_counter()
+            solve_smooth_knots(splines, damping=damping)
+            smooth_time = time.perf_counter() - start_time
+            ratios[damping].append(sum_dCurvature2(splines) / optimized_cost)
+            smooth.append((damping, ratios[damping][-1], smooth_time))
+
+        print("  {} ({} poses): zero knots cost {:.2f}, optimize_spline {:.1f}ms".format(
+            trajectory.name, len(trajectory.poses), zero_cost / optimized_cost, optimize_time * 1E3))
+        print("    " + ", ".join(["damping {}: cost {:.3f} in {:.2f}ms".format(damping, ratio, smooth_time * 1E3) for damping, ratio, smooth_time in smooth]))
+
+    for damping in dampings:
+        print("  damping {}{}: mean cost {:.3f}, worst {:.3f}".format(damping, " (SMOOTHDAMPING)" if damping == SMOOTHDAMPING else "",
+            sum(ratios[damping]) / len(ratios[damping]), max(ratios[damping])))
+
+def get_splines():
+    """Returns the splines of a random 400 pose path"""
+    random.seed(2)
+    poses = [to_pose(80.0 * i + random.uniform(-20, 20), random.uniform(-100, 100), random.uniform(-60, 60)) for i in range(400)]
+    return create_quintic_splines(poses)
+
+def get_points(count):
+    """Returns about count untimed TrajectoryPoints along a random 400 pose path (more points than poses allow)"""
+    points = parameterize_splines(get_splines(), max_dx=.6, max_dy=.005)
+    return points[:count]
+
+def benchmark_memory():
+    """Measures the bytes per sample of a list of TrajectoryPoints against TrajectoryPoints columns with tracemalloc"""
+    splines = get_splines()
+    # Fill any lazy spline tables first, so only the points are measured
+    parameterize_splines(splines, max_dx=.6, max_dy=.005, columnar=True)
+    tracemalloc.start()
+    listed = parameterize_splines(splines, max_dx=.6, max_dy=.005)
+    list_size = tracemalloc.get_traced_memory()[0]
+    columns = parameterize_splines(splines, max_dx=.6, max_dy=.005, columnar=True)
+    columns_size = tracemalloc.get_traced_memory()[0] - list_size
+    tracemalloc.stop()
+
+    print("trajectory point storage: {} points".format(len(listed)))
+    print("  list of TrajectoryPoint {:.1f} bytes per sample, TrajectoryPoints {:.1f} bytes per sample ({:.1f} in the columns)".format(
+        list_size / len(listed), columns_size / len(columns), columns.get_size() / len(columns)))
+
+def get_timing(points):
+    """Returns the (t, velocity, acceleration, distance) of every point"""
+    return [(p.t, p.velocity, p.acceleration, p.distance) for p in points]
+
+def benchmark_time_parameterize(count):
+    """Times the object loop (time_parameterize_states) against the array kernel on a list and on TrajectoryPoints"""
+    points = get_points(count)
+    print("time parameterization: {} points".format(len(points)))
+
+    for reverse in [False, True]:
+        states = [TrajectoryPoint(p.pose) for p in points]
+        listed = [TrajectoryPoint(p.pose) for p in points]
+        columns = to_trajectory_points(states)
+
+        start_time = time.perf_counter()
+        time_parameterize_states(reverse, states, 0, 0, 120, 180, 120)
+        states_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        time_parameterize_trajectory(reverse, listed, 0, 0, 120, 180, 120)
+        list_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        time_parameterize_trajectory(reverse, columns, 0, 0, 120, 180, 120)
+        columns_time = time.perf_counter() - start_time
+
+        identical = get_timing(states) == get_timing(listed) == get_timing(columns)
+        print("  reverse={}: objects {:.1f}ms, list through kernel {:.1f}ms, columnar kernel {:.1f}ms, identical: {}".format(
+            reverse, states_time * 1E3, list_time * 1E3, columns_time * 1E3, identical))
+
+class TrajectoryStub:
+    """Just the parts of a Trajectory that TrajectoryIterator uses"""
+
+    reverse = False
+
+    def __init__(self, points):
+        """Constructs a TrajectoryStub object"""
+        self.points = points
+
+    def trajectory_length(self):
+        """Returns the index length of the trajectory"""
+        return len(self.points)
+
+def sample_linear(points, t):
+    """Reference: TrajectoryIterator.sample before the cursor, scanning every point from the start"""
+    if t >= points[-1].t:
+        return points[-1]
+    if t <= points[0].t:
+        return points[0]
+    for i in range(1, len(points)):
+        s = points[i]
+        if s.t >= t:
+            prev_s = points[i - 1]
+            if epsilon_equals(s.t, prev_s.t):
+                return s
+            return prev_s.interpolate(s, (t - prev_s.t) / (s.t - prev_s.t))
+
+def benchmark_iterator(count, samples):
+    """Times a linear scan against the cursor and binary search of TrajectoryIterator.sample, in order and at random"""
+    points = get_points(count)
+    time_parameterize_trajectory(False, points, 0, 0, 120, 180, 120)
+    end_t = points[-1].t
+    print("sampling: {} points, {:.1f}s".format(len(points), end_t))
+
+    random.seed(108)
+    in_order = [end_t * i / samples for i in range(samples)]
+    shuffled = [random.uniform(0, end_t) for _ in range(samples)]
+    for name, times in [("in order", in_order), ("random", shuffled)]:
+        start_time = time.perf_counter()
+        expected = [sample_linear(points, t) for t in times]
+        linear_time = time.perf_counter() - start_time
+
+        iterator = TrajectoryIterator(TrajectoryStub(points))
+        start_time = time.perf_counter()
+        actual = [iterator.sample(t) for t in times]
+        cursor_time = time.perf_counter() - start_time
+
+        identical = get_timing(expected) == get_timing(actual)
+        print("  {}: linear scan {:.1f}us, cursor + binary search {:.1f}us per sample, identical: {}".format(
+            name, linear_time / samples * 1E6, cursor_time / samples * 1E6, identical))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prints timings of the time parameterization and sampling kernels")
+    parser.add_argument("benchmarks", nargs="*", default=["pose", "smooth_knots", "memory", "time_parameterize", "iterator"],
+        help="pose, smooth_knots, memory, time_parameterize and/or iterator")
+    parser.add_argument("--points", type=int, default=100000, help="number of trajectory points")
+    parser.add_argument("--samples", type=int, default=2000, help="number of times sampled (per spline for pose)")
+    parser.add_argument("--dampings", type=float, nargs="+", default=[.01, .03, .05, .1, .2, .5], help="smooth knot dampings compared")
+    args = parser.parse_args()
+
+    if "pose" in args.benchmarks:
+        benchmark_pose(args.samples)
+    if "smooth_knots" in args.benchmarks:
+        benchmark_smooth_knots(args.dampings)
+    if "memory" in args.benchmarks:
+        benchmark_memory()
+    if "time_parameterize" in args.benchmarks:
+        benchmark_time_parameterize(args.points)
+    if "iterator" in args.benchmarks:
+        benchmark_iterator(args.points, args.samples)
@@ -7,6 +7,7 @@ Unittests for jsonIO
 """
 
 import unittest
+import json
 
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
@@ -18,6 +19,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from Trajectory.trajectory import Trajectory
 from Geometry.pose import Pose, to_pose
 from Util.jsonIO import JsonIO
+from Spline.quintic_hermite_spline import sum_dCurvature2
+from Spline.spline_optimizer import CancellationToken
 
 
 class jsonIOTest(unittest.TestCase):
@@ -60,6 +63,86 @@ class jsonIOTest(unittest.TestCase):
                 self.assertAlmostEqual(trajectory.poses[i].translation.y, trajectory2.poses[i].translation.y)
                 self.assertAlmostEqual(trajectory.poses[i].rotation.get_degrees(), trajectory2.poses[i].rotation.get_degrees())
 
+    def test_save_load_optimized(self):
+        """Tests that optimized splines are restored if the poses didn't change"""
+
+        poses = []
+        poses.append(to_pose())
+        poses.append(to_pose(100, 300, 40))
+        poses.append(to_pose(320, 350, 135))
+        poses.append(to_pose(90, -100, -180))
+
+        trajectory = Trajectory("Optimized", poses)
+        trajectory.optimize_splines()
+        other = Trajectory("Moved", [to_pose(p.translation.x, p.translation.y, p.rotation.get_degrees()) for p in poses])
+        other.optimize_splines()
+        unoptimized = Trajectory("Unoptimized", [to_pose(p.translation.x, p.translation.y, p.rotation.get_degrees()) for p in poses])
+
+        IO = JsonIO(path="Test/", name="jsonIO_unittest.json")
+        IO.save_trajectories([trajectory, other, unoptimized])
+
+        # Move a pose in the saved file: its knots no longer apply
+        with open(IO.file_name, "r") as f:
+            data = json.load(f)
+        data["Moved"][1][1][0] += 1.0
+        with open(IO.file_name, "w") as f:
+            json.dump(data, f)
+
+        trajectories = {}
+        for t in IO.load_trajectories():
+            trajectories[t.name] = t
+
+        trajectory2 = trajectories["Optimized"]
+        self.assertTrue(trajectory2.optimized)
+        self.assertEqual(trajectory.get_fingerprint(), trajectory2.get_fingerprint())
+        for i in range(len(trajectory.splines)):
+            with self.subTest(i=i):
+                self.assertAlmostEqual(trajectory.splines[i].ddx0, trajectory2.splines[i].ddx0)
+                self.assertAlmostEqual(trajectory.splines[i].ddy1, trajectory2.splines[i].ddy1)
+        self.assertAlmostEqual(trajectory.drive_time, trajectory2.drive_time)
+
+        self.assertFalse(trajectories["Moved"].optimized)
+        self.assertFalse(trajectories["Unoptimized"].optimized)
+        self.assertEqual(2, len(data["Unoptimized"]))
+
+        with self.assertRaises(ValueError):
+            trajectory2.set_knots([[0.0, 0.0]])
+
+
+    def test_save_load_cancelled(self):
+        """Tests that knots saved after a cancelled optimization are restored as unfinished and can be resumed"""
+
+        poses = []
+        poses.append(to_pose())
+        poses.append(to_pose(100, 300, 40))
+        poses.append(to_pose(320, 350, 135))
+        poses.append(to_pose(90, -100, -180))
+
+        trajectory = Trajectory("Cancelled", poses)
+        token = CancellationToken()
+        token.cancel()
+        self.assertFalse(trajectory.optimize_splines(token=token))
+        self.assertTrue(trajectory.optimized)
+        self.assertFalse(trajectory.optimization_complete)
+
+        IO = JsonIO(path="Test/", name="jsonIO_unittest.json")
+        IO.save_trajectories([trajectory])
+        with open(IO.file_name, "r") as f:
+            self.assertFalse(json.load(f)["Cancelled"][2]["complete"])
+
+        trajectory2 = IO.load_trajectories()[0]
+        self.assertTrue(trajectory2.optimized)
+        self.assertFalse(trajectory2.optimization_complete)
+        self.assertEqual(trajectory.get_knots(), trajectory2.get_knots())
+
+        # Resumes from the saved knots instead of returning at once
+        cost = sum_dCurvature2(trajectory2.splines)
+        self.assertTrue(trajectory2.optimize_splines())
+        self.assertTrue(trajectory2.optimization_complete)
+        self.assertLess(sum_dCurvature2(trajectory2.splines), cost)
+
+        IO.save_trajectories([trajectory2])
+        self.assertTrue(IO.load_trajectories()[0].optimization_complete)
 
 if __name__ == "__main__":
     unittest.main()
@@ -14,6 +14,7 @@ https://github.com/SCsailors/2020RobotCode/blob/master/src/test/cpp/lib/Spline/Q
 import unittest
 import math
 import time
+import tracemalloc
 
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
@@ -23,11 +24,24 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 # F5 works because of adding Trajectory_Visualization directory to PYTHONPATH in .env file
 
 
-from Spline.quintic_hermite_spline import QuinticHermiteSpline, optimize_spline, fit_parabola, create_quintic_spline
+from Spline.quintic_hermite_spline import QuinticHermiteSpline, optimize_spline, fit_parabola, create_quintic_spline, create_quintic_splines, get_gradient, sum_dCurvature2, SplineCostCache, sum_dCurvature2_batch, estimate_dCurvature2, integrate_dCurvature2_adaptive, get_collinear_knots, move_knots, set_knot, solve_block_tridiagonal, SMOOTH_KNOTS, get_arc_lengths, get_spline_at_distance, get_pose_at_distance
+from Spline.quadrature import gauss_legendre_quadrature, get_gauss_legendre_nodes
+from Spline.spline_array import SplineArray, to_spline_array
+from Spline.spline_optimizer import minimize_spline, LBFGS, GRADIENT_DESCENT, CONVERGED, AnytimeOptimizer, CancellationToken, reoptimize_spline
+from Util.jsonIO import JsonIO
+from Trajectory.trajectory import Trajectory
 from Geometry.translation import Translation
 from Geometry.rotation import Rotation, from_degrees
 from Geometry.pose import Pose, to_pose
 
+def get_test_poses(count):
+    """Returns count poses weaving along a sine path (the shared optimization fixture)"""
+    return [to_pose(40.0 * i, 60.0 * math.sin(.9 * i), 30.0 * math.cos(1.7 * i)) for i in range(count)]
+
+def get_corner_poses(count=4):
+    """Returns the first count of the poses (0, 100, 270), (50, 0, 0), (100, 100, 90) and (150, 150, 0)"""
+    return [to_pose(0.0, 100.0, 270.0), to_pose(50.0, 0.0, 0.0), to_pose(100.0, 100.0, 90.0), to_pose(150.0, 150.0, 0.0)][:count]
+
 class SplineTest(unittest.TestCase):
     """Unittests for Spline folder"""
 
@@ -148,6 +162,475 @@ class SplineTest(unittest.TestCase):
         self.assertTrue(optimize_spline(splines1) < 0.16)
         print("Optimization time: {:.6}s".format(time.perf_counter() - start_time))
 
+    def test_lbfgs(self):
+        """Tests L-BFGS against gradient descent on the saved trajectories"""
+
+        IO = JsonIO(path=os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "Trajectory", ""))
+        trajectories = IO.load_trajectories()
+        self.assertTrue(len(trajectories) > 0)
+
+        descent_evaluations = 0
+        lbfgs_evaluations = 0
+        for trajectory in trajectories:
+            with self.subTest(name=trajectory.name):
+                descent = minimize_spline(create_quintic_splines(trajectory.poses), GRADIENT_DESCENT)
+                splines = create_quintic_splines(trajectory.poses)
+                lbfgs = minimize_spline(splines, LBFGS)
+
+                self.assertTrue(lbfgs.cost <= descent.cost + 1E-6)
+                self.assertAlmostEqual(sum_dCurvature2(splines), lbfgs.cost)
+                self.assertEqual(lbfgs.iterations + 1, len(lbfgs.history))
+                for i in range(1, len(lbfgs.history)):
+                    self.assertTrue(lbfgs.history[i] <= lbfgs.history[i - 1])
+                descent_evaluations += descent.function_evaluations
+                lbfgs_evaluations += lbfgs.function_evaluations
+
+        self.assertTrue(lbfgs_evaluations < descent_evaluations)
+
+        # Optimization test 1 from test_optimization
+        splines = create_quintic_splines(get_corner_poses(3))
+        result = minimize_spline(splines)
+        self.assertEqual(CONVERGED, result.stop_reason)
+        self.assertTrue(result.cost < 0.014)
+
+        with self.assertRaises(ValueError):
+            minimize_spline(splines, "newton")
+
+    def test_anytime_optimizer(self):
+        """Tests that a budgeted, cancellable optimization resumes to the same result as minimize_spline"""
+
+        poses = [to_pose(0.0, 0.0, 0.0)]
+        for i in range(1, 6):
+            poses.append(to_pose(60.0 * i, 40.0 * (i % 3), 45.0 * (i % 5)))
+
+        for method in [GRADIENT_DESCENT, LBFGS]:
+            with self.subTest(method=method):
+                expected = minimize_spline(create_quintic_splines(poses), method)
+
+                splines = create_quintic_splines(poses)
+                optimizer = AnytimeOptimizer(splines, method)
+                token = CancellationToken()
+                token.cancel()
+                result = optimizer.run(token=token)
+                self.assertEqual(0, result.iterations)
+                self.assertFalse(optimizer.is_done())
+
+                # Costs at each checkpoint never increase
+                costs = [result.cost]
+                checkpoints = 0
+                while not optimizer.is_done():
+                    result = optimizer.run(budget=0.0)
+                    best = optimizer.get_best_splines()
+                    self.assertAlmostEqual(result.cost, sum_dCurvature2(best))
+                    self.assertTrue(result.cost <= costs[-1])
+                    costs.append(result.cost)
+                    checkpoints += 1
+
+                self.assertTrue(checkpoints > 1)
+                self.assertAlmostEqual(expected.cost, result.cost)
+                self.assertEqual(expected.iterations, result.iterations)
+                self.assertEqual(expected.stop_reason, result.stop_reason)
+                self.assertAlmostEqual(result.cost, sum_dCurvature2(splines))
+
+        with self.assertRaises(ValueError):
+            AnytimeOptimizer(splines, "newton")
+
+    def test_perturbation_allocation(self):
+        """Tests that moving knots in place doesn't allocate (a single QuinticHermiteSpline is ~2KB)"""
+
+        poses = [to_pose(60.0 * i, 40.0 * (i % 3), 45.0 * (i % 5)) for i in range(18)]
+        poses += [to_pose(1200.0, 0.0, 0.0), to_pose(1250.0, 0.0, 0.0), to_pose(1300.0, 0.0, 0.0)] # Last knot is collinear
+        splines = create_quintic_splines(poses)
+        collinear = get_collinear_knots(splines)
+        self.assertEqual(len(splines) - 1, len(collinear))
+        self.assertTrue(collinear[-1])
+        self.assertFalse(collinear[0])
+
+        control_points = get_gradient(splines, True, None, collinear)
+        knots = [(s.ddx1, s.ddy1) for s in splines]
+
+        tracemalloc.start()
+        move_knots(splines, collinear, control_points, 1.0)
+        move_knots(splines, collinear, control_points, -1.0)
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+
+        for i in range(10):
+            move_knots(splines, collinear, control_points, 1.0)
+            move_knots(splines, collinear, control_points, -1.0)
+        for i in range(len(splines) - 1):
+            set_knot(splines, i, splines[i].ddx1 + 1.0, splines[i].ddy1)
+            set_knot(splines, i, splines[i].ddx1 - 1.0, splines[i].ddy1)
+
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # Allow for a few floats from the interpreter's float free list
+        self.assertLess(current - start, 1000)
+        self.assertLess(peak - start, 1000)
+
+        for i in range(len(splines)):
+            with self.subTest(i=i):
+                self.assertAlmostEqual(knots[i][0], splines[i].ddx1)
+                self.assertAlmostEqual(knots[i][1], splines[i].ddy1)
+        self.assertAlmostEqual(0.0, splines[-1].ddx1)
+
+    def test_reoptimize_spline(self):
+        """Tests warm started re-optimization of the knots around a moved pose"""
+
+        poses = get_test_poses(31)
+        optimized = create_quintic_splines(poses)
+        minimize_spline(optimized)
+
+        moved = [to_pose(p.translation.x, p.translation.y, p.rotation.get_degrees()) for p in poses]
+        moved[15] = to_pose(poses[15].translation.x, poses[15].translation.y + 5.0, poses[15].rotation.get_degrees())
+        expected = create_quintic_splines(moved)
+        minimize_spline(expected)
+
+        for tolerance in [float("inf"), 0.0]:
+            with self.subTest(tolerance=tolerance):
+                # Warm start: previous knots on the new splines
+                splines = create_quintic_splines(moved)
+                for i in range(len(splines) - 1):
+                    splines[i].ddx1 = splines[i + 1].ddx0 = optimized[i].ddx1
+                    splines[i].ddy1 = splines[i + 1].ddy0 = optimized[i].ddy1
+                for s in splines:
+                    s.compute_coefficients()
+
+                result = reoptimize_spline(splines, 15, tolerance=tolerance)
+
+                self.assertAlmostEqual(result.cost, sum_dCurvature2(splines))
+                self.assertTrue(result.cost <= result.history[0])
+                self.assertAlmostEqual(1.0, result.cost / sum_dCurvature2(expected), 2)
+
+                # Knots outside the first window (knots 12 to 16) only move if the window widened
+                changed = [i for i in range(len(splines) - 1) if splines[i].ddx1 != optimized[i].ddx1]
+                if tolerance == 0.0:
+                    self.assertTrue(min(changed) < 12 or max(changed) > 16)
+                else:
+                    self.assertTrue(min(changed) >= 12 and max(changed) <= 16)
+
+    def test_smooth_knots(self):
+        """Tests the single solve smooth spline mode against zero knots and optimize_spline"""
+
+        # Block tridiagonal solve of a known system
+        lower = [(0.0, 0.0, 0.0, 0.0), (1.0, 0.0, 0.0, 1.0), (.5, .5, 0.0, 1.0)]
+        diagonal = [(4.0, 1.0, 1.0, 3.0), (5.0, 0.0, 1.0, 4.0), (3.0, 1.0, 0.0, 2.0)]
+        upper = [(1.0, 0.0, 0.0, 1.0), (0.0, 1.0, 1.0, 0.0), (0.0, 0.0, 0.0, 0.0)]
+        x = [(1.0, -1.0), (2.0, .5), (-1.0, 3.0)]
+        rhs = []
+        for i in range(3):
+            r = [diagonal[i][0] * x[i][0] + diagonal[i][1] * x[i][1], diagonal[i][2] * x[i][0] + diagonal[i][3] * x[i][1]]
+            if i > 0:
+                r[0] += lower[i][0] * x[i - 1][0] + lower[i][1] * x[i - 1][1]
+                r[1] += lower[i][2] * x[i - 1][0] + lower[i][3] * x[i - 1][1]
+            if i < 2:
+                r[0] += upper[i][0] * x[i + 1][0] + upper[i][1] * x[i + 1][1]
+                r[1] += upper[i][2] * x[i + 1][0] + upper[i][3] * x[i + 1][1]
+            rhs.append(r)
+        for expected, actual in zip(x, solve_block_tridiagonal(lower, diagonal, upper, rhs)):
+            self.assertAlmostEqual(expected[0], actual[0])
+            self.assertAlmostEqual(expected[1], actual[1])
+
+        poses = get_test_poses(21)
+        poses.extend([to_pose(820.0, 0.0, 0.0), to_pose(860.0, 0.0, 0.0), to_pose(900.0, 0.0, 0.0)])
+        zero = create_quintic_splines(poses)
+        smooth = create_quintic_splines(poses, SMOOTH_KNOTS)
+        optimized = create_quintic_splines(poses)
+        optimize_spline(optimized)
+
+        # One solve gets most of the way from the zero knots to the optimum
+        self.assertTrue(sum_dCurvature2(smooth) < sum_dCurvature2(zero))
+        self.assertTrue(sum_dCurvature2(optimized) <= sum_dCurvature2(smooth))
+        self.assertLess(sum_dCurvature2(smooth) - sum_dCurvature2(optimized), .25 * (sum_dCurvature2(zero) - sum_dCurvature2(optimized)))
+
+        # Same poses and continuity, collinear knots untouched
+        for i in range(len(smooth)):
+            with self.subTest(i=i):
+                self.assertEqual(zero[i].x0, smooth[i].x0)
+                self.assertEqual(zero[i].dy1, smooth[i].dy1)
+                if i > 0:
+                    self.assertEqual(smooth[i - 1].ddx1, smooth[i].ddx0)
+                    self.assertEqual(smooth[i - 1].ddy1, smooth[i].ddy0)
+        self.assertEqual(0, smooth[-1].ddx0)
+        self.assertEqual(0, smooth[-1].ddy0)
+
+        with self.assertRaises(ValueError):
+            create_quintic_splines(poses, "cubic")
+
+    def test_arc_length(self):
+        """Tests the cached arc length table, its inversion and invalidation"""
+
+        spline = create_quintic_spline(to_pose(0, 0, 0), to_pose(100, 50, 90))
+
+        # Midpoint rule with many samples as the reference
+        samples = 20000
+        expected = sum([spline.get_velocity((i + .5) / samples) for i in range(samples)]) / samples
+        self.assertAlmostEqual(expected, spline.get_arc_length(), 5)
+        self.assertEqual(0.0, spline.get_arc_length(0.0))
+
+        for distance in [0.0, 10.0, 50.5, 87.0, spline.get_arc_length()]:
+            with self.subTest(distance=distance):
+                self.assertAlmostEqual(distance, spline.get_arc_length(spline.get_t(distance)))
+        self.assertEqual(0.0, spline.get_t(-1.0))
+        self.assertEqual(1.0, spline.get_t(1000.0))
+
+        # New coefficients invalidate the table
+        length = spline.get_arc_length()
+        spline.ddx1 = 500.0
+        spline.compute_coefficients()
+        self.assertIsNone(spline.arc_length_table)
+        self.assertNotAlmostEqual(length, spline.get_arc_length())
+
+        # Distance along a path matches the parameterized points (chords slightly undercut the arc)
+        poses = get_test_poses(11)
+        trajectory = Trajectory("Arc Length", poses)
+        lengths = get_arc_lengths(trajectory.splines)
+        self.assertAlmostEqual(1.0, trajectory.points[-1].distance / lengths[-1], 3)
+        for point in trajectory.points[::25]:
+            with self.subTest(distance=point.distance):
+                pose = get_pose_at_distance(trajectory.splines, point.distance, lengths)
+                self.assertTrue(pose.distance(point.pose) < .1)
+        self.assertEqual((len(poses) - 2, 1.0), get_spline_at_distance(trajectory.splines, lengths[-1] + 1.0, lengths))
+
+    def test_analytic_gradient(self):
+        """Tests the analytic gradient against finite differences"""
+
+        splines = create_quintic_splines(get_corner_poses())
+
+        # Move away from the default knots so every partial is non-trivial
+        splines[0].ddx1 = splines[1].ddx0 = 13.0
+        splines[0].ddy1 = splines[1].ddy0 = -7.0
+        splines[0].compute_coefficients()
+        splines[1].compute_coefficients()
+
+        analytic = get_gradient(splines)
+        finite_difference = get_gradient(splines, analytic_gradient=False)
+
+        self.assertEqual(len(splines) - 1, len(analytic))
+        for i in range(len(analytic)):
+            with self.subTest(i=i):
+                self.assertAlmostEqual(finite_difference[i].ddx, analytic[i].ddx, delta=1E-4 * abs(analytic[i].ddx) + 1E-9)
+                self.assertAlmostEqual(finite_difference[i].ddy, analytic[i].ddy, delta=1E-4 * abs(analytic[i].ddy) + 1E-9)
+
+        # Both modes should converge to the same optimum
+        splines1 = create_quintic_splines(get_corner_poses(3))
+        splines2 = create_quintic_splines(get_corner_poses(3))
+        self.assertAlmostEqual(optimize_spline(splines2, analytic_gradient=False), optimize_spline(splines1), places=5)
+
+    def test_sum_dCurvature2_batch(self):
+        """Tests the batched dCurvature2 integral against the scalar reference"""
+
+        splines = create_quintic_splines(get_corner_poses())
+        splines.append(create_quintic_spline())
+        splines.append(QuinticHermiteSpline(0, 10, 5, 5, 3, -2, 0, 10, 5, -5, 1, 4))
+
+        for samples in [QuinticHermiteSpline.SAMPLES, 7]:
+            costs = sum_dCurvature2_batch(splines, samples)
+            self.assertEqual(len(splines), len(costs))
+            for i in range(len(splines)):
+                with self.subTest(samples=samples, i=i):
+                    dt = 1.0 / samples
+                    expected = 0.0
+                    for j in range(samples):
+                        expected += dt * splines[i].get_dCurvature2(j * dt)
+                    self.assertAlmostEqual(1.0, costs[i] / expected if expected != 0 else 1.0)
+
+        self.assertAlmostEqual(sum([s.sum_dCurvature2() for s in splines]), sum_dCurvature2(splines))
+        self.assertEqual([], sum_dCurvature2_batch([]))
+
+    def test_quadrature(self):
+        """Tests Gauss-Legendre quadrature of dCurvature2 against a high resolution Riemann sum"""
+
+        # An order n rule integrates polynomials up to degree 2n - 1 exactly
+        for order in [1, 2, 5, 8]:
+            nodes, weights = get_gauss_legendre_nodes(order)
+            for degree in range(2 * order):
+                with self.subTest(order=order, degree=degree):
+                    expected = 2.0 / (degree + 1) if degree % 2 == 0 else 0.0
+                    self.assertAlmostEqual(expected, sum([w * x ** degree for x, w in zip(nodes, weights)]))
+        self.assertRaises(ValueError, get_gauss_legendre_nodes, 0)
+
+        splines = create_quintic_splines(get_corner_poses())
+        reference = sum(sum_dCurvature2_batch(splines, 20000))
+
+        quadrature = gauss_legendre_quadrature(8, 4)
+        value, error, samples = estimate_dCurvature2(splines, quadrature)
+        self.assertEqual(32, samples)
+        self.assertAlmostEqual(1.0, value / reference, 6)
+        self.assertLess(error, 1E-6)
+        self.assertAlmostEqual(value, sum_dCurvature2(splines, quadrature=quadrature))
+        self.assertAlmostEqual(value, sum_dCurvature2(splines, SplineCostCache(quadrature)))
+
+        for s in splines:
+            value, error, samples = integrate_dCurvature2_adaptive(s, 1E-6)
+            with self.subTest(s=s):
+                self.assertAlmostEqual(sum_dCurvature2_batch([s], quadrature=gauss_legendre_quadrature(16, 16))[0], value, 6)
+                self.assertGreater(samples, 0)
+
+        # The analytic gradient integrates with the same rule
+        splines[1].ddx0 = splines[0].ddx1 = 13.0
+        splines[0].compute_coefficients()
+        splines[1].compute_coefficients()
+        delta = 1E-4
+        gradient = splines[0].sum_dCurvature2_gradient(quadrature)
+        splines[0].ddx1 += delta
+        splines[0].compute_coefficients()
+        high = sum_dCurvature2([splines[0]], quadrature=quadrature)
+        splines[0].ddx1 -= 2 * delta
+        splines[0].compute_coefficients()
+        low = sum_dCurvature2([splines[0]], quadrature=quadrature)
+        self.assertAlmostEqual(1.0, gradient[1] / ((high - low) / (2 * delta)), 5)
+
+    def test_get_derivatives(self):
+        """Tests the single pass derivative evaluation against the separate derivatives and the curvature definitions"""
+
+        s = QuinticHermiteSpline(50, 100, 60, 0, 3, -2, 0, 100, 0, 60, 1, 4)
+        for t in [0.0, .25, .6, 1.0]:
+            with self.subTest(t=t):
+                dx, dy, ddx, ddy, dddx, dddy = s.get_derivatives(t)
+                self.assertAlmostEqual(s.dx(t), dx)
+                self.assertAlmostEqual(s.dy(t), dy)
+                self.assertAlmostEqual(s.ddx(t), ddx)
+                self.assertAlmostEqual(s.ddy(t), ddy)
+                self.assertAlmostEqual(s.dddx(t), dddx)
+                self.assertAlmostEqual(s.dddy(t), dddy)
+
+                # Compare against the definitions of curvature and dCurvature
+                velocity = math.hypot(dx, dy)
+                curvature = (dx * ddy - ddx * dy) / (velocity * velocity * velocity)
+                dCurvature = ((dx * dddy - dddx * dy) * velocity * velocity - 3 * (dx * ddy - ddx * dy) * (dx * ddx + dy * ddy)) / velocity ** 5
+                self.assertAlmostEqual(curvature, s.get_curvature(t))
+                self.assertAlmostEqual(dCurvature, s.get_dCurvature(t))
+                self.assertAlmostEqual(curvature, s.get_pose(t).curvature)
+                self.assertAlmostEqual(dCurvature / velocity, s.get_pose(t).dCurvature)
+
+    def test_evaluate(self):
+        """Tests evaluating a spline at many t against get_pose"""
+
+        splines = [create_quintic_spline(*get_corner_poses(2)), 
+            QuinticHermiteSpline(50, 100, 60, 0, 3, -2, 0, 100, 0, 60, 1, 4), create_quintic_spline()]
+        ts = [i / 20.0 for i in range(21)]
+
+        for s in splines:
+            xs, ys, headings, curvatures, dCurvatures = s.evaluate(ts)
+            self.assertEqual(len(ts), len(xs))
+            for i in range(len(ts)):
+                with self.subTest(s=s, t=ts[i]):
+                    pose = s.get_pose(ts[i])
+                    self.assertAlmostEqual(pose.translation.x, xs[i])
+                    self.assertAlmostEqual(pose.translation.y, ys[i])
+                    self.assertAlmostEqual(pose.rotation.get_radians(), headings[i])
+                    self.assertAlmostEqual(pose.curvature, curvatures[i])
+                    self.assertAlmostEqual(pose.dCurvature, dCurvatures[i])
+
+        self.assertEqual(0, len(splines[0].evaluate([])[0]))
+
+    def test_spline_array(self):
+        """Tests SplineArray against the list of QuinticHermiteSplines it was built from"""
+
+        splines = create_quintic_splines(get_corner_poses())
+        splines[1] = QuinticHermiteSpline(50, 100, 60, 0, 3, -2, 0, 100, 0, 60, 1, 4)
+
+        spline_array = to_spline_array(splines)
+        self.assertEqual(len(splines), len(spline_array))
+
+        for i in range(len(splines)):
+            for t in [0.0, .3, 1.0]:
+                with self.subTest(i=i, t=t):
+                    x, y = spline_array.get_point(i, t)
+                    self.assertAlmostEqual(splines[i].get_point(t).x, x)
+                    self.assertAlmostEqual(splines[i].get_point(t).y, y)
+
+                    dx, dy, ddx, ddy, dddx, dddy = spline_array.get_derivatives(i, t)
+                    self.assertAlmostEqual(splines[i].dx(t), dx)
+                    self.assertAlmostEqual(splines[i].ddy(t), ddy)
+                    self.assertAlmostEqual(splines[i].dddx(t), dddx)
+
+                    self.assertAlmostEqual(splines[i].get_heading(t).get_radians(), spline_array.get_heading(i, t).get_radians())
+                    self.assertAlmostEqual(splines[i].get_curvature(t), spline_array.get_curvature(i, t))
+                    self.assertAlmostEqual(splines[i].get_dCurvature(t), spline_array.get_dCurvature(i, t))
+
+        # Batch evaluation of (index, t) pairs matches each spline's own evaluate
+        indices = [0, 1, 1, 2, 0]
+        ts = [.5, 0.0, .7, 1.0, .2]
+        columns = spline_array.evaluate(indices, ts)
+        for j in range(len(indices)):
+            with self.subTest(index=indices[j], t=ts[j]):
+                expected = splines[indices[j]].evaluate([ts[j]])
+                for column, expected_column in zip(columns, expected):
+                    self.assertAlmostEqual(expected_column[0], column[j])
+        self.assertEqual(0, len(spline_array.evaluate([], [])[0]))
+        self.assertRaises(ValueError, spline_array.evaluate, [0, 1], [.5])
+
+        costs = spline_array.sum_dCurvature2()
+        for i in range(len(splines)):
+            self.assertAlmostEqual(splines[i].sum_dCurvature2(), costs[i])
+
+        # Moving a knot updates both segments that share it
+        spline_array.set_knot(0, 4.0, -3.0)
+        self.assertEqual((4.0, -3.0), spline_array.get_knot(0))
+        splines2 = spline_array.to_splines()
+        self.assertAlmostEqual(4.0, splines2[0].ddx1)
+        self.assertAlmostEqual(-3.0, splines2[1].ddy0)
+        for i in range(len(splines)):
+            with self.subTest(i=i):
+                self.assertEqual(spline_array.get_coefficients(i), (splines2[i].Ax, splines2[i].Bx, splines2[i].Cx, splines2[i].Dx, splines2[i].Ex, splines2[i].Fx, 
+                    splines2[i].Ay, splines2[i].By, splines2[i].Cy, splines2[i].Dy, splines2[i].Ey, splines2[i].Fy))
+
+        # Only interior knots, checked before anything is written
+        boundaries = spline_array.boundaries[:]
+        for index in (-1, len(splines) - 1, len(splines)):
+            with self.subTest(index=index):
+                with self.assertRaises(ValueError):
+                    spline_array.set_knot(index, 1.0, 1.0)
+                with self.assertRaises(ValueError):
+                    spline_array.get_knot(index)
+        self.assertEqual(boundaries, spline_array.boundaries)
+        last = len(splines) - 2
+        spline_array.set_knot(last, 2.0, 5.0)
+        self.assertEqual((2.0, 5.0), spline_array.get_knot(last))
+        self.assertEqual((2.0, 5.0), (spline_array.to_splines()[last + 1].ddx0, spline_array.to_splines()[last + 1].ddy0))
+
+        self.assertEqual(0, len(SplineArray()))
+
+    def test_cost_cache(self):
+        """Tests SplineCostCache only re-integrates modified splines"""
+
+        splines = create_quintic_splines(get_corner_poses())
+
+        cache = SplineCostCache()
+        self.assertAlmostEqual(sum_dCurvature2(splines), sum_dCurvature2(splines, cache))
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(3, cache.misses)
+
+        # Only the spline with new coefficients is re-integrated
+        splines[2].ddx0 = 5.0
+        splines[2].compute_coefficients()
+        self.assertAlmostEqual(sum_dCurvature2(splines), sum_dCurvature2(splines, cache))
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(4, cache.misses)
+
+        # Local costs look up the two splines around the knot and don't store probes
+        self.assertAlmostEqual(splines[1].sum_dCurvature2() + splines[2].sum_dCurvature2(), cache.get_local_cost(splines, 1))
+        self.assertEqual(4, cache.hits)
+        self.assertEqual(4, cache.misses)
+        set_knot(splines, 1, 1.0, 1.0)
+        self.assertAlmostEqual(splines[1].sum_dCurvature2() + splines[2].sum_dCurvature2(), cache.get_local_cost(splines, 1))
+        self.assertEqual(4, cache.hits)
+        self.assertEqual(6, cache.misses)
+        self.assertAlmostEqual(sum_dCurvature2(splines), sum_dCurvature2(splines, cache))
+        self.assertEqual(5, cache.hits)
+        self.assertEqual(8, cache.misses)
+
+        # Optimizing with a cache gives the same result and skips integrations
+        for analytic_gradient in [True, False]:
+            with self.subTest(analytic_gradient=analytic_gradient):
+                splines1 = create_quintic_splines(get_corner_poses())
+                splines2 = create_quintic_splines(get_corner_poses())
+                cache = SplineCostCache()
+                self.assertAlmostEqual(optimize_spline(splines1, analytic_gradient), optimize_spline(splines2, analytic_gradient, cache))
+                self.assertTrue(cache.hits > 0)
+
 
 if __name__ == '__main__':
     unittest.main()
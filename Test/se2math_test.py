@@ -246,6 +246,14 @@ class SE2MathTest(unittest.TestCase):
         self.assertAlmostEqual(-.4, pose1.curvature)
         self.assertAlmostEqual(.2, pose1.dCurvature)
 
+        # Test copy
+        pose1 = pose.copy()
+        pose1.translation.x = 5.0
+        pose1.rotation.cos_angle = 1.0
+        self.assertAlmostEqual(4, pose.translation.x)
+        self.assertAlmostEqual(-45, pose.rotation.get_degrees())
+        self.assertAlmostEqual(.4, pose1.curvature)
+
         # Test is_collinear
         pose1 = to_pose(3.0, 4.0, 90.0)
         pose2 = to_pose(13.0, -6.0, 0.0)
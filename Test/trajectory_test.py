@@ -8,6 +8,9 @@ Unittests for Trajectory
 
 import unittest
 import math
+import time
+import random
+import tracemalloc
 
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
@@ -18,10 +21,21 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 
 from Geometry.pose import Pose, to_pose
 from Geometry.trajectory_point import TrajectoryPoint
+from Geometry.trajectory_points import TrajectoryPoints, to_trajectory_points
+from Geometry.translation import Translation
 
 from Trajectory.trajectory import Trajectory, mirror_trajectory
 from Trajectory.trajectory_iterator import TrajectoryIterator
-from Trajectory.trajectory_util import time_parameterize_trajectory, parameterize_splines
+from Trajectory.trajectory_util import time_parameterize_trajectory, time_parameterize_states, get_max_velocities, get_max_velocity, parameterize_splines, TimingProfile, get_segment_arc, get_segment_arcs, MAXDX, MAXDY, MAXDTHETA
+from Trajectory.batch_optimizer import optimize_trajectories, apply_results, get_summary
+from Trajectory.segment_cache import SegmentCache
+from Trajectory.simulator import simulate, simulate_batch, create_controller, RamseteController, PurePursuitController
+from Spline.quintic_hermite_spline import create_quintic_splines, create_quintic_spline
+from Spline.spline_optimizer import LBFGS
+
+def get_test_poses(count):
+    """Returns count poses weaving along a sine path (the shared optimization fixture)"""
+    return [to_pose(40.0 * i, 60.0 * math.sin(.9 * i), 30.0 * math.cos(1.7 * i)) for i in range(count)]
 
 class TractoryTest(unittest.TestCase):
     """Class to test Trajectories"""
@@ -52,6 +66,428 @@ class TractoryTest(unittest.TestCase):
                 file.write(t.__str__() + "\n")
         
 
+    def test_optimize_splines_budget(self):
+        """Tests resuming a budgeted Trajectory optimization"""
+
+        poses = [to_pose(), to_pose(50, 100, 90), to_pose(100, 150, 0), to_pose(200, 100, -45), to_pose(250, 0, 0)]
+        expected = Trajectory(poses=[to_pose(p.translation.x, p.translation.y, p.rotation.get_degrees()) for p in poses])
+        expected.optimize_splines()
+
+        traj = Trajectory(poses=poses)
+        calls = 1
+        while not traj.optimize_splines(budget=0.0):
+            self.assertTrue(traj.optimized)
+            self.assertTrue(len(traj.points) > 0)
+            calls += 1
+
+        self.assertTrue(calls > 1)
+        self.assertIsNone(traj.optimizer)
+        self.assertAlmostEqual(expected.optimization_result.cost, traj.optimization_result.cost)
+        self.assertTrue(traj.optimize_splines())
+
+        # Changing a pose starts over
+        traj.add_pose(to_pose(300, 50, 0))
+        self.assertFalse(traj.optimized)
+
+    def test_optimize_splines_frame_budget(self):
+        """Tests that budgeted calls don't start steps that won't fit, so one call takes about the budget"""
+
+        poses = get_test_poses(30)
+        traj = Trajectory(poses=poses)
+        traj.optimize_splines(LBFGS, budget=0.0)
+        self.assertEqual(len(poses) - 1, len(traj.splines))
+
+        # A budget of a few steps (step times depend on the machine)
+        budget = 3.0 * traj.optimizer.step_time
+        call_times = []
+        previews = 0
+        for _ in range(10):
+            points = traj.points
+            start_time = time.perf_counter()
+            done = traj.optimize_splines(LBFGS, budget=budget)
+            call_times.append(time.perf_counter() - start_time)
+            previews += traj.points is not points
+            if done:
+                break
+
+        # Median, so a preview call or a busy machine doesn't fail the test
+        call_times.sort()
+        self.assertLess(call_times[len(call_times) // 2], 1.25 * budget)
+        self.assertTrue(0 < previews < len(call_times))
+
+    def test_incremental_update_pose(self):
+        """Tests that moving a pose of an optimized Trajectory keeps it optimized"""
+
+        poses = get_test_poses(12)
+        traj = Trajectory(poses=poses)
+        traj.optimize_splines()
+        knots = traj.get_knots()
+
+        traj.update_pose(9, poses[9].translation.y + 5.0, "y")
+        self.assertTrue(traj.optimized)
+        self.assertEqual(knots[:5], traj.get_knots()[:5])
+        self.assertNotEqual(knots[7], traj.get_knots()[7])
+        self.assertAlmostEqual(poses[9].translation.y, traj.splines[8].y1)
+        self.assertAlmostEqual(poses[9].translation.y, traj.splines[9].y0)
+
+        # Without incremental mode the Trajectory starts over
+        traj.incremental = False
+        traj.update_pose(9, poses[9].translation.y - 5.0, "y")
+        self.assertFalse(traj.optimized)
+        self.assertEqual([[0, 0]] * 10, traj.get_knots())
+
+    def test_segment_cache(self):
+        """Tests that cached segments give the same points and only edited segments are regenerated"""
+
+        poses = get_test_poses(8)
+        traj = Trajectory(poses=poses)
+        cache = traj.segment_cache
+        self.assertEqual(7, cache.spline_misses)
+        self.assertEqual(7, cache.point_misses)
+
+        expected = parameterize_splines(create_quintic_splines(poses))
+        self.assertEqual(len(expected), len(traj.points))
+        for a, b in zip(expected, traj.points):
+            self.assertEqual(a.pose.translation.x, b.pose.translation.x)
+            self.assertEqual(a.pose.translation.y, b.pose.translation.y)
+            self.assertEqual(a.pose.curvature, b.pose.curvature)
+
+        # Moving a pose only regenerates the 2 segments touching it
+        traj.update_pose(4, poses[4].translation.y + 5.0, "y")
+        self.assertEqual(9, cache.spline_misses)
+        self.assertEqual(5, cache.spline_hits)
+        self.assertEqual(9, cache.point_misses)
+        self.assertEqual(5, cache.point_hits)
+        self.assertEqual("splines: 5 hits, 9 misses, points: 5 hits, 9 misses", cache.__str__())
+
+        # Swapping poses back and forth reuses every segment the second time
+        traj.move_pose(2, 1)
+        misses = cache.point_misses
+        traj.move_pose(2, 1)
+        self.assertEqual(misses, cache.point_misses)
+
+        # Points are copied too, so changing a returned point doesn't change the next lookup
+        points = cache.get_points(traj.splines[0])
+        expected = [(p.pose.translation.x, p.pose.rotation.sin_angle, p.pose.curvature) for p in points]
+        points[1].pose.translation.x += 10.0
+        points[1].pose.rotation.sin_angle = 0.0
+        points[1].pose.curvature = 1.0
+        points[1].t = 5.0
+        actual = cache.get_points(traj.splines[0])
+        self.assertEqual(expected, [(p.pose.translation.x, p.pose.rotation.sin_angle, p.pose.curvature) for p in actual])
+        self.assertEqual(0.0, actual[1].t)
+
+        # Segments are copied, so optimizing doesn't change the cache
+        traj.optimize_splines()
+        self.assertEqual(0, cache.get_spline(poses[0], poses[1]).ddx1)
+
+        # The least recently used segments are removed first
+        cache = SegmentCache(2)
+        cache.get_splines(poses[:4])
+        self.assertEqual(2, len(cache.splines))
+        cache.get_spline(poses[0], poses[1])
+        self.assertEqual(4, cache.spline_misses)
+
+    def test_segment_arcs(self):
+        """Tests that the iterative subdivision gives identical points to the recursive reference"""
+
+        splines = create_quintic_splines([to_pose(), to_pose(100, 300, 40), to_pose(320, 350, 135), to_pose(90, -100, -180)])
+        curvy = create_quintic_spline(to_pose(0, 0, 0), to_pose(-50, 10, 170))
+        curvy.ddx0 = 400.0
+        curvy.ddy1 = -300.0
+        curvy.compute_coefficients()
+        splines.append(curvy)
+
+        for max_dy in [MAXDY, MAXDY / 10]:
+            for i, s in enumerate(splines):
+                with self.subTest(max_dy=max_dy, i=i):
+                    expected = []
+                    get_segment_arc(s, expected, 0.0, 1.0, MAXDX, max_dy, MAXDTHETA)
+                    actual = []
+                    get_segment_arcs(s, actual, 0.0, 1.0, MAXDX, max_dy, MAXDTHETA)
+
+                    self.assertEqual(len(expected), len(actual))
+                    for a, b in zip(expected, actual):
+                        self.assertEqual(a.pose.translation.x, b.pose.translation.x)
+                        self.assertEqual(a.pose.translation.y, b.pose.translation.y)
+                        self.assertEqual(a.pose.rotation.sin_angle, b.pose.rotation.sin_angle)
+                        self.assertEqual(a.pose.curvature, b.pose.curvature)
+
+    def test_trajectory_points(self):
+        """Tests that columnar TrajectoryPoints give the same states as lists of TrajectoryPoints in less memory"""
+
+        poses = get_test_poses(11)
+        splines = create_quintic_splines(poses)
+
+        tracemalloc.start()
+        expected = parameterize_splines(splines)
+        list_size = tracemalloc.get_traced_memory()[0]
+        actual = parameterize_splines(splines, columnar=True)
+        columnar_size = tracemalloc.get_traced_memory()[0] - list_size
+        tracemalloc.stop()
+        self.assertTrue(columnar_size * 4 < list_size)
+
+        for reverse in [False, True]:
+            time_parameterize_trajectory(reverse, expected, 5, 10, 120, 180, 120)
+            time_parameterize_trajectory(reverse, actual, 5, 10, 120, 180, 120)
+            self.assertEqual(len(expected), len(actual))
+            for i, (a, b) in enumerate(zip(expected, actual)):
+                with self.subTest(reverse=reverse, i=i):
+                    self.assertEqual(a.pose.translation.x, b.pose.translation.x)
+                    self.assertEqual(a.pose.rotation.sin_angle, b.pose.rotation.sin_angle)
+                    self.assertEqual(a.pose.dCurvature, b.pose.dCurvature)
+                    self.assertEqual(a.distance, b.distance)
+                    self.assertEqual(a.t, b.t)
+                    self.assertEqual(a.velocity, b.velocity)
+                    self.assertEqual(a.acceleration, b.acceleration)
+                    self.assertEqual(i, b.index_floor)
+
+        # Views write through to the columns, and round trip through lists
+        actual[-1].velocity = 1.0
+        self.assertEqual(1.0, actual.velocity[len(actual) - 1])
+        self.assertEqual(actual.t, to_trajectory_points(actual.to_list()).t)
+        with self.assertRaises(IndexError):
+            actual[len(actual)]
+
+        # A columnar Trajectory samples the same as a list Trajectory
+        traj = Trajectory(poses=poses)
+        columnar = Trajectory(poses=poses)
+        columnar.columnar = True
+        columnar.reset()
+        self.assertTrue(isinstance(columnar.points, TrajectoryPoints))
+        self.assertEqual(traj.drive_time, columnar.drive_time)
+        iterator = TrajectoryIterator(traj)
+        columnar_iterator = TrajectoryIterator(columnar)
+        for t in [-1.0, 0.0, .37, 1.5, traj.drive_time / 2, traj.drive_time + 1.0]:
+            with self.subTest(t=t):
+                a = iterator.sample(t)
+                b = columnar_iterator.sample(t)
+                self.assertEqual(a.t, b.t)
+                self.assertEqual(a.velocity, b.velocity)
+                self.assertEqual(a.pose.translation.y, b.pose.translation.y)
+
+    def test_time_parameterize_arrays(self):
+        """Tests that the array kernel gives identical states to the object by object reference"""
+
+        poses = get_test_poses(11)
+        points = parameterize_splines(create_quintic_splines(poses))
+        for reverse in [False, True]:
+            expected = [TrajectoryPoint(p.pose) for p in points]
+            actual = [TrajectoryPoint(p.pose) for p in points]
+            time_parameterize_states(reverse, expected, 5, 0, 100, 150, 80)
+            time_parameterize_trajectory(reverse, actual, 5, 0, 100, 150, 80)
+            for i, (a, b) in enumerate(zip(expected, actual)):
+                with self.subTest(reverse=reverse, i=i):
+                    self.assertEqual(a.distance, b.distance)
+                    self.assertEqual(a.t, b.t)
+                    self.assertEqual(a.velocity, b.velocity)
+                    self.assertEqual(a.acceleration, b.acceleration)
+                    self.assertEqual(a.max_acceleration, b.max_acceleration)
+                    self.assertEqual(a.min_acceleration, b.min_acceleration)
+                    self.assertEqual(a.index_ceil, b.index_ceil)
+
+        curvatures = [0.0, 1e-13, -.5, .02, 3.0, -3.0, math.inf, -math.inf]
+        limits = get_max_velocities(curvatures, 100, 80)
+        for k, limit in zip(curvatures, limits):
+            with self.subTest(curvature=k):
+                self.assertEqual(get_max_velocity(TrajectoryPoint(to_pose(curvature=k)), 100, 80), limit)
+
+    def test_velocity_limit_cache(self):
+        """Tests that constraint changes reuse the geometry only terms and give the same states"""
+
+        poses = get_test_poses(11)
+        traj = Trajectory(poses=poses)
+        cache = traj.velocity_limit_cache
+        self.assertEqual(1, cache.misses)
+
+        # Only max_velocity and max_centr_acceleration change the limits
+        for index, value in [(1, 150), (3, 10), (4, 20), (2, 90), (0, 100)]:
+            with self.subTest(index=index):
+                traj.update_constraint(value, index)
+                self.assertIs(cache, traj.velocity_limit_cache)
+
+                expected = [TrajectoryPoint(p.pose) for p in traj.points]
+                time_parameterize_trajectory(traj.reverse, expected, traj.start_velocity, traj.end_velocity, traj.max_velocity, traj.max_abs_acceleration, traj.max_centr_acceleration)
+                for a, b in zip(expected, traj.points):
+                    self.assertEqual(a.t, b.t)
+                    self.assertEqual(a.velocity, b.velocity)
+                    self.assertEqual(a.acceleration, b.acceleration)
+        self.assertEqual(3, cache.misses)
+        self.assertEqual(20, traj.end_velocity)
+        self.assertEqual(20, traj.points[-1].velocity)
+
+        # New points get a new cache
+        traj.update_pose(5, poses[5].translation.y + 5.0, "y")
+        self.assertIsNot(cache, traj.velocity_limit_cache)
+
+    def test_incremental_retiming(self):
+        """Tests that re-timing only the states a start or end velocity changes gives the same profile as a full re-timing"""
+
+        poses = get_test_poses(11)
+        traj = Trajectory(poses=poses)
+        traj.columnar = True
+        traj.reset()
+
+        # Includes velocities above what's reachable, so some changes reach the other end of the path
+        for index, value in [(3, 20), (4, 30), (3, 0), (4, 0), (3, 500), (4, 500), (3, 60), (4, 5)]:
+            with self.subTest(index=index, value=value):
+                traj.update_constraint(value, index)
+                self.assertEqual(1, traj.velocity_limit_cache.misses)
+
+                expected = TrajectoryPoints()
+                expected.extend(traj.points)
+                time_parameterize_trajectory(traj.reverse, expected, traj.start_velocity, traj.end_velocity, traj.max_velocity, traj.max_abs_acceleration, traj.max_centr_acceleration)
+                self.assertEqual(expected.t, traj.points.t)
+                self.assertEqual(expected.velocity, traj.points.velocity)
+                self.assertEqual(expected.acceleration, traj.points.acceleration)
+
+        # One and two state profiles
+        for steps, limits in [([], [100.0]), ([5.0], [100.0, 100.0])]:
+            with self.subTest(n=len(limits)):
+                profile = TimingProfile(steps, limits, 0.0, 0.0, 100, 150)
+                profile.update(10.0, 20.0)
+                expected = TimingProfile(steps, limits, 10.0, 20.0, 100, 150)
+                self.assertEqual(expected.get_timing(True), profile.get_timing(True))
+
+    def test_iterator_search(self):
+        """Tests that the cursor and binary search sample the same interval as a linear scan"""
+
+        poses = get_test_poses(11)
+        traj = Trajectory(poses=poses)
+        iterator = TrajectoryIterator(traj)
+
+        # Playback, random access and going backwards
+        random.seed(108)
+        times = [.01 * i for i in range(int(traj.drive_time * 100) + 2)]
+        times += [random.uniform(-1.0, traj.drive_time + 1.0) for _ in range(200)]
+        times += times[::-7]
+        for t in times:
+            with self.subTest(t=t):
+                expected = 0
+                while expected < len(traj.points) and traj.points[expected].t < t:
+                    expected += 1
+                sample = iterator.sample(t)
+                if 0 < expected < len(traj.points):
+                    self.assertEqual(expected, iterator.cursor)
+                    self.assertEqual(traj.points[expected - 1].index_floor, sample.index_floor)
+                self.assertAlmostEqual(min(max(t, iterator.start_t), iterator.end_t), sample.t)
+
+    def test_sample_many(self):
+        """Tests that batch sampling gives the same states as sampling one time at a time"""
+
+        poses = get_test_poses(6)
+        traj = Trajectory(poses=poses)
+        iterator = TrajectoryIterator(traj)
+
+        random.seed(108)
+        times = [-1.0] + [.01 * i for i in range(int(traj.drive_time * 100) + 2)]
+        times += [random.uniform(-1.0, traj.drive_time + 1.0) for _ in range(100)]
+        samples = iterator.sample_many(times)
+        self.assertEqual(len(times), len(samples))
+
+        iterator.reset()
+        for t, sample in zip(times, samples):
+            with self.subTest(t=t):
+                expected = iterator.sample(t)
+                self.assertEqual(expected.pose.translation.x, sample.pose.translation.x)
+                self.assertEqual(expected.pose.translation.y, sample.pose.translation.y)
+                self.assertEqual(expected.pose.rotation.sin_angle, sample.pose.rotation.sin_angle)
+                self.assertEqual(expected.pose.curvature, sample.pose.curvature)
+                self.assertEqual(expected.t, sample.t)
+                self.assertEqual(expected.velocity, sample.velocity)
+                self.assertEqual(expected.distance, sample.distance)
+
+    def test_distance_queries(self):
+        """Tests sampling by distance and closest points against a linear scan"""
+
+        poses = get_test_poses(6)
+        traj = Trajectory(poses=poses)
+        iterator = TrajectoryIterator(traj)
+        length = traj.points[-1].distance
+
+        for i in range(101):
+            with self.subTest(distance=length * i / 100):
+                self.assertAlmostEqual(length * i / 100, iterator.sample_distance(length * i / 100).distance)
+        self.assertEqual(traj.points[-1].t, iterator.sample_distance(length + 1.0).t)
+
+        def get_closest(x, y):
+            return min(range(len(traj.points)), key=lambda i: math.hypot(traj.points[i].pose.translation.x - x, traj.points[i].pose.translation.y - y))
+
+        random.seed(108)
+        for _ in range(100):
+            x, y = random.uniform(-100.0, 300.0), random.uniform(-150.0, 150.0)
+            with self.subTest(x=x, y=y):
+                self.assertEqual(get_closest(x, y), iterator.get_closest_index(Translation(x, y)))
+
+        # Following the path with a hint
+        hint = iterator.get_closest_index(Translation(0.0, 0.0))
+        for i in range(0, len(traj.points), 5):
+            translation = traj.points[i].pose.translation
+            hint = iterator.get_closest_index(Translation(translation.x, translation.y + .5), hint)
+            self.assertEqual(get_closest(translation.x, translation.y + .5), hint)
+
+    def test_simulator(self):
+        """Tests that the controllers follow a trajectory from an initial error and batches don't depend on workers"""
+
+        poses = [to_pose(), to_pose(100, 100, 90), to_pose(200, 200, 0)]
+        trajectories = [Trajectory("Forward", poses), Trajectory("Reverse", poses, reverse=True)]
+
+        for trajectory in trajectories:
+            for controller in (RamseteController(), PurePursuitController()):
+                with self.subTest(name=trajectory.name, controller=controller.__str__()):
+                    result = simulate(trajectory, controller, initial_offset=(4.0, -4.0, .1))
+                    self.assertEqual(int(math.ceil(trajectory.drive_time * 100 - 1E-12)) + 1, len(result.t))
+                    self.assertAlmostEqual(trajectory.drive_time, result.t[-1], delta=.01)
+                    self.assertLess(abs(result.cross_track_error[-1]), 1.0)
+                    self.assertLess(abs(result.heading_error[-1]), .05)
+
+        self.assertLess(simulate(trajectories[0], RamseteController()).get_max_abs("cross_track_error"), 1.0)
+
+        controllers = [RamseteController(), RamseteController(.005, .5), create_controller("pure_pursuit", 12)]
+        serial = simulate_batch(trajectories, controllers, 1)
+        parallel = simulate_batch(trajectories, controllers, 2)
+        self.assertEqual(6, len(parallel))
+        for a, b in zip(serial, parallel):
+            with self.subTest(name=a.name, controller=a.controller):
+                self.assertEqual(a.controller, b.controller)
+                self.assertEqual(list(a.x), list(b.x))
+                self.assertEqual(list(a.cross_track_error), list(b.cross_track_error))
+
+        with self.assertRaises(ValueError):
+            create_controller("stanley")
+
+    def test_batch_optimizer(self):
+        """Tests that batch optimization doesn't depend on the number of workers"""
+
+        trajectories = []
+        for i in range(4):
+            poses = [to_pose(), to_pose(50 + 10 * i, 100, 90), to_pose(100, 150 - 20 * i, 0), to_pose(200, 100, -45 * i)]
+            trajectories.append(Trajectory("Batch{}".format(i), poses))
+
+        serial = optimize_trajectories(trajectories, 1)
+        parallel = optimize_trajectories(trajectories, 2)
+        summary = get_summary(parallel).split("\n")
+        self.assertEqual(len(trajectories) + 1, len(summary))
+        self.assertTrue(summary[-1].startswith("4 trajectories"))
+
+        self.assertEqual([t.name for t in trajectories], [r.name for r in parallel])
+        for a, b in zip(serial, parallel):
+            with self.subTest(name=a.name):
+                self.assertEqual(a.knots, b.knots)
+                self.assertEqual(a.fingerprint, b.fingerprint)
+                self.assertEqual(a.cost, b.cost)
+
+        apply_results(trajectories, parallel)
+        for t, r in zip(trajectories, parallel):
+            with self.subTest(name=t.name):
+                self.assertTrue(t.optimized)
+                self.assertEqual(r.knots, t.get_knots())
+
+        # Knots for different poses aren't applied
+        moved = Trajectory("Batch0", [to_pose(), to_pose(60, 100, 90), to_pose(100, 150, 0)])
+        apply_results([moved], parallel)
+        self.assertFalse(moved.optimized)
+
     def test_trajectory_iterator(self):
         """Tests Trajectory iterator class""" 
 
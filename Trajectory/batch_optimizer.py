@@ -0,0 +1,127 @@
+"""CS 108 Trajectory Visualization Project
+
+Optimizes a library of trajectories across a process pool without the GUI
+
+Usage: python Trajectory/batch_optimizer.py [--path Trajectory/] [--name Saved_Trajectories.json] [--workers N] [--method gradient_descent] [--save]
+
+Inspired by:
+https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+
+@author: Matthew Walstra (mjw64)
+@date: Fall, 2020
+"""
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+#https://chrisyeh96.github.io/2017/08/08/definitive-guide-python-imports.html
+# Number of os.path.dirname dependent on number of subfolders: goes up 1 directory each time
+# Uncomment top line if you want to use the run button in the top right
+# F5 works because of adding Trajectory_Visualization directory to PYTHONPATH in .env file
+
+from Geometry.pose import to_pose
+
+from Spline.quintic_hermite_spline import sum_dCurvature2
+from Spline.spline_optimizer import GRADIENT_DESCENT
+
+from Trajectory.trajectory import Trajectory
+
+from Util.jsonIO import JsonIO
+
+class BatchResult:
+    """Optimized knots and timing for one trajectory of a batch"""
+
+    def __init__(self, name="", fingerprint="", knots=[], cost=0.0, iterations=0, stop_reason="", optimize_time=0.0):
+        """Constructs a BatchResult object"""
+        self.name = name
+        self.fingerprint = fingerprint
+        self.knots = knots
+        self.cost = cost
+        self.iterations = iterations
+        self.stop_reason = stop_reason
+        self.optimize_time = optimize_time
+
+    def __str__(self):
+        """Returns BatchResult as a string"""
+        return "{}: {:.6f}, {} iterations, {}, {:.3f}s".format(self.name, self.cost, self.iterations, self.stop_reason, self.optimize_time)
+
+def to_batch_item(trajectory, method=GRADIENT_DESCENT):
+    """Returns a trajectory as plain data (the same lists JsonIO saves) to send to a worker process"""
+    IO = JsonIO()
+    return (trajectory.name, IO.properties_to_json(trajectory), IO.points_to_json(trajectory), method)
+
+def optimize_batch_item(item):
+    """Worker: rebuilds the trajectory from a batch item, optimizes it and returns a BatchResult"""
+    name, properties, points, method = item
+
+    poses = []
+    for p in points:
+        poses.append(to_pose(p[0], p[1], p[2]))
+    trajectory = Trajectory(name, poses, *properties)
+
+    start_time = time.perf_counter()
+    trajectory.optimize_splines(method)
+    optimize_time = time.perf_counter() - start_time
+
+    result = trajectory.optimization_result
+    return BatchResult(name, trajectory.get_fingerprint(), trajectory.get_knots(), sum_dCurvature2(trajectory.splines),
+        result.iterations, result.stop_reason, optimize_time)
+
+def optimize_trajectories(trajectories, workers=None, method=GRADIENT_DESCENT):
+    """Returns a BatchResult for each trajectory, in the same order (workers=1 runs in this process)
+
+    Each trajectory is optimized independently from the same saved data, so results don't depend on workers
+    """
+    items = [to_batch_item(t, method) for t in trajectories]
+    if workers == 1 or len(items) <= 1:
+        return [optimize_batch_item(item) for item in items]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(optimize_batch_item, items))
+
+def apply_results(trajectories, results):
+    """Restores each trajectory's optimized splines from the BatchResult with its name and fingerprint"""
+    by_name = {}
+    for r in results:
+        by_name[r.name] = r
+
+    for t in trajectories:
+        if t.name in by_name and by_name[t.name].fingerprint == t.get_fingerprint():
+            t.set_knots(by_name[t.name].knots)
+
+def get_summary(results, total_time=None):
+    """Returns a per trajectory timing summary of a batch as a string"""
+    lines = []
+    for r in results:
+        lines.append(r.__str__())
+
+    optimize_time = sum([r.optimize_time for r in results])
+    lines.append("{} trajectories, {:.3f}s optimizing".format(len(results), optimize_time))
+    if total_time is not None:
+        lines.append("{:.3f}s wall time".format(total_time))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Optimizes every trajectory in a saved trajectory file")
+    parser.add_argument("--path", default="Trajectory/", help="directory of the trajectory file")
+    parser.add_argument("--name", default="Saved_Trajectories.json", help="trajectory file name")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of cores)")
+    parser.add_argument("--method", default=GRADIENT_DESCENT, help="gradient_descent or lbfgs")
+    parser.add_argument("--save", action="store_true", help="save the optimized knots back to the trajectory file")
+    args = parser.parse_args()
+
+    IO = JsonIO(args.path, args.name)
+    trajectories = IO.load_trajectories()
+
+    start_time = time.perf_counter()
+    results = optimize_trajectories(trajectories, args.workers, args.method)
+    total_time = time.perf_counter() - start_time
+
+    print(get_summary(results, total_time))
+
+    if args.save:
+        apply_results(trajectories, results)
+        IO.save_trajectories(trajectories)
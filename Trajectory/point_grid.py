@@ -0,0 +1,127 @@
+"""CS 108 Trajectory Visualization Project
+
+Uniform grid spatial index for closest point queries over the generated points of a trajectory
+
+Inspired by:
+https://github.com/Team254/FRC-2018-Public/blob/master/src/main/java/com/team254/lib/trajectory/DistanceView.java
+https://en.wikipedia.org/wiki/Nearest_neighbor_search#Approximation_methods
+
+@author: Matthew Walstra (mjw64)
+@date: Fall, 2020
+"""
+
+import math
+
+GRIDPOINTSPERCELL = 4 # average points along the path per cell side
+SEARCHWINDOW = 8 # points on each side of a hint
+
+class PointGrid:
+    """Buckets point indices by square cells so closest point queries only look at nearby cells"""
+
+    def __init__(self, xs, ys, cell_size=None):
+        """Constructs a PointGrid of the points (xs[i], ys[i]) (cell_size defaults to GRIDPOINTSPERCELL point spacings)"""
+        self.xs = xs
+        self.ys = ys
+
+        if cell_size is None:
+            length = sum([math.hypot(x1 - x0, y1 - y0) for x0, y0, x1, y1 in zip(xs, ys, xs[1:], ys[1:])])
+            cell_size = GRIDPOINTSPERCELL * length / max(1, len(xs) - 1)
+        if not cell_size > 0.0:
+            cell_size = 1.0
+        self.cell_size = cell_size
+
+        self.cells = {}
+        for i in range(len(xs)):
+            self.cells.setdefault(self.get_cell(xs[i], ys[i]), []).append(i)
+
+        # Cells outside the bounding box are empty, so rings are clipped to it
+        if len(xs) != 0:
+            self.min_cell = self.get_cell(min(xs), min(ys))
+            self.max_cell = self.get_cell(max(xs), max(ys))
+
+    def get_cell(self, x, y):
+        """Returns the (column, row) of the cell containing (x, y)"""
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def get_distance2(self, i, x, y):
+        """Returns the squared distance from point i to (x, y)"""
+        dx = self.xs[i] - x
+        dy = self.ys[i] - y
+        return dx * dx + dy * dy
+
+    def get_closest(self, x, y, hint=None, window=SEARCHWINDOW):
+        """Returns the index of the point closest to (x, y) (the lowest index of ties)
+
+        With a hint (the index returned by the last query), returns the closest point along the path near the hint:
+        the best point within window of the hint, followed downhill while it is at the edge of the window.
+        Queries that move along the path look at O(window) points; without a hint the grid is searched
+        """
+        n = len(self.xs)
+        if n == 0:
+            raise ValueError("PointGrid has no points")
+        if hint is None:
+            return self.search_grid(x, y)
+
+        hint = min(max(hint, 0), n - 1)
+        lo = max(0, hint - window)
+        hi = min(n - 1, hint + window)
+        best = min(range(lo, hi + 1), key=lambda i: self.get_distance2(i, x, y))
+
+        # Slide past the edge of the window while points keep getting closer
+        best_distance2 = self.get_distance2(best, x, y)
+        step = -1 if best == lo and lo != 0 else 1 if best == hi and hi != n - 1 else 0
+        while step != 0 and 0 <= best + step < n:
+            distance2 = self.get_distance2(best + step, x, y)
+            if distance2 >= best_distance2:
+                break
+            best += step
+            best_distance2 = distance2
+        return best
+
+    def search_grid(self, x, y):
+        """Returns the index of the point closest to (x, y) by searching rings of cells outward"""
+        column, row = self.get_cell(x, y)
+        (min_column, min_row), (max_column, max_row) = self.min_cell, self.max_cell
+        best = None
+        best_distance2 = math.inf
+
+        # Rings closer than the bounding box are empty and rings past its far corner add nothing
+        ring = max(0, min_column - column, column - max_column, min_row - row, row - max_row)
+        max_ring = max(column - min_column, max_column - column, row - min_row, max_row - row)
+        while ring <= max_ring:
+            for cell in self.get_ring(column, row, ring):
+                for i in self.cells.get(cell, ()):
+                    distance2 = self.get_distance2(i, x, y)
+                    if distance2 < best_distance2 or (distance2 == best_distance2 and i < best):
+                        best = i
+                        best_distance2 = distance2
+
+            # Points in later rings are further than the edge of this ring
+            if best is not None and self.get_ring_distance(x, y, column, row, ring) ** 2 > best_distance2:
+                break
+            ring += 1
+        return best
+
+    def get_ring(self, column, row, ring):
+        """Returns the cells of the bounding box at Chebyshev distance ring from (column, row)"""
+        (min_column, min_row), (max_column, max_row) = self.min_cell, self.max_cell
+        if ring == 0:
+            return [(column, row)]
+        cells = []
+        columns = range(max(min_column, column - ring), min(max_column, column + ring) + 1)
+        rows = range(max(min_row, row - ring + 1), min(max_row, row + ring - 1) + 1)
+        for r in (row - ring, row + ring):
+            if min_row <= r <= max_row:
+                cells.extend([(c, r) for c in columns])
+        for c in (column - ring, column + ring):
+            if min_column <= c <= max_column:
+                cells.extend([(c, r) for r in rows])
+        return cells
+
+    def get_ring_distance(self, x, y, column, row, ring):
+        """Returns the distance from (x, y) to the edge of the cells within ring of (column, row)"""
+        left = (column - ring) * self.cell_size
+        right = (column + ring + 1) * self.cell_size
+        bottom = (row - ring) * self.cell_size
+        top = (row + ring + 1) * self.cell_size
+        return min(x - left, right - x, y - bottom, top - y)
@@ -0,0 +1,104 @@
+"""CS 108 Trajectory Visualization Project
+
+Least recently used cache of spline segments and their parameterized points
+
+Inspired by:
+https://docs.python.org/3/library/collections.html#ordereddict-examples-and-recipes
+
+@author: Matthew Walstra (mjw64)
+@date: Fall, 2020
+"""
+
+from collections import OrderedDict
+
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+#https://chrisyeh96.github.io/2017/08/08/definitive-guide-python-imports.html
+# Number of os.path.dirname dependent on number of subfolders: goes up 1 directory each time
+# Uncomment top line if you want to use the run button in the top right
+# F5 works because of adding Trajectory_Visualization directory to PYTHONPATH in .env file
+
+from Geometry.trajectory_point import TrajectoryPoint
+
+from Spline.quintic_hermite_spline import create_quintic_spline
+
+from Trajectory.trajectory_util import parameterize_spline
+
+CACHECAPACITY = 256 # segments
+
+def get_pose_key(pose):
+    """Returns the exact values that define a pose for spline construction"""
+    return (pose.translation.x, pose.translation.y, pose.rotation.cos_angle, pose.rotation.sin_angle)
+
+def get_spline_key(spline):
+    """Returns the exact boundary values that define a spline"""
+    return (spline.x0, spline.x1, spline.dx0, spline.dx1, spline.ddx0, spline.ddx1,
+        spline.y0, spline.y1, spline.dy0, spline.dy1, spline.ddy0, spline.ddy1)
+
+class SegmentCache:
+    """Bounded LRU caches of splines keyed by their (p0, p1) poses and of parameterized points keyed by spline"""
+
+    def __init__(self, capacity=CACHECAPACITY):
+        """Constructs a SegmentCache object"""
+        self.capacity = capacity
+        self.splines = OrderedDict()
+        self.points = OrderedDict()
+
+        self.spline_hits = 0
+        self.spline_misses = 0
+        self.point_hits = 0
+        self.point_misses = 0
+
+    def get_spline(self, p0, p1):
+        """Returns a new copy of the QuinticHermiteSpline from p0 to p1 (copies can be optimized without changing the cache)"""
+        key = get_pose_key(p0) + get_pose_key(p1)
+        if key in self.splines:
+            self.spline_hits += 1
+            self.splines.move_to_end(key)
+        else:
+            self.spline_misses += 1
+            self.splines[key] = create_quintic_spline(p0, p1)
+            if len(self.splines) > self.capacity:
+                self.splines.popitem(last=False)
+        return self.splines[key].copy()
+
+    def get_splines(self, poses):
+        """Returns a list of QuinticHermiteSplines between consecutive poses, like create_quintic_splines"""
+        splines = []
+        for i in range(len(poses) - 1):
+            splines.append(self.get_spline(poses[i], poses[i + 1]))
+        return splines
+
+    def get_points(self, spline):
+        """Returns new TrajectoryPoints with copied poses for parameterize_spline(spline) (they may be changed in place)"""
+        key = get_spline_key(spline)
+        if key in self.points:
+            self.point_hits += 1
+            self.points.move_to_end(key)
+        else:
+            self.point_misses += 1
+            self.points[key] = parameterize_spline(spline)
+            if len(self.points) > self.capacity:
+                self.points.popitem(last=False)
+        return [TrajectoryPoint(p.pose.copy()) for p in self.points[key]]
+
+    def parameterize_splines(self, splines):
+        """Returns TrajectoryPoints for a list of splines, like parameterize_splines, reusing unchanged segments"""
+        rv = []
+        for s in splines:
+            points = self.get_points(s)
+
+            # Remove the first point of every segment after the first to avoid repeats
+            if len(rv) != 0:
+                points.pop(0)
+            rv.extend(points)
+        return rv
+
+    def clear(self):
+        """Removes every cached segment (counters are kept)"""
+        self.splines.clear()
+        self.points.clear()
+
+    def __str__(self):
+        """Returns SegmentCache as a string"""
+        return "splines: {} hits, {} misses, points: {} hits, {} misses".format(self.spline_hits, self.spline_misses, self.point_hits, self.point_misses)
@@ -0,0 +1,312 @@
+"""CS 108 Trajectory Visualization Project
+
+Headless path following simulation: steps a differential drive kinematic model at a fixed rate with a feedback
+controller and records the tracking error (no GUI, so it runs without Kivy)
+
+Usage: python Trajectory/simulator.py [--path Trajectory/] [--name Saved_Trajectories.json] [--controller ramsete] [--rate 100] [--workers N]
+
+Inspired by:
+https://github.com/Team254/FRC-2018-Public/blob/master/src/main/java/com/team254/lib/control/AdaptivePurePursuitController.java
+https://github.com/wpilibsuite/allwpilib/blob/main/wpimath/src/main/java/edu/wpi/first/math/controller/RamseteController.java
+https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+
+@author: Matthew Walstra (mjw64)
+@date: Fall, 2020
+"""
+
+import argparse
+import math
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+#https://chrisyeh96.github.io/2017/08/08/definitive-guide-python-imports.html
+# Number of os.path.dirname dependent on number of subfolders: goes up 1 directory each time
+# Uncomment top line if you want to use the run button in the top right
+# F5 works because of adding Trajectory_Visualization directory to PYTHONPATH in .env file
+
+from Geometry.pose import to_pose
+from Geometry.translation import Translation
+
+from Trajectory.trajectory import Trajectory
+from Trajectory.trajectory_iterator import TrajectoryIterator
+
+from Util.jsonIO import JsonIO
+from Util.util import EPSILON, limit
+
+SIMULATIONRATE = 100 # Hz
+TRACKWIDTH = 25 # inches
+RAMSETEB = .0013 # 1 / inches^2 (2 / meters^2)
+RAMSETEZETA = .7
+LOOKAHEAD = 24 # inches
+
+RAMSETE = "ramsete"
+PUREPURSUIT = "pure_pursuit"
+
+COLUMNS = ("t", "x", "y", "theta", "velocity", "angular_velocity", "along_track_error", "cross_track_error", "heading_error")
+
+def wrap_angle(angle):
+    """Returns angle in radians wrapped to [-pi, pi)"""
+    return (angle + math.pi) % (2.0 * math.pi) - math.pi
+
+class References:
+    """Reference robot state at every simulation step, sampled once from the trajectory
+
+    Reversing, the robot faces away from the path heading, so the heading is flipped and the curvature negated
+    """
+
+    def __init__(self, iterator, dt):
+        """Constructs References of iterator's trajectory every dt seconds"""
+        steps = int(math.ceil(iterator.end_t / dt - EPSILON)) + 1
+        samples = iterator.sample_many([i * dt for i in range(steps)])
+        direction = -1.0 if iterator.trajectory.reverse else 1.0
+
+        self.t = samples.t
+        self.x = samples.x
+        self.y = samples.y
+        self.theta = array('d', [math.atan2(direction * s, direction * c) for c, s in zip(samples.cos, samples.sin)])
+        self.velocity = samples.velocity
+        self.curvature = array('d', [direction * k for k in samples.curvature])
+
+    def __len__(self):
+        """Returns the number of steps"""
+        return len(self.t)
+
+class RamseteController:
+    """Nonlinear feedback on the error from the reference pose at the current time"""
+
+    def __init__(self, b=RAMSETEB, zeta=RAMSETEZETA):
+        """Constructs a RamseteController object (b > 0 like a proportional gain, 0 < zeta < 1 like damping)"""
+        if b <= 0.0 or zeta <= 0.0 or zeta >= 1.0:
+            raise ValueError("Expected b > 0 and 0 < zeta < 1, got b = {}, zeta = {}.".format(b, zeta))
+        self.b = b
+        self.zeta = zeta
+
+    def reset(self, iterator, references):
+        """Prepares to follow a trajectory"""
+        self.references = references
+
+    def calculate(self, i, x, y, theta):
+        """Returns (velocity, angular velocity) at step i from the robot pose"""
+        references = self.references
+        reference_theta = references.theta[i]
+        dx = references.x[i] - x
+        dy = references.y[i] - y
+        cos_theta = math.cos(theta)
+        sin_theta = math.sin(theta)
+        error_x = cos_theta * dx + sin_theta * dy
+        error_y = -sin_theta * dx + cos_theta * dy
+        error_theta = wrap_angle(reference_theta - theta)
+
+        velocity = references.velocity[i]
+        angular_velocity = velocity * references.curvature[i]
+        k = 2.0 * self.zeta * math.sqrt(angular_velocity * angular_velocity + self.b * velocity * velocity)
+        sinc = 1.0 - error_theta * error_theta / 6.0 if abs(error_theta) < 1E-6 else math.sin(error_theta) / error_theta
+        return (velocity * math.cos(error_theta) + k * error_x,
+            angular_velocity + k * error_theta + self.b * velocity * sinc * error_y)
+
+    def __str__(self):
+        """Returns RamseteController as a string"""
+        return "ramsete b={:g} zeta={:g}".format(self.b, self.zeta)
+
+class PurePursuitController:
+    """Drives the arc through a point lookahead distance along the path from the closest point (beyond the end, along the final heading)"""
+
+    def __init__(self, lookahead=LOOKAHEAD):
+        """Constructs a PurePursuitController object"""
+        if lookahead <= 0.0:
+            raise ValueError("Expected lookahead > 0, got {}.".format(lookahead))
+        self.lookahead = lookahead
+
+    def reset(self, iterator, references):
+        """Prepares to follow a trajectory"""
+        self.iterator = iterator
+        self.references = references
+        self.closest = None
+
+    def calculate(self, i, x, y, theta):
+        """Returns (velocity, angular velocity) at step i from the robot pose"""
+        iterator = self.iterator
+        self.closest = iterator.get_closest_index(Translation(x, y), self.closest)
+        distance = iterator.distances[self.closest] + self.lookahead
+        target = iterator.sample_distance(distance).pose
+
+        # Past the end, extend the path along its final heading so the robot doesn't turn into the last point
+        extra = max(0.0, distance - iterator.distances[-1])
+        dx = target.translation.x + extra * target.rotation.cos_angle - x
+        dy = target.translation.y + extra * target.rotation.sin_angle - y
+
+        # Curvature of the arc tangent to the robot's heading through the target
+        error_y = -math.sin(theta) * dx + math.cos(theta) * dy
+        distance2 = dx * dx + dy * dy
+        curvature = 2.0 * error_y / distance2 if distance2 > EPSILON else 0.0
+
+        velocity = self.references.velocity[i]
+        return (velocity, velocity * curvature)
+
+    def __str__(self):
+        """Returns PurePursuitController as a string"""
+        return "pure pursuit lookahead={:g}".format(self.lookahead)
+
+def create_controller(name, *gains):
+    """Returns a controller by name (ramsete or pure_pursuit) with optional gains"""
+    if name == RAMSETE:
+        return RamseteController(*gains)
+    if name == PUREPURSUIT:
+        return PurePursuitController(*gains)
+    raise ValueError("Unknown controller: {}.".format(name))
+
+class SimulationResult:
+    """Columnar record of a simulation: one array per column of COLUMNS, one value per step"""
+
+    def __init__(self, name="", controller="", simulate_time=0.0):
+        """Constructs an empty SimulationResult object"""
+        self.name = name
+        self.controller = controller
+        self.simulate_time = simulate_time
+        for column in COLUMNS:
+            setattr(self, column, array('d'))
+
+    def get_rms(self, column):
+        """Returns the root mean square of a column"""
+        values = getattr(self, column)
+        if len(values) == 0:
+            return 0.0
+        return math.sqrt(sum([v * v for v in values]) / len(values))
+
+    def get_max_abs(self, column):
+        """Returns the largest absolute value of a column"""
+        return max([abs(v) for v in getattr(self, column)], default=0.0)
+
+    def __len__(self):
+        """Returns the number of steps"""
+        return len(self.t)
+
+    def __str__(self):
+        """Returns SimulationResult as a string"""
+        return "{} ({}): rms cross track {:.3f}, max cross track {:.3f}, final error {:.3f}, {} steps, {:.3f}s".format(
+            self.name, self.controller, self.get_rms("cross_track_error"), self.get_max_abs("cross_track_error"),
+            math.hypot(self.along_track_error[-1], self.cross_track_error[-1]) if len(self) != 0 else 0.0, len(self), self.simulate_time)
+
+def simulate(trajectory, controller, rate=SIMULATIONRATE, track_width=TRACKWIDTH, max_wheel_velocity=None, initial_offset=(0.0, 0.0, 0.0)):
+    """Returns a SimulationResult of following trajectory with controller
+
+    The robot starts at the first reference pose moved by initial_offset (x, y in inches, heading in radians) and
+    is stepped at rate Hz until the trajectory's drive time. Wheel velocities are limited to max_wheel_velocity
+    """
+    if rate <= 0:
+        raise ValueError("Expected rate > 0, got {}.".format(rate))
+    result = SimulationResult(trajectory.name, controller.__str__())
+    if len(trajectory.points) == 0:
+        return result
+
+    start_time = time.perf_counter()
+    dt = 1.0 / rate
+    iterator = TrajectoryIterator(trajectory)
+    references = References(iterator, dt)
+    controller.reset(iterator, references)
+
+    x = references.x[0] + initial_offset[0]
+    y = references.y[0] + initial_offset[1]
+    theta = references.theta[0] + initial_offset[2]
+    half_track = .5 * track_width
+
+    columns = [getattr(result, column) for column in COLUMNS]
+    for i in range(len(references)):
+        velocity, angular_velocity = controller.calculate(i, x, y, theta)
+
+        # Differential drive: limit each wheel, keeping the turn direction
+        if max_wheel_velocity is not None:
+            left = limit(velocity - angular_velocity * half_track, max_wheel_velocity)
+            right = limit(velocity + angular_velocity * half_track, max_wheel_velocity)
+            velocity = .5 * (left + right)
+            angular_velocity = (right - left) / track_width
+
+        # Error in the reference frame
+        reference_theta = references.theta[i]
+        cos_reference = math.cos(reference_theta)
+        sin_reference = math.sin(reference_theta)
+        dx = x - references.x[i]
+        dy = y - references.y[i]
+        for column, value in zip(columns, (references.t[i], x, y, theta, velocity, angular_velocity,
+                cos_reference * dx + sin_reference * dy, -sin_reference * dx + cos_reference * dy, wrap_angle(theta - reference_theta))):
+            column.append(value)
+
+        # Integrate along the arc driven this step (Pose.exp)
+        distance = velocity * dt
+        dtheta = angular_velocity * dt
+        if abs(dtheta) < EPSILON:
+            s = 1.0 - 1.0 / 6.0 * dtheta * dtheta
+            c = .5 * dtheta
+        else:
+            s = math.sin(dtheta) / dtheta
+            c = (1.0 - math.cos(dtheta)) / dtheta
+        cos_theta = math.cos(theta)
+        sin_theta = math.sin(theta)
+        x += distance * (s * cos_theta - c * sin_theta)
+        y += distance * (s * sin_theta + c * cos_theta)
+        theta = wrap_angle(theta + dtheta)
+
+    result.simulate_time = time.perf_counter() - start_time
+    return result
+
+def to_simulation_item(trajectory, controller, rate=SIMULATIONRATE, initial_offset=(0.0, 0.0, 0.0)):
+    """Returns a trajectory and controller as plain data (the same lists JsonIO saves) to send to a worker process"""
+    IO = JsonIO()
+    knots = trajectory.get_knots() if trajectory.optimized else None
+    return (trajectory.name, IO.properties_to_json(trajectory), IO.points_to_json(trajectory), knots, controller, rate, initial_offset)
+
+def simulate_item(item):
+    """Worker: rebuilds the trajectory from a simulation item and returns its SimulationResult"""
+    name, properties, points, knots, controller, rate, initial_offset = item
+
+    poses = []
+    for p in points:
+        poses.append(to_pose(p[0], p[1], p[2]))
+    trajectory = Trajectory(name, poses, *properties, knots=knots)
+    return simulate(trajectory, controller, rate, initial_offset=initial_offset)
+
+def simulate_batch(trajectories, controllers, workers=None, rate=SIMULATIONRATE, initial_offset=(0.0, 0.0, 0.0)):
+    """Returns a SimulationResult for every trajectory with every controller (gain set), trajectory major
+
+    workers=1 runs in this process
+    """
+    items = [to_simulation_item(t, c, rate, initial_offset) for t in trajectories for c in controllers]
+    if workers == 1 or len(items) <= 1:
+        return [simulate_item(item) for item in items]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(simulate_item, items))
+
+def get_summary(results, total_time=None):
+    """Returns a per simulation tracking error summary of a batch as a string"""
+    lines = []
+    for r in results:
+        lines.append(r.__str__())
+
+    simulate_time = sum([r.simulate_time for r in results])
+    lines.append("{} simulations, {:.3f}s simulating".format(len(results), simulate_time))
+    if total_time is not None:
+        lines.append("{:.3f}s wall time".format(total_time))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulates following every trajectory in a saved trajectory file")
+    parser.add_argument("--path", default="Trajectory/", help="directory of the trajectory file")
+    parser.add_argument("--name", default="Saved_Trajectories.json", help="trajectory file name")
+    parser.add_argument("--controller", default=RAMSETE, help="ramsete or pure_pursuit")
+    parser.add_argument("--gains", type=float, nargs="*", default=[], help="controller gains (ramsete: b zeta, pure_pursuit: lookahead)")
+    parser.add_argument("--rate", type=float, default=SIMULATIONRATE, help="simulation rate in Hz")
+    parser.add_argument("--offset", type=float, nargs=3, default=[0.0, 0.0, 0.0], help="initial x, y (inches) and heading (radians) error")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of cores)")
+    args = parser.parse_args()
+
+    trajectories = JsonIO(args.path, args.name).load_trajectories()
+
+    start_time = time.perf_counter()
+    results = simulate_batch(trajectories, [create_controller(args.controller, *args.gains)], args.workers, args.rate, tuple(args.offset))
+    total_time = time.perf_counter() - start_time
+
+    print(get_summary(results, total_time))
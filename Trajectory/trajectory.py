@@ -12,6 +12,7 @@ https://github.com/Team254/FRC-2018-Public/blob/master/src/main/java/com/team254
 """
 
 import time
+import hashlib
 
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
@@ -21,15 +22,29 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 # F5 works because of adding Trajectory_Visualization directory to PYTHONPATH in .env file
 
 from Geometry.trajectory_point import TrajectoryPoint
+from Geometry.trajectory_points import to_trajectory_points
 from Geometry.pose import Pose
 from Geometry.rotation import from_degrees
 
-from Spline.quintic_hermite_spline import QuinticHermiteSpline, optimize_spline, create_quintic_splines
+from Spline.quintic_hermite_spline import QuinticHermiteSpline, optimize_spline, create_quintic_splines, get_collinear_knots, set_knot
+from Spline.spline_optimizer import AnytimeOptimizer, reoptimize_spline, GRADIENT_DESCENT
 
-from Trajectory.trajectory_util import parameterize_splines, time_parameterize_trajectory
+from Trajectory.trajectory_util import parameterize_splines, time_parameterize_trajectory, VelocityLimitCache
+from Trajectory.segment_cache import SegmentCache
 
 from Util.util import epsilon_equals
 
+OPTIMIZATIONPREVIEWINTERVAL = 5 # budgeted optimize_splines calls between re-parameterizing the best splines so far
+
+def get_fingerprint(poses):
+    """Returns a hash of the poses' x, y and heading: identifies the waypoints a set of knots was optimized for"""
+    values = []
+    for p in poses:
+        # Rounded so small float error from saving and loading doesn't change the fingerprint (+ 0.0 removes -0.0)
+        for v in [round(p.translation.x, 6), round(p.translation.y, 6), round(p.rotation.cos_angle, 9), round(p.rotation.sin_angle, 9)]:
+            values.append(repr(v + 0.0))
+    return hashlib.sha1(",".join(values).encode()).hexdigest()
+
 def mirror_trajectory(trajectory):
     """Returns a trajectory mirrored about y = 0"""
     poses = []
@@ -49,9 +64,20 @@ class Trajectory:
     
     update_splines = True
     optimized = False
+    optimization_complete = False # Optimized knots are final (the optimizer finished instead of stopping early)
+    optimization_result = None
+    optimizer = None
+    optimization_calls = 0
+    reparameterize_time = 0.0 # seconds of the last reparameterize_splines
+    velocity_limit_cache = None
+    incremental = True # Re-optimize only around a moved pose if already optimized
+    columnar = False # Store points as a columnar TrajectoryPoints instead of a list of TrajectoryPoints
 
-    def __init__(self, name="", poses=[], current=False, reverse=False, start_velocity=0, end_velocity=0, max_velocity=120, max_abs_acceleration=180, max_centr_acceleration=120):
-        """Constructs a Trajectory object"""
+    def __init__(self, name="", poses=[], current=False, reverse=False, start_velocity=0, end_velocity=0, max_velocity=120, max_abs_acceleration=180, max_centr_acceleration=120, knots=None, knots_complete=True):
+        """Constructs a Trajectory object (knots are optimized [ddx, ddy] at each interior pose, see get_knots)
+
+        If knots_complete is False, the knots are from an optimization that stopped early and optimize_splines resumes it
+        """
 
         self.current = current
         self.name = name
@@ -67,9 +93,15 @@ class Trajectory:
 
         self.prev_constraints = [max_velocity, max_abs_acceleration, max_centr_acceleration, start_velocity, end_velocity]
 
+        # Reuses segments whose poses (and knots) didn't change
+        self.segment_cache = SegmentCache()
+
         if len(self.poses) != 0:
             self.update_splines = True
-            self.reparameterize_splines()
+            if knots is not None:
+                self.set_knots(knots, knots_complete)
+            else:
+                self.reparameterize_splines()
 
     def reparameterize_splines(self):
         """Re-calculates and re-paramterizes splines if necessary"""
@@ -84,20 +116,29 @@ class Trajectory:
         # If valid, start timer and reparameterize splines
         start_time = time.perf_counter()
         if self.update_splines or not self.optimized:
-            self.splines = create_quintic_splines(self.poses)
+            self.splines = self.segment_cache.get_splines(self.poses)
             self.update_splines = False
 
-        self.points = parameterize_splines(self.splines)
+        self.points = self.segment_cache.parameterize_splines(self.splines)
+        if self.columnar:
+            self.points = to_trajectory_points(self.points)
+        self.velocity_limit_cache = None
 
         # Add timer to generation time
         self.generation_time += time.perf_counter() - start_time
         self.time_parameterize_splines()
+        self.reparameterize_time = time.perf_counter() - start_time
+
+    def optimize_splines(self, method=GRADIENT_DESCENT, budget=None, token=None):
+        """Optimizes splines (method is GRADIENT_DESCENT or LBFGS): returns True once optimization is finished
 
-    def optimize_splines(self):
-        """Optimizes splines"""
+        With a budget (seconds) or a CancellationToken, stops early with the best splines so far; call again to resume.
+        Budgeted calls only re-parameterize the points every OPTIMIZATIONPREVIEWINTERVAL calls (and when finished or
+        cancelled), with the time that takes reserved from the budget
+        """
 
-        if self.optimized:
-            return
+        if self.optimized and self.optimization_complete and self.optimizer is None:
+            return True
 
         pose_length_invalid = len(self.poses) == 0
         spline_length_invalid = len(self.splines) == 0
@@ -108,21 +149,74 @@ class Trajectory:
 
         # Update generation time and optimize splines
         start_time = time.perf_counter()
-        optimize_spline(self.splines)
+        if self.optimizer is None:
+            self.optimizer = AnytimeOptimizer(self.splines, method)
+            self.optimization_calls = 0
+        self.optimization_calls += 1
+        preview = budget is None or self.optimization_calls % OPTIMIZATIONPREVIEWINTERVAL == 0
+        if budget is not None and preview:
+            budget = max(0.0, budget - self.reparameterize_time)
+
+        self.optimization_result = self.optimizer.run(budget, token)
+        self.splines = self.optimizer.get_best_splines()
+
+        done = self.optimizer.is_done()
+        if done:
+            self.optimizer = None
     
         self.generation_time += time.perf_counter() - start_time
         
-        # Don't reset splines to default
+        # Don't reset splines to default (even if stopped early), but only finished knots are final
+        self.optimized = True
+        self.optimization_complete = done
+        if preview or done or (token is not None and token.is_cancelled()):
+            self.reparameterize_splines()
+        return done
+
+    def get_knots(self):
+        """Returns [ddx, ddy] at each interior pose"""
+        knots = []
+        for i in range(len(self.splines) - 1):
+            knots.append([self.splines[i].ddx1, self.splines[i].ddy1])
+        return knots
+
+    def set_knots(self, knots, complete=True):
+        """Mutator for [ddx, ddy] at each interior pose: marks splines optimized without running the optimizer
+
+        If complete is False, the knots are a starting point that optimize_splines continues from
+        """
+        if len(knots) != len(self.poses) - 2:
+            raise ValueError("Expected {} knots, got {}.".format(max(len(self.poses) - 2, 0), len(knots)))
+
+        splines = self.segment_cache.get_splines(self.poses)
+        for i in range(len(knots)):
+            splines[i].ddx1 = splines[i + 1].ddx0 = knots[i][0]
+            splines[i].ddy1 = splines[i + 1].ddy0 = knots[i][1]
+        for s in splines:
+            s.compute_coefficients()
+
+        self.splines = splines
+        self.update_splines = False
         self.optimized = True
+        self.optimization_complete = complete
+        self.optimizer = None
         self.reparameterize_splines()
-        
+
+    def get_fingerprint(self):
+        """Returns the fingerprint of the Trajectory's poses"""
+        return get_fingerprint(self.poses)
 
     def time_parameterize_splines(self):
         """Calculates the velocity, acceleration and time for each state"""
         
         # Time parameterize and add time to generation time
         start_time = time.perf_counter()
-        time_parameterize_trajectory(self.reverse, self.points, self.start_velocity, self.end_velocity, self.max_velocity, self.max_abs_acceleration, self.max_centr_acceleration)
+
+        # Geometry only terms are reused until the points change
+        if self.velocity_limit_cache is None:
+            self.velocity_limit_cache = VelocityLimitCache(self.points)
+        time_parameterize_trajectory(self.reverse, self.points, self.start_velocity, self.end_velocity, self.max_velocity, self.max_abs_acceleration, self.max_centr_acceleration,
+            self.velocity_limit_cache)
         self.generation_time += time.perf_counter() - start_time
 
         self.drive_time = self.points[len(self.points) - 1].t
@@ -157,7 +251,31 @@ class Trajectory:
         if key == "theta":
             self.poses[index].rotation = from_degrees(value)
 
-        self.reset()
+        if self.optimized and self.incremental:
+            self.reoptimize_pose(index)
+        else:
+            self.reset()
+
+    def reoptimize_pose(self, index):
+        """Rebuilds the splines next to a moved pose and re-optimizes the knots around it, keeping the other optimized knots"""
+        start_time = time.perf_counter()
+        knots = self.get_knots()
+        for i in [index - 1, index]:
+            if i >= 0 and i < len(self.splines):
+                self.splines[i] = self.segment_cache.get_spline(self.poses[i], self.poses[i + 1])
+
+        # Warm start from the previous knots (collinear knots aren't optimized, so reset them like create_quintic_splines)
+        collinear = get_collinear_knots(self.splines)
+        for i in range(max(index - 2, 0), min(index, len(knots) - 1) + 1):
+            if collinear[i]:
+                set_knot(self.splines, i, 0.0, 0.0)
+            else:
+                set_knot(self.splines, i, knots[i][0], knots[i][1])
+
+        self.optimizer = None
+        self.optimization_result = reoptimize_spline(self.splines, index)
+        self.generation_time = time.perf_counter() - start_time
+        self.reparameterize_splines()
         
 
     def trajectory_length(self):
@@ -171,6 +289,8 @@ class Trajectory:
         self.generation_time = 0.0
         self.update_splines = True
         self.optimized = False
+        self.optimization_complete = False
+        self.optimizer = None
         self.reparameterize_splines()
 
     def update_constraint(self, value, index):
@@ -184,7 +304,7 @@ class Trajectory:
             self.max_centr_acceleration = value
         elif index == 3:
             self.start_velocity = value
-        elif index == 0:
+        elif index == 4:
             self.end_velocity = value
 
         self.time_parameterize_splines()
@@ -10,8 +10,15 @@ https://github.com/Team254/FRC-2018-Public/blob/master/src/main/java/com/team254
 @date: Fall, 2020
 """
 
-from Util.util import epsilon_equals, limit2
+import math
+from array import array
+from bisect import bisect_left
+
+from Util.util import EPSILON, epsilon_equals, interpolate, limit2
 from Geometry.trajectory_point import TrajectoryPoint
+from Geometry.trajectory_points import COLUMNS, TrajectoryPoints, to_trajectory_points
+from Trajectory.trajectory_util import get_pose_twist
+from Trajectory.point_grid import PointGrid
 
 class TrajectoryIterator:
     """Class for iterating over a trajectory"""
@@ -27,13 +34,175 @@ class TrajectoryIterator:
             return self.trajectory.points[self.trajectory.trajectory_length() - 1]
         if t <= self.start_t:
             return self.trajectory.points[0]
-        for i in range(1, self.trajectory.trajectory_length()):
-            s = self.trajectory.points[i]
-            if s.t >= t:
-                prev_s = self.trajectory.points[i - 1]
-                if epsilon_equals(s.t, prev_s.t):
-                    return s
-                return prev_s.interpolate(s, (t - prev_s.t) / (s.t - prev_s.t))
+
+        i = self.find_index(t)
+        s = self.trajectory.points[i]
+        prev_s = self.trajectory.points[i - 1]
+        if epsilon_equals(self.times[i], self.times[i - 1]):
+            return s
+        return prev_s.interpolate(s, (t - self.times[i - 1]) / (self.times[i] - self.times[i - 1]))
+
+    def sample_many(self, ts):
+        """Returns TrajectoryPoints of sample(t) for every t in ts, with the same arithmetic as TrajectoryPoint.interpolate
+
+        The columns are read directly, so no TrajectoryPoint or Pose is made per sample (sorted ts search in amortized O(1))
+        """
+        rv = TrajectoryPoints()
+        if len(self.trajectory.points) == 0:
+            return rv
+        if self.columns is None:
+            points = self.trajectory.points
+            self.columns = points if isinstance(points, TrajectoryPoints) else to_trajectory_points(points)
+
+        columns = self.columns
+        xs, ys, coss, sins = columns.x, columns.y, columns.cos, columns.sin
+        curvatures, dCurvatures = columns.curvature, columns.dCurvature
+        distances, velocities, accelerations = columns.distance, columns.velocity, columns.acceleration
+        times = self.times
+        last = len(times) - 1
+        out = [getattr(rv, name) for name in COLUMNS]
+        twists = {}
+
+        for t in ts:
+            if t >= self.end_t:
+                copy = last
+            elif t <= self.start_t:
+                copy = 0
+            else:
+                i = self.find_index(t)
+                copy = i if epsilon_equals(times[i], times[i - 1]) else None
+            if copy is not None:
+                # A state like sample returns it
+                for column, name in zip(out, COLUMNS):
+                    column.append(getattr(columns, name)[copy])
+                continue
+
+            t0 = times[i - 1]
+            x = (t - t0) / (times[i] - t0)
+
+            # Constant acceleration formulas
+            v0 = velocities[i - 1]
+            a0 = accelerations[i - 1]
+            new_t = interpolate(t0, times[i], x)
+            delta_t = new_t - t0
+            reversing = v0 < 0.0 or (epsilon_equals(0.0, v0) and a0 < 0.0)
+            new_s = (-1.0 if reversing else 1.0) * (v0 * delta_t + .5 * a0 * delta_t * delta_t)
+
+            # Pose.interpolate by new_s / Pose.distance, sharing one twist per segment
+            if i not in twists:
+                twists[i] = get_pose_twist(xs[i - 1], ys[i - 1], coss[i - 1], sins[i - 1], xs[i], ys[i], coss[i], sins[i])
+            dx, dy, dtheta = twists[i]
+            pose_x = new_s / (abs(dx) if dy == 0.0 else math.hypot(dx, dy))
+            j = i - 1 if pose_x <= 0.0 else i if pose_x >= 1.0 else None
+            if j is not None:
+                out[0].append(xs[j])
+                out[1].append(ys[j])
+                out[2].append(coss[j])
+                out[3].append(sins[j])
+                out[4].append(curvatures[j])
+                out[5].append(dCurvatures[j])
+            else:
+                # self.transform(self.exp(twist.scaled(pose_x)))
+                dx, dy, dtheta = dx * pose_x, dy * pose_x, dtheta * pose_x
+                sin_theta = math.sin(dtheta)
+                cos_theta = math.cos(dtheta)
+                if abs(dtheta) < EPSILON:
+                    s = 1.0 - 1.0 / 6.0 * dtheta * dtheta
+                    c = .5 * dtheta
+                else:
+                    s = sin_theta / dtheta
+                    c = (1.0 - cos_theta) / dtheta
+                ex = dx * s - dy * c
+                ey = dx * c + dy * s
+                cos0, sin0 = coss[i - 1], sins[i - 1]
+                out[0].append(xs[i - 1] + (ex * cos0 - ey * sin0))
+                out[1].append(ys[i - 1] + (ex * sin0 + ey * cos0))
+                cos_angle = cos0 * cos_theta - sin0 * sin_theta
+                sin_angle = cos0 * sin_theta + sin0 * cos_theta
+                magnitude = math.hypot(cos_angle, sin_angle)
+                if magnitude > EPSILON:
+                    out[2].append(cos_angle / magnitude)
+                    out[3].append(sin_angle / magnitude)
+                else:
+                    out[2].append(1)
+                    out[3].append(0)
+                out[4].append(interpolate(curvatures[i - 1], curvatures[i], pose_x))
+                out[5].append(interpolate(dCurvatures[i - 1], dCurvatures[i], pose_x))
+            out[6].append(distances[i - 1] + new_s)
+            out[7].append(new_t)
+            out[8].append(v0 + a0 * delta_t)
+            out[9].append(a0)
+        return rv
+
+    def sample_distance(self, distance):
+        """Returns interpolated trajectory point at distance along the path (binary search on distance)"""
+        if len(self.trajectory.points) == 0:
+            return TrajectoryPoint()
+        distances = self.distances
+        n = len(distances)
+        if distance >= distances[n - 1]:
+            return self.trajectory.points[n - 1]
+        if distance <= distances[0]:
+            return self.trajectory.points[0]
+
+        i = bisect_left(distances, distance, 1, n)
+        s = self.trajectory.points[i]
+        prev_s = self.trajectory.points[i - 1]
+        if epsilon_equals(self.times[i], self.times[i - 1]):
+            return s
+
+        # Time to cover the distance from prev_s with constant acceleration (same sign convention as interpolate)
+        reversing = prev_s.velocity < 0.0 or (epsilon_equals(0.0, prev_s.velocity) and prev_s.acceleration < 0.0)
+        sign = -1.0 if reversing else 1.0
+        delta_s = distance - distances[i - 1]
+        v0 = sign * prev_s.velocity
+        root = v0 * v0 + 2.0 * sign * prev_s.acceleration * delta_s
+        denominator = v0 + math.sqrt(max(0.0, root))
+        if denominator > EPSILON:
+            x = 2.0 * delta_s / denominator / (self.times[i] - self.times[i - 1])
+        else:
+            x = delta_s / (distances[i] - distances[i - 1])
+        return prev_s.interpolate(s, limit2(x, 0.0, 1.0))
+
+    def get_closest_index(self, translation, hint=None):
+        """Returns the index of the trajectory point closest to a Translation
+
+        Pass the last index returned as hint to search along the path near it (amortized O(1) while following)
+        """
+        if self.grid is None:
+            points = self.trajectory.points
+            if isinstance(points, TrajectoryPoints):
+                self.grid = PointGrid(points.x, points.y)
+            else:
+                self.grid = PointGrid(array('d', [p.pose.translation.x for p in points]), array('d', [p.pose.translation.y for p in points]))
+        return self.grid.get_closest(translation.x, translation.y, hint)
+
+    def find_index(self, t):
+        """Returns the first index i >= 1 with times[i] >= t (start_t < t < end_t)
+
+        Starts from the last index found, so increasing t (playback) is amortized O(1) and random access is O(log n)
+        """
+        times = self.times
+        cursor = self.cursor
+        if times[cursor - 1] < t <= times[cursor]:
+            return cursor
+
+        if t > times[cursor]:
+            # Gallop forward from the cursor in steps of 1, 2, 4, ... then bisect the last step
+            n = len(times)
+            lo = cursor + 1
+            step = 1
+            hi = lo
+            while hi < n - 1 and times[hi] < t:
+                lo = hi + 1
+                step *= 2
+                hi = min(lo + step - 1, n - 1)
+            i = bisect_left(times, t, lo, hi + 1)
+        else:
+            i = bisect_left(times, t, 1, cursor)
+
+        self.cursor = i
+        return i
 
     def is_done(self):
         """Returns if the trajectory is done iterating"""
@@ -51,6 +220,14 @@ class TrajectoryIterator:
     
     def reset(self):
         """Resets trajectory iterator"""
+        # Time of every point, searched by sample (re-timing the trajectory requires a reset)
+        points = self.trajectory.points
+        self.times = points.t if isinstance(points, TrajectoryPoints) else array('d', [p.t for p in points])
+        self.cursor = 1
+        self.columns = None
+        self.distances = points.distance if isinstance(points, TrajectoryPoints) else array('d', [p.distance for p in points])
+        self.grid = None
+
         if not len(self.trajectory.points) == 0:
             self.start_t = self.trajectory.points[0].t
             self.end_t = self.trajectory.points[self.trajectory.trajectory_length() - 1].t
@@ -11,11 +11,14 @@ https://github.com/Team254/FRC-2018-Public/blob/master/src/main/java/com/team254
 """
 
 import math
+from array import array
+from itertools import accumulate
 
 from Geometry.pose import Pose
 from Geometry.rotation import Rotation
 from Geometry.translation import Translation
 from Geometry.trajectory_point import TrajectoryPoint
+from Geometry.trajectory_points import TrajectoryPoints
 
 from Util.util import epsilon_equals, EPSILON
 
@@ -33,12 +36,21 @@ def parameterize_spline(spline, max_dx=MAXDX, max_dy=MAXDY, max_dtheta=MAXDTHETA
     rv.append(TrajectoryPoint(spline.get_pose(0.0)))
     dt = (t1 - t0)
     for t in range(1):
-        get_segment_arc(spline, rv, t / MINSAMPLESIZE, (t + dt) / MINSAMPLESIZE, max_dx, max_dy, max_dtheta)
+        get_segment_arcs(spline, rv, t / MINSAMPLESIZE, (t + dt) / MINSAMPLESIZE, max_dx, max_dy, max_dtheta)
     return rv
 
-def parameterize_splines(splines, max_dx=MAXDX, max_dy=MAXDY, max_dtheta=MAXDTHETA):
-    """Paramaterizes a list of splines: returns a list TrajectoryPoints"""
+def parameterize_splines(splines, max_dx=MAXDX, max_dy=MAXDY, max_dtheta=MAXDTHETA, columnar=False):
+    """Paramaterizes a list of splines: returns a list TrajectoryPoints (or a columnar TrajectoryPoints)"""
     
+    if columnar:
+        rv = TrajectoryPoints()
+        if len(splines) != 0:
+            rv.append_pose(splines[0].get_pose(0.0))
+        for s in splines:
+            for t in get_segment_arc_ts(s, 0.0, 1.0, max_dx, max_dy, max_dtheta):
+                rv.append_pose(s.get_pose(t))
+        return rv
+
     rv = []
     if len(splines) == 0:
         return rv
@@ -55,7 +67,10 @@ def parameterize_splines(splines, max_dx=MAXDX, max_dy=MAXDY, max_dtheta=MAXDTHE
     
 
 def get_segment_arc(spline, points, t0, t1, max_dx, max_dy, max_dtheta):
-    """Recursively adds a TrajectoryPoint to the list if the transformation is less than the max allowable"""
+    """Recursively adds a TrajectoryPoint to the list if the transformation is less than the max allowable
+
+    Reference implementation for get_segment_arcs, which parameterize_spline uses
+    """
     p0 = spline.get_point(t0)
     p1 = spline.get_point(t1)
     r0 = spline.get_heading(t0)
@@ -73,9 +88,140 @@ def get_segment_arc(spline, points, t0, t1, max_dx, max_dy, max_dtheta):
     else:
         points.append(TrajectoryPoint(spline.get_pose(t1)))
 
-def time_parameterize_trajectory(reverse, trajectory_points, start_velocity, end_velocity, max_velocity, max_abs_acceleration, max_centr_acceleration):
-    """Time parameterizes given TrajectoryPoints"""
+def get_segment_arcs(spline, points, t0, t1, max_dx, max_dy, max_dtheta):
+    """Adds the same TrajectoryPoints as get_segment_arc without recursion"""
+    for t in get_segment_arc_ts(spline, t0, t1, max_dx, max_dy, max_dtheta):
+        points.append(TrajectoryPoint(spline.get_pose(t)))
+
+def get_segment_arc_ts(spline, t0, t1, max_dx, max_dy, max_dtheta):
+    """Returns the sorted t of each point get_segment_arc would add
+
+    Subdivides a whole frontier of intervals per pass, evaluating each new endpoint once
+    """
+    samples = get_arc_samples(spline, [t0, t1])
+    frontier = [(t0, t1)]
+    accepted = []
+    while len(frontier) != 0:
+        midpoints = [(a + b) / 2.0 for a, b in frontier]
+        new_ts = []
+        next_frontier = []
+        for (a, b), m in zip(frontier, midpoints):
+            # Halving can't make progress once the interval is a single float (the recursion would overflow)
+            if is_segment_arc_small(samples[a], samples[b], max_dx, max_dy, max_dtheta) or not (a < m < b):
+                accepted.append(b)
+            else:
+                new_ts.append(m)
+                next_frontier.append((a, m))
+                next_frontier.append((m, b))
+        samples.update(get_arc_samples(spline, new_ts))
+        frontier = next_frontier
+
+    # Accepted intervals partition [t0, t1], so sorting their ends gives the depth first order
+    accepted.sort()
+    return accepted
+
+def get_arc_samples(spline, ts):
+    """Returns a dict of t: (x, y, cos, sin) matching spline.get_point(t) and spline.get_heading(t)"""
+    Ax, Bx, Cx, Dx, Ex, Fx = spline.Ax, spline.Bx, spline.Cx, spline.Dx, spline.Ex, spline.Fx
+    Ay, By, Cy, Dy, Ey, Fy = spline.Ay, spline.By, spline.Cy, spline.Dy, spline.Ey, spline.Fy
+    dAx, dBx, dCx, dDx, dEx = spline.dx_coefficients
+    dAy, dBy, dCy, dDy, dEy = spline.dy_coefficients
+
+    samples = {}
+    for t in ts:
+        x = ((((Ax * t + Bx) * t + Cx) * t + Dx) * t + Ex) * t + Fx
+        y = ((((Ay * t + By) * t + Cy) * t + Dy) * t + Ey) * t + Fy
+        dx = (((dAx * t + dBx) * t + dCx) * t + dDx) * t + dEx
+        dy = (((dAy * t + dBy) * t + dCy) * t + dDy) * t + dEy
+
+        # Normalized like Rotation(dx, dy, True)
+        magnitude = math.hypot(dx, dy)
+        if magnitude > EPSILON:
+            samples[t] = (x, y, dx / magnitude, dy / magnitude)
+        else:
+            samples[t] = (x, y, 1, 0)
+    return samples
+
+def is_segment_arc_small(sample0, sample1, max_dx, max_dy, max_dtheta):
+    """Returns whether the twist between two arc samples is within the max allowable (the get_segment_arc test, inlined)"""
+    x0, y0, cos0, sin0 = sample0
+    x1, y1, cos1, sin1 = sample1
+
+    # Translation(p1 - p0).rotate(r0.inverse()) and r1.rotate(r0.inverse())
+    inverse_sin0 = -sin0
+    dx = x1 - x0
+    dy = y1 - y0
+    tx = dx * cos0 - dy * inverse_sin0
+    ty = dx * inverse_sin0 + dy * cos0
+    cos_angle = cos1 * cos0 - sin1 * inverse_sin0
+    sin_angle = cos1 * inverse_sin0 + sin1 * cos0
+    magnitude = math.hypot(cos_angle, sin_angle)
+    if magnitude > EPSILON:
+        cos_angle, sin_angle = cos_angle / magnitude, sin_angle / magnitude
+    else:
+        cos_angle, sin_angle = 1, 0
+
+    # Pose().log(transformation)
+    dtheta = math.atan2(sin_angle, cos_angle)
+    half_dtheta = .5 * dtheta
+    cos_minus_one = cos_angle - 1.0
+    if abs(cos_minus_one) < EPSILON:
+        halfdtheta_by_tan_halfdtheta = 1.0 - 1.0 / 12.0 * dtheta * dtheta
+    else:
+        halfdtheta_by_tan_halfdtheta = -(half_dtheta * sin_angle) / cos_minus_one
+    twist_dx = tx * halfdtheta_by_tan_halfdtheta - ty * -half_dtheta
+    twist_dy = tx * -half_dtheta + ty * halfdtheta_by_tan_halfdtheta
+
+    dtheta -= math.copysign(math.pi, dtheta) if abs(dtheta) > (math.pi / 2) else 0
+    return not (abs(twist_dy) > max_dy or abs(twist_dx) > max_dx or abs(dtheta) > max_dtheta)
+
+def time_parameterize_trajectory(reverse, trajectory_points, start_velocity, end_velocity, max_velocity, max_abs_acceleration, max_centr_acceleration, limit_cache=None):
+    """Time parameterizes given TrajectoryPoints (a list or a columnar TrajectoryPoints) with time_parameterize_arrays
+
+    limit_cache is an optional VelocityLimitCache of the same points, which skips the geometry only work (and re-times
+    only the changed states if just the start or end velocity changed)
+    """
     
+    if limit_cache is not None:
+        timing = limit_cache.get_timing(reverse, start_velocity, end_velocity, max_velocity, max_abs_acceleration, max_centr_acceleration)
+    else:
+        xs, ys, coss, sins, curvatures = get_pose_columns(trajectory_points)
+        timing = time_parameterize_arrays(reverse, xs, ys, coss, sins, curvatures,
+            start_velocity, end_velocity, max_velocity, max_abs_acceleration, max_centr_acceleration)
+    set_timing(trajectory_points, timing, max_abs_acceleration)
+
+def get_pose_columns(trajectory_points):
+    """Returns (x, y, cos, sin, curvature) sequences of a list of TrajectoryPoints or a TrajectoryPoints"""
+    if isinstance(trajectory_points, TrajectoryPoints):
+        return trajectory_points.x, trajectory_points.y, trajectory_points.cos, trajectory_points.sin, trajectory_points.curvature
+
+    poses = [p.pose for p in trajectory_points]
+    return ([p.translation.x for p in poses], [p.translation.y for p in poses],
+        [p.rotation.cos_angle for p in poses], [p.rotation.sin_angle for p in poses], [p.curvature for p in poses])
+
+def set_timing(trajectory_points, timing, max_abs_acceleration):
+    """Writes (distance, t, velocity, acceleration) arrays to a list of TrajectoryPoints or a TrajectoryPoints"""
+    distances, times, velocities, accelerations = timing
+    if isinstance(trajectory_points, TrajectoryPoints):
+        trajectory_points.distance, trajectory_points.t, trajectory_points.velocity, trajectory_points.acceleration = distances, times, velocities, accelerations
+        return
+
+    for i, state in enumerate(trajectory_points):
+        state.distance = distances[i]
+        state.t = times[i]
+        state.velocity = velocities[i]
+        state.acceleration = accelerations[i]
+        state.min_acceleration = -max_abs_acceleration
+        state.max_acceleration = max_abs_acceleration
+        state.index_floor = i
+        state.index_ceil = i
+
+def time_parameterize_states(reverse, trajectory_points, start_velocity, end_velocity, max_velocity, max_abs_acceleration, max_centr_acceleration):
+    """Time parameterizes a list of TrajectoryPoints one object at a time
+
+    Reference implementation for time_parameterize_arrays
+    """
+
     # Forward pass
     predecessor = trajectory_points[0]
     predecessor.distance = 0.0
@@ -151,6 +297,271 @@ def time_parameterize_trajectory(reverse, trajectory_points, start_velocity, end
         state.index_floor = i
         state.index_ceil = i
 
+def time_parameterize_arrays(reverse, xs, ys, coss, sins, curvatures, start_velocity, end_velocity, max_velocity, max_abs_acceleration, max_centr_acceleration):
+    """Returns (distance, t, velocity, acceleration) arrays for states given as flat x, y, cos, sin and curvature sequences
+
+    Same passes and arithmetic as time_parameterize_states: the distances and curvature velocity limits don't depend on
+    each other, so only the forward, backward and integration recurrences loop over states
+    """
+    return time_parameterize_steps(reverse, get_pose_distances(xs, ys, coss, sins), get_max_velocities(curvatures, max_velocity, max_centr_acceleration),
+        start_velocity, end_velocity, max_velocity, max_abs_acceleration)
+
+def time_parameterize_steps(reverse, steps, limits, start_velocity, end_velocity, max_velocity, max_abs_acceleration):
+    """Returns (distance, t, velocity, acceleration) arrays from the distance between consecutive states and each state's velocity limit"""
+    return TimingProfile(steps, limits, start_velocity, end_velocity, max_velocity, max_abs_acceleration).get_timing(reverse)
+
+class TimingProfile:
+    """Forward, backward and integration pass results of one time parameterization (unsigned)
+
+    Keeps them so a new start or end velocity only recomputes states until the new profile merges with the old one.
+    The recurrences run over plain lists with min() unrolled into comparisons (same ties as min)
+    """
+
+    def __init__(self, steps, limits, start_velocity, end_velocity, max_velocity, max_abs_acceleration):
+        """Constructs a TimingProfile and runs every pass"""
+        self.steps = steps
+        self.limits = limits
+        self.max_velocity = max_velocity
+        self.max_abs_acceleration = max_abs_acceleration
+        self.start_velocity = start_velocity
+        self.end_velocity = end_velocity
+        self.n = n = len(limits)
+
+        self.distances = list(accumulate(steps, initial=0.0))
+        self.forward_velocities = [start_velocity] * n
+        self.run_forward_pass(1, False)
+
+        # Backwards pass (the end velocity replaces the forward velocity of the last state)
+        self.velocities = list(self.forward_velocities)
+        self.velocities[n - 1] = end_velocity
+        self.run_backward_pass(n - 2, False)
+
+        self.dts = [0.0] * n
+        self.accelerations = [0.0] * n
+        self.integrate(1, n - 1)
+        self.times = list(accumulate(self.dts))
+
+    def matches(self, limits, max_velocity, max_abs_acceleration):
+        """Returns whether the profile was computed for these limits (the same list) and constraints"""
+        return self.limits is limits and self.max_velocity == max_velocity and self.max_abs_acceleration == max_abs_acceleration
+
+    def update(self, start_velocity, end_velocity):
+        """Re-times the profile for new boundary velocities, only recomputing the states that change"""
+        first = self.n
+        if start_velocity != self.start_velocity:
+            first = self.set_start_velocity(start_velocity)
+        if end_velocity != self.end_velocity:
+            first = min(first, self.set_end_velocity(end_velocity))
+
+        # Times after the changed states are shifted, so re-integrate them
+        if first < self.n:
+            self.times[first:] = list(accumulate(self.dts[first:], initial=self.times[first - 1]))[1:] if first > 0 else list(accumulate(self.dts))
+
+    def set_start_velocity(self, start_velocity):
+        """Sets the start velocity: returns the first state whose time changed"""
+        n = self.n
+        self.start_velocity = start_velocity
+        self.forward_velocities[0] = start_velocity
+        if n == 1:
+            return n
+
+        # Forward velocities change until they merge at k, so the backward pass only changes before k
+        k = self.run_forward_pass(1, True)
+        self.velocities[0] = start_velocity
+        self.run_backward_pass(min(k - 1, n - 2), False)
+        self.integrate(1, min(k, n - 1))
+        return 1
+
+    def set_end_velocity(self, end_velocity):
+        """Sets the end velocity: returns the first state whose time changed"""
+        n = self.n
+        self.end_velocity = end_velocity
+        self.velocities[n - 1] = end_velocity
+        if n == 1:
+            return n
+
+        # Backward velocities change down to where they merge at m
+        m = self.run_backward_pass(n - 2, True)
+        self.integrate(m + 1, n - 1)
+        return m + 1
+
+    def run_forward_pass(self, first, merge):
+        """Recomputes forward velocities from first: returns the index where they merged with the old ones (if merge) or n"""
+        steps, limits, velocities = self.steps, self.limits, self.forward_velocities
+        max_velocity = self.max_velocity
+        two_acceleration = 2.0 * self.max_abs_acceleration
+        sqrt = math.sqrt
+
+        v = velocities[first - 1]
+        for i in range(first, self.n):
+            # Enforce global max velocity and reachable velocity by acceleration limit, then the velocity constraints
+            reachable = sqrt(v * v + two_acceleration * steps[i - 1])
+            v = reachable if reachable < max_velocity else max_velocity
+            limit = limits[i]
+            if not v < limit:
+                v = limit
+            if merge and v == velocities[i]:
+                return i
+            velocities[i] = v
+        return self.n
+
+    def run_backward_pass(self, last, merge):
+        """Recomputes velocities from last down to 1: returns the index where they merged with the old ones (if merge) or 0"""
+        distances, forward_velocities, velocities = self.distances, self.forward_velocities, self.velocities
+        two_min_acceleration = 2.0 * -self.max_abs_acceleration
+        sqrt = math.sqrt
+
+        successor_v = velocities[last + 1]
+        for i in range(last, 0, -1):
+            # calculate new max velocity (will only lower the velocity)
+            new_max_velocity = sqrt(successor_v * successor_v + two_min_acceleration * (distances[i] - distances[i + 1]))
+            v = forward_velocities[i]
+            if new_max_velocity < v:
+                v = new_max_velocity
+            if merge and v == velocities[i]:
+                return i
+            velocities[i] = v
+            successor_v = v
+        return 0
+
+    def integrate(self, first, last):
+        """Recomputes the acceleration and time step into each state from first to last"""
+        distances, velocities, dts, accelerations = self.distances, self.velocities, self.dts, self.accelerations
+        for i in range(first, last + 1):
+            v = velocities[i - 1]
+            state_v = velocities[i]
+            ds = distances[i] - distances[i - 1]
+            accel = (state_v * state_v - v * v) / (2.0 * ds)
+            dt = 0.0
+            if (abs(accel) > EPSILON):
+                dt = (state_v - v) / accel
+            elif (abs(v) > EPSILON):
+                dt = ds / v
+            dts[i] = dt
+            accelerations[i] = accel
+
+    def get_timing(self, reverse):
+        """Returns (distance, t, velocity, acceleration) arrays, negated if reverse
+
+        Each state takes the acceleration into the next state (the last state keeps its own)
+        """
+        accelerations = self.accelerations[1:] + self.accelerations[-1:] if self.n > 1 else [0.0]
+        if reverse:
+            return (array('d', self.distances), array('d', self.times), array('d', [-v for v in self.velocities]),
+                array('d', [-a for a in accelerations]))
+        return array('d', self.distances), array('d', self.times), array('d', self.velocities), array('d', accelerations)
+
+def get_pose_distances(xs, ys, coss, sins):
+    """Returns a list of Pose.distance between each consecutive pair of states, with the same arithmetic"""
+    distances = []
+
+    # Like state.pose.distance(predecessor.pose): pose 0 is the later state
+    for x0, y0, cos0, sin0, x1, y1, cos1, sin1 in zip(xs[1:], ys[1:], coss[1:], sins[1:], xs, ys, coss, sins):
+        dx, dy, dtheta = get_pose_twist(x0, y0, cos0, sin0, x1, y1, cos1, sin1)
+        distances.append(abs(dx) if dy == 0.0 else math.hypot(dx, dy))
+    return distances
+
+def get_pose_twist(x0, y0, cos0, sin0, x1, y1, cos1, sin1):
+    """Returns (dx, dy, dtheta) of pose0.log(pose0.inverse().transform(pose1)), with the same arithmetic"""
+
+    # self.inverse().transform(other)
+    inverse_sin0 = -sin0
+    inverse_x = -x0 * cos0 - -y0 * inverse_sin0
+    inverse_y = -x0 * inverse_sin0 + -y0 * cos0
+    tx = inverse_x + (x1 * cos0 - y1 * inverse_sin0)
+    ty = inverse_y + (x1 * inverse_sin0 + y1 * cos0)
+    cos_angle = cos0 * cos1 - inverse_sin0 * sin1
+    sin_angle = cos0 * sin1 + inverse_sin0 * cos1
+    magnitude = math.hypot(cos_angle, sin_angle)
+    if magnitude > EPSILON:
+        cos_angle, sin_angle = cos_angle / magnitude, sin_angle / magnitude
+    else:
+        cos_angle, sin_angle = 1, 0
+
+    # self.log(transform)
+    dtheta = math.atan2(sin_angle, cos_angle)
+    half_dtheta = .5 * dtheta
+    cos_minus_one = cos_angle - 1.0
+    if abs(cos_minus_one) < EPSILON:
+        halfdtheta_by_tan_halfdtheta = 1.0 - 1.0 / 12.0 * dtheta * dtheta
+    else:
+        halfdtheta_by_tan_halfdtheta = -(half_dtheta * sin_angle) / cos_minus_one
+    return (tx * halfdtheta_by_tan_halfdtheta - ty * -half_dtheta, tx * -half_dtheta + ty * halfdtheta_by_tan_halfdtheta, dtheta)
+
+def get_max_velocities(curvatures, max_velocity, max_centr_accel):
+    """Returns a list of get_max_velocity for each curvature"""
+    return [min(a, b) for a, b in zip(get_max_drivetrain_velocities(curvatures, max_velocity), get_max_centripetal_velocities(get_abs_curvatures(curvatures), max_centr_accel))]
+
+def get_max_drivetrain_velocities(curvatures, max_velocity):
+    """Returns a list of get_max_drivetrain_velocity for each curvature (inlined)"""
+    limits = []
+    for k in curvatures:
+        # Going straight: epsilon_equals(k, 0.0)
+        if k - EPSILON <= 0.0 and k + EPSILON >= 0.0:
+            limits.append(max_velocity)
+        # Turning in place
+        elif math.isinf(k):
+            limits.append(0.0)
+        else:
+            right_left_max = max_velocity * (k + 1) / (1.0 - k)
+            if abs(right_left_max) <= max_velocity:
+                limits.append((max_velocity + right_left_max) / 2.0)
+            else:
+                limits.append((max_velocity + max_velocity * (1 - k) / (1.0 + k)) / 2.0)
+    return limits
+
+def get_abs_curvatures(curvatures):
+    """Returns a list of abs(curvature), or None for going straight, to scale by get_max_centripetal_velocities"""
+    return [None if k - EPSILON <= 0.0 and k + EPSILON >= 0.0 else abs(k) for k in curvatures]
+
+def get_max_centripetal_velocities(abs_curvatures, max_centr_accel):
+    """Returns a list of get_max_centripetal_velocity for each curvature from get_abs_curvatures"""
+    max_centr_accel = abs(max_centr_accel)
+    return [1e4 if k is None else math.sqrt(max_centr_accel / k) for k in abs_curvatures]
+
+class VelocityLimitCache:
+    """Geometry only terms of time parameterization for one set of points: the distance between states and the
+    velocity limits from curvature, keyed by the constraints they depend on (and the last TimingProfile)"""
+
+    def __init__(self, trajectory_points):
+        """Constructs a VelocityLimitCache from a list of TrajectoryPoints or a TrajectoryPoints"""
+        xs, ys, coss, sins, curvatures = get_pose_columns(trajectory_points)
+        self.curvatures = curvatures
+        self.abs_curvatures = get_abs_curvatures(curvatures)
+        self.steps = get_pose_distances(xs, ys, coss, sins)
+
+        self.drivetrain_key = self.drivetrain = None
+        self.centripetal_key = self.centripetal = None
+        self.limits_key = self.limits = None
+        self.misses = 0
+        self.profile = None
+
+    def get_limits(self, max_velocity, max_centr_acceleration):
+        """Returns a list of get_max_velocity for each state, only recomputing the terms whose constraint changed"""
+        if self.limits_key == (max_velocity, max_centr_acceleration):
+            return self.limits
+
+        self.misses += 1
+        if self.drivetrain_key != max_velocity:
+            self.drivetrain_key = max_velocity
+            self.drivetrain = get_max_drivetrain_velocities(self.curvatures, max_velocity)
+        if self.centripetal_key != max_centr_acceleration:
+            self.centripetal_key = max_centr_acceleration
+            self.centripetal = get_max_centripetal_velocities(self.abs_curvatures, max_centr_acceleration)
+
+        self.limits_key = (max_velocity, max_centr_acceleration)
+        self.limits = [min(a, b) for a, b in zip(self.drivetrain, self.centripetal)]
+        return self.limits
+
+    def get_timing(self, reverse, start_velocity, end_velocity, max_velocity, max_abs_acceleration, max_centr_acceleration):
+        """Returns (distance, t, velocity, acceleration) arrays like time_parameterize_arrays, updating the last TimingProfile if only the start or end velocity changed"""
+        limits = self.get_limits(max_velocity, max_centr_acceleration)
+        if self.profile is not None and self.profile.matches(limits, max_velocity, max_abs_acceleration):
+            self.profile.update(start_velocity, end_velocity)
+        else:
+            self.profile = TimingProfile(self.steps, limits, start_velocity, end_velocity, max_velocity, max_abs_acceleration)
+        return self.profile.get_timing(reverse)
+
 def get_max_velocity(trajectory_point, max_velocity, max_centr_accel):
     """Returns the max velocity for a given trajectory state"""
     return min(get_max_drivetrain_velocity(trajectory_point, max_velocity), get_max_centripetal_velocity(trajectory_point, max_centr_accel))
@@ -17,7 +17,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 # Uncomment top line if you want to use the run button in the top right
 # F5 works because of adding Trajectory_Visualization directory to PYTHONPATH in .env file
 
-from Trajectory.trajectory import Trajectory
+from Trajectory.trajectory import Trajectory, get_fingerprint
 from Geometry.pose import Pose, to_pose
 
 class JsonIO:
@@ -42,7 +42,9 @@ class JsonIO:
         # Structure:
         # "{"Name1": [
         #       [reverse, start_velocity, end_velocity, max_velocity, max_abs_acceleration, max_centr_acceleration],
-        #       [[p1x, p1y, p1theta], [p2x, p2y, p2theta], ... ]
+        #       [[p1x, p1y, p1theta], [p2x, p2y, p2theta], ... ],
+        #       {"fingerprint": "...", "knots": [[ddx, ddy], ...], "complete": bool} (optional: only if optimized,
+        #       complete is False if the optimization stopped early)
         #       ],
         #   "Name2": [...], 
         # }"
@@ -55,7 +57,14 @@ class JsonIO:
             for p in tmp_poses:
                 poses.append(to_pose(p[0], p[1], p[2]))
 
-            trajectories.append(Trajectory(name, poses, tmp_props[0], tmp_props[1], tmp_props[2], tmp_props[3], tmp_props[4], tmp_props[5], tmp_props[6]))
+            # Restore optimized splines only if they were saved for these poses
+            knots = None
+            complete = True
+            if len(data[name]) > 2 and data[name][2].get("fingerprint") == get_fingerprint(poses) and len(data[name][2].get("knots", [])) == len(poses) - 2:
+                knots = data[name][2]["knots"]
+                complete = data[name][2].get("complete", True)
+
+            trajectories.append(Trajectory(name, poses, tmp_props[0], tmp_props[1], tmp_props[2], tmp_props[3], tmp_props[4], tmp_props[5], tmp_props[6], knots, complete))
         
         return trajectories
 
@@ -64,6 +73,8 @@ class JsonIO:
         data = {}
         for trajectory in trajectories:
             data[trajectory.name] = [self.properties_to_json(trajectory), self.points_to_json(trajectory)]
+            if trajectory.optimized:
+                data[trajectory.name].append(self.knots_to_json(trajectory))
         try:
             with open(self.file_name, "w") as f:
                 json.dump(data, f, indent=4, sort_keys=True)
@@ -88,6 +99,10 @@ class JsonIO:
 
         return data
 
+    def knots_to_json(self, trajectory):
+        """Helper method to convert optimized Trajectory knots (and if they are final) and the fingerprint of their poses to a dict"""
+        return {"fingerprint": trajectory.get_fingerprint(), "knots": trajectory.get_knots(), "complete": trajectory.optimization_complete}
+
 if __name__ == "__main__":
     poses = []
     poses.append(to_pose())